@@ -0,0 +1,261 @@
+# anomaly_detection.py
+import atexit
+import math
+import threading
+import time
+import traceback
+
+import numpy as np
+from pymongo import UpdateOne
+
+from models import get_anomaly_state_collection, get_anomaly_alert_collection, get_schedule_collection
+from schedule_queries import UNASSIGNED
+
+# EWMA cepat mengikuti level terkini, EWMA lambat sebagai baseline jangka
+# panjang. Variansi error prediksi satu langkah (nilai - EWMA cepat) dipakai
+# sebagai skala noise; tidak ikut melebar saat terjadi drift.
+FAST_ALPHA = 0.2
+SLOW_ALPHA = 0.02
+# Baseline lambat butuh sekitar 2 / SLOW_ALPHA pembacaan untuk konvergen
+WARMUP_READINGS = 100
+SPIKE_Z = 4.5
+DRIFT_Z = 4.0
+ALERT_COOLDOWN_SECONDS = 24 * 60 * 60
+PERSIST_INTERVAL_SECONDS = 60
+MIN_STD = 1e-6
+
+_INITIAL_CAPACITY = 1024
+_FAST_MEAN_STD_RATIO = math.sqrt(FAST_ALPHA / (2 - FAST_ALPHA))
+_STATE_FIELDS = ("fast_mean", "slow_mean", "error_var", "count", "last_alert")
+
+
+class StreamingAnomalyDetector:
+    """Detektor anomali online dengan state O(1) per (aset, metrik).
+
+    State disimpan dalam array NumPy (satu slot per seri) sehingga ribuan aset
+    tetap ringkas di memori. Tidak ada query database per pembacaan: state
+    dimuat sekali saat pertama dipakai dan disimpan berkala (hanya slot yang
+    berubah).
+
+    Setiap worker punya detektor sendiri. Saat persist, state lokal digabung
+    dengan state tersimpan (rata-rata berbobot jumlah pembacaan sejak sinkron
+    terakhir, lihat _merge_update) lalu hasil gabungan dimuat kembali, sehingga
+    baseline antar worker tidak saling menimpa."""
+
+    def __init__(self, capacity=_INITIAL_CAPACITY):
+        self._lock = threading.Lock()
+        self._slots = {}
+        self._keys = []
+        self._state = {
+            "fast_mean": np.zeros(capacity),
+            "slow_mean": np.zeros(capacity),
+            "error_var": np.zeros(capacity),
+            "count": np.zeros(capacity, dtype=np.int64),
+            "last_alert": np.zeros(capacity, dtype=np.int64),
+            # `count` saat terakhir sinkron dengan MongoDB (tidak disimpan)
+            "synced_count": np.zeros(capacity, dtype=np.int64)
+        }
+        self._dirty = set()
+        self._loaded = False
+        self._last_persist = time.time()
+
+    def _slot(self, key):
+        slot = self._slots.get(key)
+        if slot is None:
+            slot = len(self._keys)
+            capacity = self._state["count"].size
+            if slot >= capacity:
+                for field, old in self._state.items():
+                    grown = np.zeros(capacity * 2, dtype=old.dtype)
+                    grown[:capacity] = old
+                    self._state[field] = grown
+            self._slots[key] = slot
+            self._keys.append(key)
+        return slot
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        self._loaded = True
+        state_collection = get_anomaly_state_collection()
+        if state_collection is None:
+            return
+        for doc in state_collection.find({}):
+            slot = self._slot((doc['asset_name'], doc['metric']))
+            self._apply_stored(slot, doc)
+
+    def _apply_stored(self, slot, doc):
+        for field in _STATE_FIELDS:
+            self._state[field][slot] = doc.get(field, 0)
+        self._state["synced_count"][slot] = doc.get("count", 0)
+
+    def observe(self, asset_name, metric, value, timestamp=None):
+        """Memproses satu pembacaan; mengembalikan dict alert atau None."""
+        timestamp = int(timestamp or time.time())
+        value = float(value)
+        alert = None
+
+        with self._lock:
+            self._ensure_loaded()
+            slot = self._slot((asset_name, metric))
+            state = self._state
+            count = int(state["count"][slot])
+
+            if count == 0:
+                state["fast_mean"][slot] = state["slow_mean"][slot] = value
+                state["error_var"][slot] = 0.0
+            else:
+                fast_mean = float(state["fast_mean"][slot])
+                slow_mean = float(state["slow_mean"][slot])
+                error_var = float(state["error_var"][slot])
+
+                error = value - fast_mean
+                noise_std = max(math.sqrt(error_var), MIN_STD)
+                z_score = error / noise_std
+
+                fast_mean += FAST_ALPHA * error
+                slow_mean += SLOW_ALPHA * (value - slow_mean)
+                error_var += SLOW_ALPHA * (error * error - error_var)
+
+                state["fast_mean"][slot] = fast_mean
+                state["slow_mean"][slot] = slow_mean
+                state["error_var"][slot] = error_var
+
+                in_cooldown = timestamp - int(state["last_alert"][slot]) < ALERT_COOLDOWN_SECONDS
+                if count >= WARMUP_READINGS and not in_cooldown:
+                    drift = (fast_mean - slow_mean) / (noise_std * _FAST_MEAN_STD_RATIO)
+                    if abs(z_score) >= SPIKE_Z:
+                        alert = {"anomaly_type": "Spike", "score": round(z_score, 2), "baseline": round(slow_mean, 4)}
+                    elif abs(drift) >= DRIFT_Z:
+                        alert = {"anomaly_type": "Drift", "score": round(drift, 2), "baseline": round(slow_mean, 4)}
+                    if alert:
+                        state["last_alert"][slot] = timestamp
+
+            state["count"][slot] = count + 1
+            self._dirty.add(slot)
+
+            should_persist = time.time() - self._last_persist >= PERSIST_INTERVAL_SECONDS
+
+        if should_persist:
+            # Pembacaan sudah tersimpan oleh pemanggil; gagal simpan state
+            # tidak boleh menggagalkan request (slot tetap dirty)
+            try:
+                self.persist()
+            except Exception:
+                traceback.print_exc()
+
+        if alert:
+            alert.update({
+                "asset_name": asset_name,
+                "metric": metric,
+                "value": value,
+                "timestamp": timestamp
+            })
+        return alert
+
+    def _merge_update(self, slot, now):
+        """Update pipeline: gabungkan state lokal slot dengan state tersimpan.
+
+        Pembacaan yang disimpan worker lain sejak sinkron terakhir (`count`
+        tersimpan - synced_count) dan pembacaan lokal baru masing-masing
+        menjadi bobot rata-rata EWMA dan variansi; count dijumlahkan."""
+        asset_name, metric = self._keys[slot]
+        local = {field: self._state[field][slot].item() for field in _STATE_FIELDS}
+        local_new = local["count"] - self._state["synced_count"][slot].item()
+        others = {"$max": [{"$subtract": [{"$ifNull": ["$count", 0]}, self._state["synced_count"][slot].item()]}, 0]}
+
+        def weighted(field):
+            return {"$cond": [
+                {"$gt": ["$_others", 0]},
+                {"$divide": [{"$add": [{"$multiply": [{"$ifNull": [f"${field}", 0]}, "$_others"]}, local[field] * local_new]},
+                             {"$add": ["$_others", local_new]}]},
+                local[field]
+            ]}
+
+        return UpdateOne({"asset_name": asset_name, "metric": metric}, [
+            {"$set": {"_others": others}},
+            {"$set": {
+                "fast_mean": weighted("fast_mean"),
+                "slow_mean": weighted("slow_mean"),
+                "error_var": weighted("error_var"),
+                "count": {"$add": [{"$ifNull": ["$count", 0]}, local_new]},
+                "last_alert": {"$max": [{"$ifNull": ["$last_alert", 0]}, local["last_alert"]]},
+                "updated_at": now
+            }},
+            {"$unset": "_others"}
+        ], upsert=True)
+
+    def persist(self):
+        """Menggabungkan slot yang berubah ke MongoDB (satu bulk_write) dan memuat hasilnya.
+
+        Lock dipegang selama persist agar pembacaan baru tidak tertimpa state
+        gabungan; bila gagal, slot tetap dirty untuk persist berikutnya."""
+        state_collection = get_anomaly_state_collection()
+        with self._lock:
+            self._last_persist = time.time()
+            if not self._dirty or state_collection is None:
+                return
+            dirty = sorted(self._dirty)
+            now = int(self._last_persist)
+            state_collection.bulk_write([self._merge_update(slot, now) for slot in dirty], ordered=False)
+            self._dirty.difference_update(dirty)
+            # Pembacaan lokal sudah tergabung; bila pemuatan di bawah gagal,
+            # persist berikutnya tetap menghitung bobot worker lain dengan benar
+            for slot in dirty:
+                self._state["synced_count"][slot] = self._state["count"][slot]
+
+            keys = {self._keys[slot]: slot for slot in dirty}
+            for doc in state_collection.find({"asset_name": {"$in": sorted({asset for asset, _ in keys})}}):
+                slot = keys.get((doc['asset_name'], doc['metric']))
+                if slot is not None:
+                    self._apply_stored(slot, doc)
+
+
+detector = StreamingAnomalyDetector()
+
+
+def _persist_at_exit():
+    try:
+        detector.persist()
+    except Exception:
+        traceback.print_exc()
+
+
+atexit.register(_persist_at_exit)
+
+
+def record_anomaly_alert(alert, created_by):
+    """Menyimpan alert anomali dan membuat jadwal inspeksi di maintenance_schedule."""
+    now = int(time.time())
+    priority = "Tinggi" if alert['anomaly_type'] == "Spike" else "Sedang"
+
+    alert_data = dict(alert, status="Aktif", created_by=created_by, created_at=now)
+    result = get_anomaly_alert_collection().insert_one(alert_data)
+    alert_id = str(result.inserted_id)
+
+    schedule_data = {
+        "asset_name": alert['asset_name'],
+        "type": "Predictive",
+        "description": (
+            f"Inspeksi anomali {alert['anomaly_type'].lower()} pada {alert['metric']}: "
+            f"nilai {alert['value']} (baseline {alert['baseline']}, skor {alert['score']})"
+        ),
+        "scheduled_date": now + (24 * 60 * 60) if priority == "Sedang" else now,
+        "duration": 60,
+        "priority": priority,
+        "status": "Dijadwalkan",
+        "assigned_to": "",
+        "assignee": UNASSIGNED,
+        "created_by": created_by,
+        "created_at": now,
+        "notes": "",
+        "completed_by": "",
+        "completed_at": None,
+        "anomaly_alert_id": alert_id
+    }
+    schedule_result = get_schedule_collection().insert_one(schedule_data)
+    get_anomaly_alert_collection().update_one(
+        {"_id": result.inserted_id},
+        {"$set": {"schedule_id": str(schedule_result.inserted_id)}}
+    )
+    return alert_id
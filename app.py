@@ -10,6 +10,40 @@ import json
 import math
 from werkzeug.utils import secure_filename
 from models import get_user_collection, get_asset_collection, get_wo_collection, get_inventory_collection, get_schedule_collection, register_new_user
+from models import get_energy_collection, get_maintenance_costs_collection, get_maintenance_budget_collection
+from models import get_anomaly_alert_collection, get_oee_snapshot_collection, get_predictive_collection
+from models import get_component_rul_collection, get_capacity_simulation_collection, get_pm_plan_collection
+from energy_analytics import compute_energy_statistics, summarize_energy
+from cold_archive import load_energy_span, get_archived_until, read_archived_costs
+from cost_analytics import aggregate_costs, merge_cost_breakdowns, budget_vs_actual, quarter_bounds
+from cost_ledger import record_cost_in_ledger, get_ledger_report
+from oee_engine import ingest_production_runs, validate_run, get_oee_overview, ALL_SHIFTS
+import asset_hierarchy
+import asset_registry
+import response_cache
+from predictive_engine import (store_sensor_readings, validate_reading, register_sensor,
+                               run_predictive_forecast, FORECAST_WINDOW_HOURS)
+from risk_scoring import get_risk_table, query_risk_table, invalidate_risk_cache
+from capacity_simulator import (submit_capacity_simulation, get_capacity_simulation, load_simulation_inputs,
+                                check_simulation_size, DEFAULT_REPLICAS, MAX_REPLICAS, DEFAULT_HORIZON_DAYS)
+from pm_recurrence import (validate_rule, materialize_pm_plans, expand_virtual_occurrences, materialize_virtual,
+                           on_occurrence_completed, deactivate_pm_plan, VIRTUAL_PREFIX, DEFAULT_READ_HORIZON_DAYS)
+from schedule_queries import (technician_filter, assignee_of, calendar_page, bucket_by_day,
+                              CALENDAR_MAX_DAYS, CALENDAR_DEFAULT_LIMIT, CALENDAR_MAX_LIMIT)
+from technician_capacity import (index as capacity_index, check_assignment, schedule_interval, wo_interval,
+                                 ACTIVE_SCHEDULE_STATUSES, DEFAULT_WO_MINUTES, WORK_START_HOUR, WORK_END_HOUR)
+from dispatch_optimizer import plan_dispatch, apply_dispatch, DISPATCH_HORIZON_HOURS
+from inventory_stock import resolve_parts, consume_parts, restock_parts, set_stock, low_stock_items
+from parts_forecast import run_parts_forecast, reorder_recommendations
+from asset_timeline import (asset_timeline, archived_boundaries, SOURCES as TIMELINE_SOURCES,
+                            DEFAULT_LIMIT as TIMELINE_DEFAULT_LIMIT, MAX_LIMIT as TIMELINE_MAX_LIMIT)
+from failure_pareto import failure_pareto, DIMENSIONS as PARETO_DIMENSIONS, METRICS as PARETO_METRICS, DEFAULT_WINDOW_DAYS as PARETO_WINDOW_DAYS
+from kpi_series import kpi_series, BUCKETS as KPI_BUCKETS, GROUP_BY as KPI_GROUP_BY
+from wo_events import (record_event, wo_history, projection_status, daily_kpis, technician_workloads,
+                       EVENT_CREATED, EVENT_ASSIGNED, EVENT_STARTED, EVENT_COMPLETED, EVENT_VERIFIED)
+from technician_leaderboard import technician_leaderboard, DEFAULT_WINDOW_DAYS as LEADERBOARD_WINDOW_DAYS
+from wo_search import search_document, search_work_orders, DEFAULT_PAGE_SIZE as SEARCH_DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE as SEARCH_MAX_PAGE_SIZE
+from anomaly_detection import detector as anomaly_detector, record_anomaly_alert
 from datetime import datetime, timedelta 
 
 app = Flask(__name__)
@@ -27,19 +61,6 @@ app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
-# Database collections untuk fitur baru
-def get_energy_collection():
-    from models import db
-    return db.energy_consumption if db else None
-
-def get_maintenance_costs_collection():
-    from models import db
-    return db.maintenance_costs if db else None
-
-def get_maintenance_budget_collection():
-    from models import db
-    return db.maintenance_budget if db else None
-
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
@@ -63,6 +84,13 @@ def role_required(allowed_roles):
         return decorated_function
     return decorator
 
+# Jadwal operator yang terlambat (belum dikerjakan) tetap ditampilkan sekian hari
+OPERATOR_OVERDUE_DAYS = 7
+
+# Masa berlaku cache respons analitik (detik); write endpoint menginvalidasi per tag
+KPI_CACHE_TTL = 60
+ANALYSIS_CACHE_TTL = 300
+
 # Helper function untuk format timestamp
 def format_timestamp(ts):
     if ts and ts > 0:
@@ -173,11 +201,13 @@ def register_user():
             "password": data['password'],
             "role": data['role'],
             "department": data['department'],
+            "skills": data.get('skills', []),  # tipe aset yang dikuasai teknisi (untuk dispatch)
             "created_at": int(time.time()),
             "created_by": session['user']['username']
         }
         
         result = get_user_collection().insert_one(user_data)
+        response_cache.invalidate("users")
         
         return jsonify({
             "message": f"User {data['name']} berhasil didaftarkan sebagai {data['role']}",
@@ -219,7 +249,7 @@ def create_wo_request():
             asset_name = data.get("asset_id")
             selected_components = data.get("components", [])
         
-        asset = get_asset_collection().find_one({"name": asset_name})
+        asset = asset_registry.get_asset(asset_name)
         if not asset:
             return jsonify({"message": f"Aset '{asset_name}' tidak ditemukan."}), 404
         
@@ -238,6 +268,7 @@ def create_wo_request():
             {"_id": asset['_id']},
             {"$inc": {"breakdown_count": 1}}
         )
+        asset_hierarchy.record_breakdown(asset_name)
             
         wo_data = {
             "asset_id": str(asset['_id']), 
@@ -267,8 +298,13 @@ def create_wo_request():
             "estimated_duration": data.get("estimated_duration", 0),
             "parts_used": []
         }
+        wo_data["search"] = search_document(wo_data)
         
         result = get_wo_collection().insert_one(wo_data)
+        record_event(wo_data, EVENT_CREATED, session['user']['username'], wo_data["timestamp_created"],
+                     priority=wo_data["priority"])
+        invalidate_risk_cache()
+        response_cache.invalidate("work_orders")
         return jsonify({
             "message": "Permintaan WO berhasil dibuat", 
             "wo_id": str(result.inserted_id),
@@ -334,7 +370,7 @@ def get_work_orders():
     if status_filter:
         query["status"] = status_filter
     
-    work_orders = list(get_wo_collection().find(query).sort("timestamp_created", -1))
+    work_orders = list(get_wo_collection().find(query, {"search": 0}).sort("timestamp_created", -1))
     
     for wo in work_orders:
         wo['_id'] = str(wo['_id'])
@@ -347,11 +383,55 @@ def get_work_orders():
             
     return jsonify(work_orders), 200
 
+@app.route('/api/wo/search', methods=['GET'])
+@role_required(["Operator", "Teknisi", "Supervisor", "Manager"])
+def search_wo():
+    """Pencarian teks WO (deskripsi, akar masalah, komponen, catatan) terurut relevansi"""
+    try:
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({"message": "Parameter q wajib diisi"}), 400
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', SEARCH_DEFAULT_PAGE_SIZE, type=int), 1), SEARCH_MAX_PAGE_SIZE)
+        
+        username = session['user']['username']
+        user_role = session['user']['role']
+        filters = {}
+        if user_role == "Teknisi":
+            filters["assigned_to"] = username
+        elif user_role == "Operator":
+            filters["requested_by"] = username
+        for param, field in (("status", "status"), ("type", "type"), ("priority", "priority"), ("asset", "asset_name")):
+            if request.args.get(param):
+                filters[field] = request.args.get(param)
+        created = {}
+        if request.args.get('from'):
+            created["$gte"] = request.args.get('from', type=int)
+        if request.args.get('to'):
+            created["$lt"] = request.args.get('to', type=int)
+        if created:
+            filters["timestamp_created"] = created
+        
+        results, has_more = search_work_orders(text, filters, page, limit)
+        for wo in results:
+            wo['_id'] = str(wo['_id'])
+            wo['timestamp_created_formatted'] = format_timestamp(wo.get('timestamp_created'))
+            wo['timestamp_completed_formatted'] = format_timestamp(wo.get('timestamp_completed'))
+        
+        return jsonify({
+            "results": results,
+            "page": page,
+            "has_more": has_more
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # 4. API untuk Supervisor: Melihat WO Baru
 @app.route('/api/wo/new', methods=['GET'])
 @role_required(["Supervisor"])
 def get_new_wo():
-    new_wo = list(get_wo_collection().find({"status": "Baru"}).sort("timestamp_created", -1))
+    new_wo = list(get_wo_collection().find({"status": "Baru"}, {"search": 0}).sort("timestamp_created", -1))
     
     for wo in new_wo:
         wo['_id'] = str(wo['_id'])
@@ -374,24 +454,80 @@ def assign_wo(wo_id):
     # Ambil nama lengkap teknisi dari koleksi users
     user = get_user_collection().find_one({"username": technician_username})
     technician_name = user.get('name') if user else technician_username
+    
+    wo = get_wo_collection().find_one({"_id": ObjectId(wo_id)}, {"estimated_duration": 1, "asset_name": 1, "description": 1, "type": 1,
+                                                                 "status": 1, "assigned_to": 1, "timestamp_created": 1})
+    if not wo:
+        return jsonify({"message": "WO tidak ditemukan"}), 404
+    
+    # Cek bentrok dengan jadwal / WO aktif teknisi (kecuali supervisor memaksa)
+    assigned = int(time.time())
+    start, end = wo_interval(dict(wo, timestamp_assigned=assigned))
+    conflicts, suggestion = check_assignment(technician_username, start, end, exclude=f"wo:{wo_id}")
+    if conflicts and not data.get("force"):
+        return jsonify({
+            "message": f"{technician_name} sudah punya {len(conflicts)} pekerjaan pada rentang waktu ini",
+            "conflicts": conflicts,
+            "next_free_slot": suggestion
+        }), 409
 
+    # Status & teknisi sebelumnya ikut difilter agar event mencatat transisi yang benar
     result = get_wo_collection().update_one(
-        {"_id": ObjectId(wo_id)},
+        {"_id": ObjectId(wo_id), "status": wo.get('status'), "assigned_to": wo.get('assigned_to')},
         {
             "$set": {
                 "status": "Ditugaskan",
                 "assigned_to": technician_username,
                 "technician": technician_name,
-                "timestamp_started": int(time.time())
+                "timestamp_assigned": assigned
             }
         }
     )
     
     if result.modified_count:
+        record_event(wo, EVENT_ASSIGNED, session['user']['username'], assigned, technician=technician_username,
+                     previous_technician=wo.get('assigned_to') or None, previous_status=wo.get('status'),
+                     created_at=wo.get('timestamp_created'))
+        response_cache.invalidate("work_orders")
+        capacity_index.upsert(technician_username, f"wo:{wo_id}", start, end,
+                              {"kind": "wo", "asset_name": wo.get('asset_name'), "description": wo.get('description')})
         return jsonify({"message": f"WO berhasil dialokasikan ke {technician_name}"}), 200
     return jsonify({"message": "WO tidak ditemukan"}), 404
 
 # 6. API untuk Teknisi: Melihat WO yang Ditugaskan
+@app.route('/api/wo/dispatch/preview', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def preview_wo_dispatch():
+    """Usulan penugasan otomatis semua WO Baru (skill, beban, prioritas, umur SLA)"""
+    try:
+        horizon_hours = request.args.get('horizon_hours', DISPATCH_HORIZON_HOURS, type=float)
+        if not 0 < horizon_hours <= 24 * 7:
+            return jsonify({"message": "horizon_hours harus antara 0 dan 168"}), 400
+        return jsonify(plan_dispatch(horizon_hours=horizon_hours)), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/wo/dispatch/apply', methods=['POST'])
+@role_required(["Supervisor", "Manager"])
+def apply_wo_dispatch():
+    """Terapkan penugasan hasil preview (atau hitung ulang bila assignments tidak dikirim)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        assignments = data.get('assignments')
+        if assignments is None:
+            assignments = plan_dispatch(horizon_hours=data.get('horizon_hours', DISPATCH_HORIZON_HOURS))['assignments']
+        for item in assignments:
+            if not item.get('technician') or not ObjectId.is_valid(item.get('wo_id', '')):
+                return jsonify({"message": "Setiap assignment harus berisi wo_id dan technician yang valid"}), 400
+        
+        result = apply_dispatch(assignments, actor=session['user']['username'])
+        response_cache.invalidate("work_orders")
+        return jsonify(dict(result, message=f"{result['assigned']} WO berhasil dialokasikan otomatis")), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 @app.route('/api/wo/assigned', methods=['GET'])
 @role_required(["Teknisi"])
 def get_assigned_wo():
@@ -399,7 +535,7 @@ def get_assigned_wo():
     assigned_wo = list(get_wo_collection().find({
         "assigned_to": username,
         "status": {"$in": ["Ditugaskan", "Dalam Pengerjaan"]}
-    }).sort("timestamp_created", -1))
+    }, {"search": 0}).sort("timestamp_created", -1))
     
     for wo in assigned_wo:
         wo['_id'] = str(wo['_id'])
@@ -416,14 +552,19 @@ def get_assigned_wo():
 @app.route('/api/wo/start/<wo_id>', methods=['POST'])
 @role_required(["Teknisi"])
 def start_wo(wo_id):
-    result = get_wo_collection().update_one(
-        {"_id": ObjectId(wo_id), "assigned_to": session['user']['username']},
-        {"$set": {"status": "Dalam Pengerjaan"}}
+    username = session['user']['username']
+    started = int(time.time())
+    wo = get_wo_collection().find_one_and_update(
+        {"_id": ObjectId(wo_id), "assigned_to": username, "status": "Ditugaskan"},
+        {"$set": {"status": "Dalam Pengerjaan", "timestamp_started": started}},
+        projection={"asset_name": 1, "type": 1}
     )
     
-    if result.modified_count:
+    if wo:
+        record_event(wo, EVENT_STARTED, username, started, technician=username)
+        response_cache.invalidate("work_orders")
         return jsonify({"message": "WO berhasil dimulai"}), 200
-    return jsonify({"message": "WO tidak ditemukan"}), 404
+    return jsonify({"message": "WO tidak ditemukan atau status tidak sesuai"}), 404
 
 # 8. API untuk Teknisi: Menyelesaikan WO
 @app.route('/api/wo/complete/<wo_id>', methods=['POST'])
@@ -446,23 +587,76 @@ def complete_wo(wo_id):
                     file.save(os.path.join(app.config['UPLOAD_FOLDER'], unique_filename))
                     photo_paths.append(unique_filename)
         
+        parts_used = json.loads(data.get("parts_used", '[]')) if isinstance(data.get("parts_used"), str) else data.get("parts_used", [])
+        
+        wo_filter = {
+            "_id": ObjectId(wo_id),
+            "assigned_to": session['user']['username'],
+            "status": {"$in": ["Ditugaskan", "Dalam Pengerjaan"]}
+        }
+        wo = get_wo_collection().find_one(wo_filter, {"asset_name": 1, "description": 1, "type": 1, "status": 1,
+                                                      "timestamp_created": 1, "timestamp_started": 1})
+        if not wo:
+            return jsonify({"message": "WO tidak ditemukan atau status tidak sesuai"}), 404
+        # Status asal ikut dicatat di event, jadi update dikunci ke status yang terbaca
+        wo_filter["status"] = wo["status"]
+        
+        # Kurangi stok sparepart secara atomik (tidak boleh negatif)
+        resolved, unmatched = resolve_parts(parts_used)
+        consumed, shortages = consume_parts(wo_id, resolved)
+        if shortages:
+            return jsonify({
+                "message": "Stok sparepart tidak mencukupi: " + ", ".join(
+                    f"{part['item_name']} (diminta {part['requested']}, tersedia {part['available']})" for part in shortages),
+                "shortages": shortages
+            }), 409
+        
         update_data = {
             "status": "Selesai",
             "timestamp_completed": int(time.time()),
             "completion_notes": data.get("notes", ""),
-            "parts_used": json.loads(data.get("parts_used", '[]')) if isinstance(data.get("parts_used"), str) else data.get("parts_used", []),
+            "parts_used": parts_used,
+            "parts_consumed": consumed,
             "completion_photos": photo_paths,
             "root_cause": root_cause,
             "component_failed": component_failed,
         }
-
-        result = get_wo_collection().update_one(
-            {"_id": ObjectId(wo_id), "assigned_to": session['user']['username']},
-            {"$set": update_data}
-        )
+        update_data["search"] = search_document({**wo, **update_data})
+
+        try:
+            result = get_wo_collection().update_one(wo_filter, {"$set": update_data})
+        except Exception:
+            # Stok dikembalikan kecuali update ternyata sudah tersimpan
+            try:
+                written = get_wo_collection().find_one(
+                    {"_id": wo["_id"], "status": "Selesai", "timestamp_completed": update_data["timestamp_completed"]},
+                    {"_id": 1})
+            except Exception:
+                written = None
+            if written is None:
+                restock_parts(consumed)
+            raise
         
         if result.modified_count:
-            return jsonify({"message": f"WO {wo_id} berhasil diselesaikan. Menunggu verifikasi."}), 200
+            username = session['user']['username']
+            # WO sudah tersimpan: kegagalan efek samping hanya dicatat di log
+            try:
+                record_event(wo, EVENT_COMPLETED, username, update_data["timestamp_completed"], technician=username,
+                             previous_status=wo["status"], created_at=wo.get('timestamp_created'),
+                             started_at=wo.get('timestamp_started'))
+            except Exception:
+                app.logger.exception("Gagal mencatat event completed untuk WO %s", wo_id)
+            try:
+                capacity_index.remove(f"wo:{wo_id}")
+            except Exception:
+                app.logger.exception("Gagal menghapus WO %s dari index kapasitas", wo_id)
+            response_cache.invalidate("work_orders", "failures")
+            return jsonify({
+                "message": f"WO {wo_id} berhasil diselesaikan. Menunggu verifikasi.",
+                "parts_consumed": consumed,
+                "parts_unmatched": unmatched
+            }), 200
+        restock_parts(consumed)
         return jsonify({"message": "WO tidak ditemukan atau status tidak sesuai"}), 404
 
     except Exception as e:
@@ -472,7 +666,7 @@ def complete_wo(wo_id):
 @app.route('/api/wo/completed', methods=['GET'])
 @role_required(["Supervisor"])
 def get_completed_wo():
-    completed_wo = list(get_wo_collection().find({"status": "Selesai"}).sort("timestamp_completed", -1))
+    completed_wo = list(get_wo_collection().find({"status": "Selesai"}, {"search": 0}).sort("timestamp_completed", -1))
     
     for wo in completed_wo:
         wo['_id'] = str(wo['_id'])
@@ -492,7 +686,7 @@ def verify_wo(wo_id):
     supervisor_name = session['user'].get('name', session['user']['username'])
 
     result = get_wo_collection().update_one(
-        {"_id": ObjectId(wo_id)},
+        {"_id": ObjectId(wo_id), "status": "Selesai"},
         {
             "$set": {
                 "status": "Ditutup",
@@ -504,12 +698,21 @@ def verify_wo(wo_id):
     )
     
     if result.modified_count:
+        invalidate_risk_cache()
+        response_cache.invalidate("work_orders", "failures")
+        capacity_index.remove(f"wo:{wo_id}")
         wo = get_wo_collection().find_one({"_id": ObjectId(wo_id)})
+        if wo:
+            record_event(wo, EVENT_VERIFIED, session['user']['username'], wo.get('timestamp_verified'),
+                         technician=wo.get('assigned_to') or None)
         if wo and 'asset_name' in wo:
             get_asset_collection().update_one(
                 {"name": wo['asset_name']},
                 {"$set": {"last_maintenance": int(time.time())}}
             )
+            # Rollup MTTR hierarki (definisi sama dengan mttr_calculator)
+            if wo.get('type') == "Korektif" and wo.get('timestamp_created') and wo.get('timestamp_completed'):
+                asset_hierarchy.record_repair(wo['asset_name'], wo['timestamp_completed'] - wo['timestamp_created'])
             
         return jsonify({"message": f"WO {wo_id} berhasil diverifikasi dan ditutup"}), 200
     return jsonify({"message": "WO tidak ditemukan"}), 404
@@ -519,7 +722,7 @@ def verify_wo(wo_id):
 @role_required(["Operator", "Teknisi", "Supervisor", "Manager"])
 def get_wo_detail(wo_id):
     try:
-        wo = get_wo_collection().find_one({"_id": ObjectId(wo_id)})
+        wo = get_wo_collection().find_one({"_id": ObjectId(wo_id)}, {"search": 0})
         if wo:
             wo['_id'] = str(wo['_id'])
             if 'asset_id' in wo:
@@ -533,12 +736,63 @@ def get_wo_detail(wo_id):
     except:
         return jsonify({"message": "WO ID tidak valid"}), 400
 
+@app.route('/api/wo/<wo_id>/events', methods=['GET'])
+@role_required(["Teknisi", "Supervisor", "Manager"])
+def get_wo_events(wo_id):
+    """Riwayat transisi WO dari event log (dibuat, ditugaskan, dimulai, selesai, ditutup)"""
+    try:
+        events = wo_history(wo_id)
+        if not events:
+            return jsonify({"message": "Event WO tidak ditemukan"}), 404
+        for event in events:
+            event['at_formatted'] = format_timestamp(event['at'])
+        return jsonify({"wo_id": wo_id, "events": events}), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/projections', methods=['GET'])
+@role_required(["Manager"])
+def get_projection_status():
+    """Checkpoint & ketertinggalan (lag) setiap proyeksi event log WO"""
+    try:
+        return jsonify(projection_status()), 200
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/kpi/daily', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_daily_kpis():
+    """KPI harian WO dari proyeksi event log (from/to = YYYY-MM-DD, default 30 hari terakhir)"""
+    try:
+        today = datetime.now().date()
+        day_from = request.args.get('from', (today - timedelta(days=29)).isoformat())
+        day_to = request.args.get('to', today.isoformat())
+        try:
+            if datetime.strptime(day_from, '%Y-%m-%d') > datetime.strptime(day_to, '%Y-%m-%d'):
+                return jsonify({"message": "from harus lebih kecil atau sama dengan to"}), 400
+        except ValueError:
+            return jsonify({"message": "from/to harus berformat YYYY-MM-DD"}), 400
+        
+        return jsonify({"from": day_from, "to": day_to, "days": daily_kpis(day_from, day_to)}), 200
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/technicians/workload/summary', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_technician_workload_summary():
+    """Jumlah WO per status & rata-rata waktu perbaikan per teknisi (proyeksi event log)"""
+    try:
+        return jsonify({"technicians": technician_workloads()}), 200
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # --- ROUTING ASSETS ---
 
 @app.route('/api/assets', methods=['GET'])
 @role_required(["Operator", "Supervisor", "Manager", "Teknisi"])
 def list_assets():
-    assets = list(get_asset_collection().find({}, {"_id": 0, "name": 1, "location": 1, "status": 1, "type": 1}))
+    assets = asset_registry.list_assets(("name", "location", "status", "type"))
     return jsonify(assets), 200
 
 @app.route('/api/assets/detail', methods=['GET']) 
@@ -562,7 +816,7 @@ def list_assets_detail():
 @role_required(["Operator", "Supervisor", "Teknisi"])
 def get_asset_components(asset_name):
     """Mendapatkan daftar komponen untuk aset tertentu"""
-    asset = get_asset_collection().find_one({"name": asset_name})
+    asset = asset_registry.get_asset(asset_name)
     
     if not asset:
         return jsonify({"message": f"Aset '{asset_name}' tidak ditemukan."}), 404
@@ -574,6 +828,41 @@ def get_asset_components(asset_name):
         "components": components
     }), 200
 
+@app.route('/api/assets/<asset_name>/timeline', methods=['GET'])
+@role_required(["Supervisor", "Manager", "Teknisi"])
+def get_asset_timeline(asset_name):
+    """Timeline kronologis aset: WO, jadwal, energi, biaya & prediksi dalam satu stream"""
+    try:
+        if not asset_registry.asset_exists(asset_name):
+            return jsonify({"message": f"Aset '{asset_name}' tidak ditemukan."}), 404
+        
+        now = int(time.time())
+        date_from = request.args.get('from', now - 365 * 24 * 60 * 60, type=int)
+        date_to = request.args.get('to', now + 90 * 24 * 60 * 60, type=int)
+        limit = min(max(request.args.get('limit', TIMELINE_DEFAULT_LIMIT, type=int), 1), TIMELINE_MAX_LIMIT)
+        sources = [source for source in request.args.get('sources', '').split(',') if source]
+        unknown = [source for source in sources if source not in TIMELINE_SOURCES]
+        if unknown:
+            return jsonify({"message": f"Sumber tidak dikenal: {', '.join(unknown)}. Pilih dari: {', '.join(TIMELINE_SOURCES)}"}), 400
+        
+        try:
+            events, next_cursor = asset_timeline(asset_name, date_from, date_to, sources, request.args.get('cursor'), limit)
+        except ValueError:
+            return jsonify({"message": "Cursor tidak valid"}), 400
+        
+        for event in events:
+            event['timestamp_formatted'] = format_timestamp(event['timestamp'])
+        
+        return jsonify({
+            "asset_name": asset_name,
+            "events": events,
+            "next_cursor": next_cursor,
+            "archived_until": archived_boundaries()
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # API untuk menambah aset baru
 @app.route('/api/assets/create', methods=['POST'])
 @role_required(["Manager", "Supervisor"])
@@ -588,8 +877,7 @@ def create_asset():
                 return jsonify({"message": f"Field {field} harus diisi"}), 400
         
         # Cek apakah aset sudah ada
-        existing_asset = get_asset_collection().find_one({"name": data['name']})
-        if existing_asset:
+        if asset_registry.asset_exists(data['name']):
             return jsonify({"message": f"Aset dengan nama {data['name']} sudah ada"}), 400
         
         asset_data = {
@@ -609,6 +897,10 @@ def create_asset():
         }
         
         result = get_asset_collection().insert_one(asset_data)
+        asset_registry.invalidate()
+        asset_hierarchy.register_asset(data['name'], data['location'], data['type'])
+        invalidate_risk_cache()
+        response_cache.invalidate("assets")
         
         return jsonify({
             "message": f"Aset {data['name']} berhasil didaftarkan",
@@ -633,38 +925,37 @@ def list_inventory():
 @app.route('/api/inventory/low-stock', methods=['GET'])
 @role_required(["Supervisor", "Manager"])
 def get_low_stock():
-    low_stock = list(get_inventory_collection().find({
-        "$expr": {"$lt": ["$current_stock", "$min_stock"]}
-    }))
+    low_stock = low_stock_items()
     
     for item in low_stock:
         item['_id'] = str(item['_id'])
         
     return jsonify(low_stock), 200
 
+@app.route('/api/inventory/reorder', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_reorder_recommendations():
+    """Rekomendasi pemesanan sparepart dari forecast pemakaian (refresh=1 untuk hitung ulang)"""
+    try:
+        if request.args.get('refresh') == '1':
+            run_parts_forecast()
+        return jsonify(reorder_recommendations(include_all=request.args.get('all') == '1')), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 @app.route('/api/inventory/update/<item_id>', methods=['POST'])
 @role_required(["Supervisor"])
 def update_inventory(item_id):
     data = request.get_json()
     
-    update_data = {}
-    if 'current_stock' in data:
-        update_data['current_stock'] = data['current_stock']
-    if 'min_stock' in data:
-        update_data['min_stock'] = data['min_stock']
-    
-    if 'current_stock' in data:
-        item = get_inventory_collection().find_one({"_id": ObjectId(item_id)})
-        min_stock = data.get('min_stock', item.get('min_stock', 0) if item else 0)
-        if data['current_stock'] < min_stock:
-            update_data['status'] = 'Rendah'
-        else:
-            update_data['status'] = 'Aman'
+    if 'current_stock' not in data and 'min_stock' not in data:
+        return jsonify({"message": "current_stock atau min_stock harus diisi"}), 400
+    if any(field in data and (not isinstance(data[field], int) or data[field] < 0) for field in ('current_stock', 'min_stock')):
+        return jsonify({"message": "Stok harus berupa bilangan bulat tidak negatif"}), 400
     
-    result = get_inventory_collection().update_one(
-        {"_id": ObjectId(item_id)},
-        {"$set": update_data}
-    )
+    # status, below_min & deficit dihitung ulang di update yang sama
+    result = set_stock(ObjectId(item_id), data.get('current_stock'), data.get('min_stock'))
     
     if result.modified_count:
         return jsonify({"message": "Inventory berhasil diupdate"}), 200
@@ -682,16 +973,17 @@ def list_schedule():
         
         query = {}
         
-        # Teknisi hanya melihat jadwal yang ditugaskan ke mereka
+        # Teknisi hanya melihat jadwal yang ditugaskan ke mereka + jadwal tanpa teknisi tertentu
         if user_role == "Teknisi":
-            query["$or"] = [
-                {"assigned_to": username},
-                {"assigned_to": ""},  # Jadwal tanpa teknisi tertentu
-                {"assigned_to": {"$exists": False}}
-            ]
+            query = technician_filter(username)
         
         schedule = list(get_schedule_collection().find(query).sort("scheduled_date", 1))
         
+        # Occurrence PM berulang di luar jendela materialized dihitung on the fly
+        now = int(time.time())
+        schedule += expand_virtual_occurrences(now, now + DEFAULT_READ_HORIZON_DAYS * 24 * 60 * 60, query, now)
+        schedule.sort(key=lambda item: item.get('scheduled_date') or 0)
+        
         for item in schedule:
             item['_id'] = str(item['_id'])
             # Format tanggal untuk frontend
@@ -720,14 +1012,14 @@ def get_upcoming_schedule():
         }
         
         # Filter untuk teknisi
+        plan_query = None
         if user_role == "Teknisi":
-            query["$or"] = [
-                {"assigned_to": username},
-                {"assigned_to": ""},
-                {"assigned_to": {"$exists": False}}
-            ]
+            plan_query = technician_filter(username)
+            query.update(plan_query)
         
         upcoming = list(get_schedule_collection().find(query).sort("scheduled_date", 1))
+        upcoming += expand_virtual_occurrences(current_time, seven_days_later + 1, plan_query, current_time)
+        upcoming.sort(key=lambda item: item['scheduled_date'])
         
         for item in upcoming:
             item['_id'] = str(item['_id'])
@@ -764,6 +1056,7 @@ def create_schedule():
             "priority": data.get('priority', 'Sedang'),
             "status": "Dijadwalkan",
             "assigned_to": data.get('assigned_to', ''),  # Bisa kosong untuk semua teknisi
+            "assignee": assignee_of(data.get('assigned_to', '')),
             "created_by": session['user']['username'],
             "created_at": int(time.time()),
             "notes": "",
@@ -771,7 +1064,21 @@ def create_schedule():
             "completed_at": None
         }
         
+        technician = schedule_data['assigned_to']
+        if technician:
+            start, end = schedule_interval(schedule_data)
+            conflicts, suggestion = check_assignment(technician, start, end)
+            if conflicts and not data.get('force'):
+                return jsonify({
+                    "message": f"Teknisi {technician} sudah punya {len(conflicts)} pekerjaan pada rentang waktu ini",
+                    "conflicts": conflicts,
+                    "next_free_slot": suggestion
+                }), 409
+        
         result = get_schedule_collection().insert_one(schedule_data)
+        if technician:
+            capacity_index.upsert(technician, f"schedule:{result.inserted_id}", start, end,
+                                  {"kind": "schedule", "asset_name": schedule_data['asset_name'], "description": schedule_data['description']})
         
         return jsonify({
             "message": "Jadwal maintenance berhasil dibuat", 
@@ -781,6 +1088,224 @@ def create_schedule():
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/schedule/calendar', methods=['GET'])
+@role_required(["Operator", "Supervisor", "Manager", "Teknisi"])
+def get_schedule_calendar():
+    """Jadwal dalam rentang from/to (timestamp) dikelompokkan per hari, dengan cursor pagination"""
+    try:
+        now = int(time.time())
+        date_from = request.args.get('from', now, type=int)
+        date_to = request.args.get('to', date_from + 7 * 24 * 60 * 60, type=int)
+        if date_to <= date_from:
+            return jsonify({"message": "Parameter to harus lebih besar dari from"}), 400
+        if date_to - date_from > CALENDAR_MAX_DAYS * 24 * 60 * 60:
+            return jsonify({"message": f"Rentang kalender maksimal {CALENDAR_MAX_DAYS} hari"}), 400
+        limit = max(min(request.args.get('limit', CALENDAR_DEFAULT_LIMIT, type=int), CALENDAR_MAX_LIMIT), 1)
+        
+        query = {}
+        if session['user']['role'] == "Teknisi":
+            query = technician_filter(session['user']['username'])
+        if request.args.get('status'):
+            query["status"] = request.args.get('status')
+        if request.args.get('asset'):
+            query["asset_name"] = request.args.get('asset')
+        
+        virtual = []
+        if not request.args.get('status') or request.args.get('status') == "Dijadwalkan":
+            plan_query = {key: value for key, value in query.items() if key != "status"}
+            virtual = expand_virtual_occurrences(date_from, date_to, plan_query, now)
+        
+        try:
+            items, next_cursor = calendar_page(date_from, date_to, query, request.args.get('cursor'), limit, virtual)
+        except ValueError:
+            return jsonify({"message": "Cursor tidak valid"}), 400
+        for item in items:
+            item['_id'] = str(item['_id'])
+            item['scheduled_date_formatted'] = format_timestamp(item['scheduled_date'])
+        
+        return jsonify({
+            "from": date_from,
+            "to": date_to,
+            "days": bucket_by_day(items),
+            "count": len(items),
+            "next_cursor": next_cursor
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/technicians/availability', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_technician_availability():
+    """Cek bentrok jadwal teknisi untuk rentang start + duration (menit) dan slot kosong berikutnya"""
+    try:
+        technician = request.args.get('technician')
+        if not technician:
+            return jsonify({"message": "Parameter technician harus diisi"}), 400
+        start = request.args.get('start', int(time.time()), type=int)
+        duration = request.args.get('duration', DEFAULT_WO_MINUTES, type=int)
+        
+        conflicts, suggestion = check_assignment(technician, start, start + duration * 60)
+        for conflict in conflicts:
+            conflict['start_formatted'] = format_timestamp(conflict['start'])
+            conflict['end_formatted'] = format_timestamp(conflict['end'])
+        
+        return jsonify({
+            "technician": technician,
+            "available": not conflicts,
+            "conflicts": conflicts,
+            "next_free_slot": suggestion,
+            "next_free_slot_formatted": format_timestamp(suggestion)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/technicians/workload', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_technician_workload():
+    """Beban kerja teknisi (jam terjadwal vs jam kerja) dalam rentang from/to"""
+    try:
+        date_from = request.args.get('from', int(time.time()), type=int)
+        date_to = request.args.get('to', date_from + 7 * 24 * 60 * 60, type=int)
+        if date_to <= date_from:
+            return jsonify({"message": "Parameter to harus lebih besar dari from"}), 400
+        
+        work_hours = (date_to - date_from) / (24 * 60 * 60) * (WORK_END_HOUR - WORK_START_HOUR)
+        technicians = list(get_user_collection().find({"role": "Teknisi"}, {"username": 1, "name": 1}))
+        
+        workload = []
+        for technician in technicians:
+            busy_hours = capacity_index.busy_seconds(technician['username'], date_from, date_to) / 3600
+            workload.append({
+                "username": technician['username'],
+                "name": technician.get('name', technician['username']),
+                "busy_hours": round(busy_hours, 1),
+                "available_hours": round(max(work_hours - busy_hours, 0), 1),
+                "utilization": round(busy_hours / work_hours * 100, 1) if work_hours > 0 else 0
+            })
+        workload.sort(key=lambda item: item['utilization'])
+        
+        return jsonify(workload), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/technicians/leaderboard', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_technician_leaderboard():
+    """Beban kerja & performa semua teknisi (WO terbuka, selesai, rata-rata perbaikan, utilisasi)"""
+    try:
+        days = request.args.get('days', LEADERBOARD_WINDOW_DAYS, type=int)
+        if not days or not 0 < days <= 365:
+            return jsonify({"message": "days harus antara 1 dan 365"}), 400
+        
+        leaderboard = response_cache.get_or_compute(f"technicians:leaderboard:{days}", lambda: technician_leaderboard(days),
+                                                    KPI_CACHE_TTL, tags=("work_orders", "users"))
+        return jsonify(leaderboard), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/schedule/plans', methods=['POST'])
+@role_required(["Supervisor", "Manager"])
+def create_pm_plan():
+    """Membuat rencana PM berulang (interval, weekly, monthly, monthly_nth, runtime)"""
+    try:
+        data = request.get_json()
+        
+        required_fields = ['asset_name', 'description', 'rule']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({"message": f"Field {field} harus diisi"}), 400
+        error = validate_rule(data['rule'])
+        if error:
+            return jsonify({"message": error}), 400
+        def is_int(value):
+            return isinstance(value, int) and not isinstance(value, bool)
+        
+        hour = data.get('hour', 8)
+        if not is_int(hour) or not 0 <= hour <= 23:
+            return jsonify({"message": "hour harus bilangan bulat 0 - 23"}), 400
+        start_date = data.get('start_date') or int(time.time())
+        end_date = data.get('end_date')
+        duration = data.get('duration', 60)
+        if not is_int(start_date) or start_date <= 0:
+            return jsonify({"message": "start_date harus berupa timestamp (bilangan bulat)"}), 400
+        if end_date is not None and (not is_int(end_date) or end_date <= start_date):
+            return jsonify({"message": "end_date harus berupa timestamp setelah start_date"}), 400
+        if not is_int(duration) or duration <= 0:
+            return jsonify({"message": "duration harus bilangan bulat (menit) lebih dari 0"}), 400
+        if not asset_registry.asset_exists(data['asset_name']):
+            return jsonify({"message": f"Aset '{data['asset_name']}' tidak ditemukan."}), 404
+        
+        plan_data = {
+            "asset_name": data['asset_name'],
+            "type": data.get('type', 'Preventif'),
+            "description": data['description'],
+            "rule": data['rule'],
+            "start_date": start_date,
+            "end_date": end_date,
+            "hour": hour,
+            "duration": duration,
+            "priority": data.get('priority', 'Sedang'),
+            "assigned_to": data.get('assigned_to', ''),
+            "assignee": assignee_of(data.get('assigned_to', '')),
+            "active": True,
+            "materialized_until": None,
+            "created_by": session['user']['username'],
+            "created_at": int(time.time())
+        }
+        
+        result = get_pm_plan_collection().insert_one(plan_data)
+        summary = materialize_pm_plans(plan_ids=[str(result.inserted_id)])
+        
+        return jsonify({
+            "message": "Rencana PM berulang berhasil dibuat",
+            "plan_id": str(result.inserted_id),
+            "materialized_occurrences": summary['occurrences']
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/schedule/plans', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def list_pm_plans():
+    """Mendapatkan rencana PM berulang"""
+    try:
+        query = {}
+        if request.args.get('asset'):
+            query["asset_name"] = request.args.get('asset')
+        if request.args.get('active', 'true').lower() != 'all':
+            query["active"] = request.args.get('active', 'true').lower() == 'true'
+        
+        plans = list(get_pm_plan_collection().find(query).sort("asset_name", 1))
+        for plan in plans:
+            plan['_id'] = str(plan['_id'])
+            plan['start_date_formatted'] = format_timestamp(plan.get('start_date'))
+        
+        return jsonify(plans), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/schedule/plans/<plan_id>/deactivate', methods=['POST'])
+@role_required(["Supervisor", "Manager"])
+def deactivate_plan(plan_id):
+    """Menonaktifkan rencana PM berulang beserta occurrence mendatangnya"""
+    try:
+        if not ObjectId.is_valid(plan_id):
+            return jsonify({"message": "Rencana PM tidak ditemukan"}), 404
+        removed = deactivate_pm_plan(plan_id)
+        if removed is None:
+            return jsonify({"message": "Rencana PM tidak ditemukan"}), 404
+        
+        return jsonify({"message": "Rencana PM dinonaktifkan", "removed_occurrences": removed}), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 @app.route('/api/schedule/update/<schedule_id>', methods=['POST'])
 @role_required(["Supervisor", "Teknisi"])
 def update_schedule(schedule_id):
@@ -801,13 +1326,25 @@ def update_schedule(schedule_id):
             if 'completed_by' not in update_data:
                 update_data['completed_by'] = session['user']['username']
         
+        # Occurrence virtual dari rencana PM berulang disimpan dulu sebelum diubah
+        if schedule_id.startswith(VIRTUAL_PREFIX):
+            schedule_object_id = materialize_virtual(schedule_id)
+            if schedule_object_id is None:
+                return jsonify({"message": "Jadwal tidak ditemukan"}), 404
+        else:
+            schedule_object_id = ObjectId(schedule_id)
+        
         result = get_schedule_collection().update_one(
-            {"_id": ObjectId(schedule_id)},
+            {"_id": schedule_object_id},
             {"$set": update_data}
         )
         
         if result.modified_count:
-            return jsonify({"message": "Jadwal berhasil diupdate"}), 200
+            if update_data.get('status') and update_data['status'] not in ACTIVE_SCHEDULE_STATUSES:
+                capacity_index.remove(f"schedule:{schedule_object_id}")
+            if update_data.get('status') == 'Selesai':
+                on_occurrence_completed(get_schedule_collection().find_one({"_id": schedule_object_id}), update_data['completed_at'])
+            return jsonify({"message": "Jadwal berhasil diupdate", "schedule_id": str(schedule_object_id)}), 200
         return jsonify({"message": "Jadwal tidak ditemukan"}), 404
         
     except Exception as e:
@@ -821,14 +1358,15 @@ def get_technician_schedule():
         username = session['user']['username']
         
         # Jadwal yang ditugaskan ke teknisi ini ATAU tanpa penugasan spesifik
-        schedules = list(get_schedule_collection().find({
-            "$or": [
-                {"assigned_to": username},
-                {"assigned_to": ""},
-                {"assigned_to": {"$exists": False}}
-            ],
-            "status": {"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}
-        }).sort("scheduled_date", 1))
+        assignment = technician_filter(username)
+        schedules = list(get_schedule_collection().find(dict(
+            assignment,
+            status={"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}
+        )).sort("scheduled_date", 1))
+        
+        now = int(time.time())
+        schedules += expand_virtual_occurrences(now, now + DEFAULT_READ_HORIZON_DAYS * 24 * 60 * 60, assignment, now)
+        schedules.sort(key=lambda item: item.get('scheduled_date') or 0)
         
         for schedule in schedules:
             schedule['_id'] = str(schedule['_id'])
@@ -874,7 +1412,7 @@ def mttr_calculator():
 @app.route('/api/kpi/mttr', methods=['GET'])
 @role_required(["Manager"])
 def calculate_mttr_api():
-    mttr_data = mttr_calculator()
+    mttr_data = response_cache.get_or_compute("kpi:mttr", mttr_calculator, KPI_CACHE_TTL, tags=("work_orders",))
     return jsonify({
         "message": "MTTR Berhasil Dihitung",
         "total_wo_korektif_closed": mttr_data['total_wo_korektif_closed'],
@@ -892,28 +1430,31 @@ def get_asset_kpi():
     if asset_collection is None or wo_collection is None:
         return jsonify({"message": "Database not connected"}), 500
 
-    problem_asset_count = asset_collection.count_documents({"status": "Bermasalah"})
-    
-    total_pm_wo = wo_collection.count_documents({"type": "Preventif"})
-    completed_pm_wo = wo_collection.count_documents({"type": "Preventif", "status": "Ditutup"})
-    
-    pm_compliance = (completed_pm_wo / total_pm_wo * 100) if total_pm_wo > 0 else 0
-    
-    new_wo = wo_collection.count_documents({"status": "Baru"})
-    in_progress_wo = wo_collection.count_documents({"status": {"$in": ["Ditugaskan", "Dalam Pengerjaan"]}})
-    completed_wo = wo_collection.count_documents({"status": "Selesai"})
-    closed_wo = wo_collection.count_documents({"status": "Ditutup"})
-    
-    return jsonify({
-        "problem_asset": problem_asset_count, 
-        "pm_compliance": round(pm_compliance, 1),
-        "wo_stats": { 
-            "new": new_wo,
-            "in_progress": in_progress_wo,
-            "completed": completed_wo,
-            "closed": closed_wo
+    def compute():
+        problem_asset_count = asset_collection.count_documents({"status": "Bermasalah"})
+        
+        total_pm_wo = wo_collection.count_documents({"type": "Preventif"})
+        completed_pm_wo = wo_collection.count_documents({"type": "Preventif", "status": "Ditutup"})
+        
+        pm_compliance = (completed_pm_wo / total_pm_wo * 100) if total_pm_wo > 0 else 0
+        
+        new_wo = wo_collection.count_documents({"status": "Baru"})
+        in_progress_wo = wo_collection.count_documents({"status": {"$in": ["Ditugaskan", "Dalam Pengerjaan"]}})
+        completed_wo = wo_collection.count_documents({"status": "Selesai"})
+        closed_wo = wo_collection.count_documents({"status": "Ditutup"})
+        
+        return {
+            "problem_asset": problem_asset_count, 
+            "pm_compliance": round(pm_compliance, 1),
+            "wo_stats": { 
+                "new": new_wo,
+                "in_progress": in_progress_wo,
+                "completed": completed_wo,
+                "closed": closed_wo
+            }
         }
-    }), 200
+    
+    return jsonify(response_cache.get_or_compute("kpi:assets", compute, KPI_CACHE_TTL, tags=("work_orders", "assets"))), 200
 
 @app.route('/api/kpi/dashboard', methods=['GET'])
 @role_required(["Manager"])
@@ -923,25 +1464,89 @@ def get_dashboard_kpi():
     
     if asset_collection is None or wo_collection is None:
         return jsonify({"message": "Database not connected"}), 500
-        
-    total_assets = asset_collection.count_documents({})
-    operational_assets = asset_collection.count_documents({"status": {"$in": ["Operasi Normal", "Perlu Perhatian"]}}) 
     
-    active_wo = wo_collection.count_documents({"status": {"$in": ["Baru", "Ditugaskan", "Dalam Pengerjaan"]}})
-    
-    mttr_data = mttr_calculator()
+    def compute():
+        total_assets = asset_collection.count_documents({})
+        operational_assets = asset_collection.count_documents({"status": {"$in": ["Operasi Normal", "Perlu Perhatian"]}}) 
+        
+        active_wo = wo_collection.count_documents({"status": {"$in": ["Baru", "Ditugaskan", "Dalam Pengerjaan"]}})
+        
+        mttr_data = mttr_calculator()
+        
+        return {
+            "total_assets": total_assets,
+            "operational_assets": operational_assets,
+            "asset_uptime": round((operational_assets / total_assets * 100), 1) if total_assets > 0 else 0,
+            "total_work_orders": wo_collection.count_documents({}),
+            "active_work_orders": active_wo, 
+            "completion_rate": 0, 
+            "low_stock_items": 0, 
+            "mttr_minutes": mttr_data['mttr_minutes'], 
+            "total_inventory_items": 0 
+        }
     
-    return jsonify({
-        "total_assets": total_assets,
-        "operational_assets": operational_assets,
-        "asset_uptime": round((operational_assets / total_assets * 100), 1) if total_assets > 0 else 0,
-        "total_work_orders": wo_collection.count_documents({}),
-        "active_work_orders": active_wo, 
-        "completion_rate": 0, 
-        "low_stock_items": 0, 
-        "mttr_minutes": mttr_data['mttr_minutes'], 
-        "total_inventory_items": 0 
-    }), 200
+    return jsonify(response_cache.get_or_compute("kpi:dashboard", compute, KPI_CACHE_TTL, tags=("work_orders", "assets"))), 200
+
+@app.route('/api/kpi/series', methods=['GET'])
+@role_required(["Manager"])
+def get_kpi_series():
+    """Tren MTTR, MTBF, PM compliance & backlog per hari/minggu/bulan"""
+    try:
+        # `to` default = sekarang, dibulatkan ke menit agar cache tetap terpakai
+        now = int(time.time())
+        date_to = request.args.get('to', now - now % 60 + 60, type=int)
+        date_from = request.args.get('from', date_to - 90 * 24 * 60 * 60, type=int)
+        bucket = request.args.get('bucket', 'week')
+        group_by = request.args.get('group_by') or None
+        if bucket not in KPI_BUCKETS:
+            return jsonify({"message": f"bucket harus salah satu dari: {', '.join(KPI_BUCKETS)}"}), 400
+        if group_by is not None and group_by not in KPI_GROUP_BY:
+            return jsonify({"message": f"group_by harus salah satu dari: {', '.join(KPI_GROUP_BY)}"}), 400
+        if date_from >= date_to:
+            return jsonify({"message": "from harus lebih kecil dari to"}), 400
+        
+        key = f"kpi:series:{date_from}:{date_to}:{bucket}:{group_by}"
+        try:
+            series = response_cache.get_or_compute(key, lambda: kpi_series(date_from, date_to, bucket, group_by),
+                                                   KPI_CACHE_TTL, tags=("work_orders", "assets"))
+        except ValueError as e:
+            return jsonify({"message": str(e)}), 400
+        return jsonify(series), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/analytics/pareto', methods=['GET'])
+@role_required(["Supervisor", "Manager"])
+def get_failure_pareto():
+    """Pareto kegagalan & downtime per komponen, tipe aset, akar masalah dan aset"""
+    try:
+        days = request.args.get('days', PARETO_WINDOW_DAYS, type=int)
+        date_from = request.args.get('from', type=int)
+        date_to = request.args.get('to', type=int)
+        wo_type = request.args.get('type', 'Korektif')
+        metric = request.args.get('metric', 'failures')
+        top = min(max(request.args.get('top', 10, type=int), 1), 100)
+        if metric not in PARETO_METRICS:
+            return jsonify({"message": f"metric harus salah satu dari: {', '.join(PARETO_METRICS)}"}), 400
+        if not date_from and (not days or days <= 0):
+            return jsonify({"message": "days harus lebih dari 0"}), 400
+        
+        def compute():
+            end = date_to or int(time.time())
+            start = date_from or end - days * 24 * 60 * 60
+            report = failure_pareto(start, end, None if wo_type == "all" else wo_type, metric, top)
+            report["from_formatted"] = format_timestamp(start)
+            report["to_formatted"] = format_timestamp(end)
+            report["dimensions"] = list(PARETO_DIMENSIONS)
+            return report
+        
+        # Hanya berubah saat WO diselesaikan/ditutup (tag "failures")
+        key = f"pareto:{date_from}:{date_to}:{days}:{wo_type}:{metric}:{top}"
+        return jsonify(response_cache.get_or_compute(key, compute, ANALYSIS_CACHE_TTL, tags=("failures",))), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
 
 # =========================================================
 # ENDPOINT 12: FULL WORK ORDER HISTORY (DIPERBAIKI)
@@ -1044,7 +1649,7 @@ def get_supervisor_stats():
     completed_wo = get_wo_collection().count_documents({"status": "Selesai"})
     assigned_wo = get_wo_collection().count_documents({"status": {"$in": ["Ditugaskan", "Dalam Pengerjaan"]}})
     
-    low_stock = get_inventory_collection().count_documents({"status": "Rendah"})
+    low_stock = get_inventory_collection().count_documents({"below_min": True})
     
     return jsonify({
         "new_work_orders": new_wo,
@@ -1061,11 +1666,12 @@ def get_supervisor_stats():
 def get_operator_schedule():
     """Mendapatkan jadwal maintenance untuk operator"""
     try:
-        # Get upcoming schedules (next 30 days)
+        # Get upcoming schedules (next 30 days) + jadwal terlambat maksimal 7 hari
         thirty_days_later = int(time.time()) + (30 * 24 * 60 * 60)
+        overdue_since = int(time.time()) - (OPERATOR_OVERDUE_DAYS * 24 * 60 * 60)
         
         schedules = list(get_schedule_collection().find({
-            "scheduled_date": {"$lte": thirty_days_later},
+            "scheduled_date": {"$gte": overdue_since, "$lte": thirty_days_later},
             "status": {"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}
         }).sort("scheduled_date", 1))
         
@@ -1148,6 +1754,8 @@ def calculate_oee():
         for field in required_fields:
             if not data.get(field):
                 return jsonify({"message": f"Field {field} harus diisi"}), 400
+        if not asset_registry.asset_exists(data['asset_name']):
+            return jsonify({"message": f"Aset '{data['asset_name']}' tidak ditemukan."}), 404
         
         # Calculate OEE components
         # Availability
@@ -1163,22 +1771,10 @@ def calculate_oee():
         # Overall OEE
         oee = (availability * performance * quality) / 10000  # Convert from percentage
         
-        # Save OEE data to asset
-        asset = get_asset_collection().find_one({"name": data['asset_name']})
-        if asset:
-            get_asset_collection().update_one(
-                {"_id": asset['_id']},
-                {"$set": {
-                    "oee_data": {
-                        "availability": round(availability, 2),
-                        "performance": round(performance, 2),
-                        "quality": round(quality, 2),
-                        "oee": round(oee, 2),
-                        "calculated_at": int(time.time())
-                    },
-                    "efficiency": round(oee, 1)
-                }}
-            )
+        # Simpan sebagai production run; snapshot harian dihitung engine OEE
+        # sehingga histori OEE tidak lagi tertimpa
+        ingest_production_runs([data], session['user']['username'])
+        response_cache.invalidate("oee")
         
         return jsonify({
             "availability": round(availability, 2),
@@ -1194,27 +1790,105 @@ def calculate_oee():
 @app.route('/api/oee/assets', methods=['GET'])
 @role_required(["Manager", "Supervisor"])
 def get_assets_oee():
-    """Mendapatkan data OEE semua aset"""
+    """Mendapatkan data OEE semua aset (snapshot terbaru + tren harian)"""
     try:
-        assets = list(get_asset_collection().find({}))
-        
-        oee_data = []
-        for asset in assets:
-            asset_oee = {
-                "asset_name": asset.get("name"),
-                "asset_type": asset.get("type"),
-                "location": asset.get("location"),
-                "status": asset.get("status"),
-                "efficiency": asset.get("efficiency", 0),
-                "oee_data": asset.get("oee_data", {})
-            }
-            oee_data.append(asset_oee)
+        trend_days = request.args.get('days', 30, type=int)
+        shift = request.args.get('shift', ALL_SHIFTS)
+        
+        def compute():
+            overview = get_oee_overview(trend_days, shift)
+            assets = list(get_asset_collection().find({}, {"name": 1, "type": 1, "location": 1, "status": 1, "efficiency": 1, "oee_data": 1}))
+            
+            oee_data = []
+            for asset in assets:
+                snapshot = overview.get(asset.get("name"), {})
+                asset_oee = {
+                    "asset_name": asset.get("name"),
+                    "asset_type": asset.get("type"),
+                    "location": asset.get("location"),
+                    "status": asset.get("status"),
+                    "efficiency": asset.get("efficiency", 0),
+                    # Aset tanpa snapshot (data awal) memakai oee_data tersimpan
+                    "oee_data": snapshot.get("oee_data", asset.get("oee_data", {})),
+                    "oee_trend": snapshot.get("oee_trend", [])
+                }
+                oee_data.append(asset_oee)
+            return oee_data
             
+        oee_data = response_cache.get_or_compute(f"oee:assets:{trend_days}:{shift}", compute, ANALYSIS_CACHE_TTL,
+                                                 tags=("oee", "assets"))
         return jsonify(oee_data), 200
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/oee/runs', methods=['POST'])
+@role_required(["Manager", "Supervisor"])
+def record_production_runs():
+    """Mencatat production run secara bulk dan menghitung snapshot OEE"""
+    try:
+        data = request.get_json()
+        runs = data.get('runs', []) if isinstance(data, dict) else data
+        if not runs:
+            return jsonify({"message": "Field runs harus diisi"}), 400
+        
+        for index, run in enumerate(runs):
+            error = validate_run(run)
+            if error:
+                return jsonify({"message": f"Run #{index + 1}: {error}"}), 400
+        
+        summary = ingest_production_runs(runs, session['user']['username'])
+        response_cache.invalidate("oee")
+        
+        return jsonify({
+            "message": f"{summary['runs']} production run berhasil dicatat",
+            "runs": summary['runs'],
+            "snapshots": summary['snapshots']
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/oee/history', methods=['GET'])
+@role_required(["Manager", "Supervisor"])
+def get_oee_history():
+    """Histori snapshot OEE untuk satu aset"""
+    try:
+        asset_name = request.args.get('asset')
+        if not asset_name:
+            return jsonify({"message": "Parameter asset harus diisi"}), 400
+        
+        days = request.args.get('days', 90, type=int)
+        since = int(time.time()) - (days * 24 * 60 * 60)
+        query = {
+            "asset_name": asset_name,
+            "shift": request.args.get('shift', ALL_SHIFTS),
+            "period_start": {"$gte": since}
+        }
+        
+        history = list(get_oee_snapshot_collection().find(query, {"_id": 0}).sort("period_start", 1))
+        return jsonify(history), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/hierarchy', methods=['GET'])
+@role_required(["Manager", "Supervisor"])
+def get_hierarchy():
+    """Rollup KPI (OEE, breakdown, MTTR, energi, biaya) per node plant / lini / aset"""
+    try:
+        node_id = request.args.get('node', asset_hierarchy.PLANT_ID)
+        include_children = request.args.get('children', 'true').lower() != 'false'
+        
+        node = asset_hierarchy.get_hierarchy_node(node_id, include_children)
+        if node is None:
+            return jsonify({"message": f"Node '{node_id}' tidak ditemukan"}), 404
+        
+        return jsonify(node), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # =========================================================
 # FITUR 2: Predictive Maintenance
 # =========================================================
@@ -1222,103 +1896,229 @@ def get_assets_oee():
 @app.route('/api/predictive/maintenance', methods=['POST'])
 @role_required(["Manager", "Supervisor"])
 def create_predictive_maintenance():
-    """Membuat jadwal predictive maintenance berdasarkan data sensor"""
+    """Mencatat pembacaan sensor + batasnya lalu menghitung prediksi dari tren sensor"""
     try:
         data = request.get_json()
         
-        required_fields = ['asset_name', 'sensor_type', 'current_value', 'threshold', 'predicted_failure_date']
+        required_fields = ['asset_name', 'sensor_type', 'current_value', 'threshold']
         for field in required_fields:
             if not data.get(field):
                 return jsonify({"message": f"Field {field} harus diisi"}), 400
         
-        # Calculate risk level
-        risk_percentage = (data['current_value'] / data['threshold']) * 100
-        risk_level = "Rendah"
-        if risk_percentage >= 80:
-            risk_level = "Tinggi"
-        elif risk_percentage >= 60:
-            risk_level = "Sedang"
-        
-        predictive_data = {
+        reading = {
             "asset_name": data['asset_name'],
             "sensor_type": data['sensor_type'],
-            "current_value": data['current_value'],
+            "value": data['current_value'],
             "threshold": data['threshold'],
-            "risk_percentage": round(risk_percentage, 2),
-            "risk_level": risk_level,
-            "predicted_failure_date": data['predicted_failure_date'],
-            "recommended_action": data.get('recommended_action', 'Monitoring dan inspeksi rutin'),
-            "created_by": session['user']['username'],
-            "created_at": int(time.time()),
-            "status": "Aktif"
+            "direction": data.get('direction', 'above'),
+            "timestamp": data.get('timestamp')
         }
+        error = validate_reading(reading)
+        if error:
+            return jsonify({"message": error}), 400
+        store_sensor_readings([reading])
+        
+        # Deteksi anomali online pada data sensor
+        anomaly_alert = anomaly_detector.observe(data['asset_name'], data['sensor_type'], data['current_value'])
+        if anomaly_alert:
+            record_anomaly_alert(anomaly_alert, session['user']['username'])
+        
+        forecast = run_predictive_forecast(asset_name=data['asset_name'])
+        prediction = next(
+            (p for p in forecast['predictions'] if p['sensor_type'] == data['sensor_type']), None
+        )
+        if prediction is None:
+            return jsonify({"message": "Prediksi tidak dapat dihitung"}), 500
         
-        result = get_schedule_collection().insert_one(predictive_data)
+        # Jadwal hanya dibuat untuk risiko Sedang/Tinggi (lihat _schedule_predictions)
+        schedule = get_schedule_collection().find_one(
+            {"predictive_maintenance_id": prediction['prediction_id'], "status": {"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}},
+            {"_id": 1}
+        ) if prediction['prediction_id'] else None
         
-        # Also create a maintenance schedule
-        schedule_data = {
-            "asset_name": data['asset_name'],
-            "type": "Predictive",
-            "description": f"Predictive maintenance berdasarkan sensor {data['sensor_type']}. Risk: {risk_level} ({risk_percentage}%)",
-            "scheduled_date": data['predicted_failure_date'] - (7 * 24 * 60 * 60),  # 1 week before predicted failure
-            "duration": 120,
-            "priority": "Tinggi" if risk_level == "Tinggi" else "Sedang",
-            "status": "Dijadwalkan",
-            "created_by": session['user']['username'],
-            "created_at": int(time.time()),
-            "predictive_maintenance_id": str(result.inserted_id)
-        }
+        return jsonify({
+            "message": f"Predictive maintenance berhasil dihitung. Level risiko: {prediction['risk_level']}",
+            "risk_level": prediction['risk_level'],
+            "risk_percentage": prediction['risk_percentage'],
+            "days_to_threshold": prediction['days_to_threshold'],
+            "predicted_failure_date": prediction['predicted_failure_date'],
+            "model": prediction['model'],
+            "prediction_id": prediction['prediction_id'],
+            "schedule_id": str(schedule['_id']) if schedule else None,
+            "anomaly": anomaly_alert["anomaly_type"] if anomaly_alert else None
+        }), 201
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/predictive/readings', methods=['POST'])
+@role_required(["Manager", "Supervisor", "Operator"])
+def record_sensor_readings():
+    """Mencatat satu atau banyak pembacaan sensor (batch: {"readings": [...]})"""
+    try:
+        data = request.get_json()
+        readings = data.get('readings') if isinstance(data.get('readings'), list) else [data]
+        
+        for reading in readings:
+            error = validate_reading(reading)
+            if error:
+                return jsonify({"message": error}), 400
         
-        get_schedule_collection().insert_one(schedule_data)
+        documents = store_sensor_readings(readings)
+        
+        anomalies = 0
+        for doc in documents:
+            anomaly_alert = anomaly_detector.observe(doc['asset_name'], doc['sensor_type'], doc['value'], doc['timestamp'])
+            if anomaly_alert:
+                record_anomaly_alert(anomaly_alert, session['user']['username'])
+                anomalies += 1
         
         return jsonify({
-            "message": f"Predictive maintenance berhasil dibuat. Level risiko: {risk_level}",
-            "risk_level": risk_level,
-            "risk_percentage": risk_percentage,
-            "schedule_id": str(result.inserted_id)
+            "message": f"{len(documents)} pembacaan sensor berhasil dicatat",
+            "readings": len(documents),
+            "anomalies": anomalies
         }), 201
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/predictive/sensors', methods=['POST'])
+@role_required(["Manager", "Supervisor"])
+def register_predictive_sensor():
+    """Mendaftarkan batas (threshold) sensor untuk forecast"""
+    try:
+        data = request.get_json()
+        
+        for field in ['asset_name', 'sensor_type', 'threshold']:
+            if not data.get(field):
+                return jsonify({"message": f"Field {field} harus diisi"}), 400
+        if data.get('direction', 'above') not in ('above', 'below'):
+            return jsonify({"message": "direction harus 'above' atau 'below'"}), 400
+        
+        register_sensor(data['asset_name'], data['sensor_type'], data['threshold'],
+                        data.get('direction', 'above'), data.get('unit'))
+        
+        return jsonify({"message": f"Sensor {data['sensor_type']} pada {data['asset_name']} berhasil didaftarkan"}), 201
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/predictive/forecast', methods=['POST'])
+@role_required(["Manager"])
+def run_forecast():
+    """Menjalankan batch forecast untuk semua sensor (biasanya via cron)"""
+    try:
+        data = request.get_json(silent=True) or {}
+        summary = run_predictive_forecast(data.get('window_hours', FORECAST_WINDOW_HOURS))
+        
+        return jsonify({
+            "message": f"Forecast selesai untuk {summary['sensors']} sensor",
+            "sensors": summary['sensors'],
+            "schedules": summary['schedules'],
+            "high_risk": [p for p in summary['predictions'] if p['risk_level'] == "Tinggi"]
+        }), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/predictive/predictions', methods=['GET'])
+@role_required(["Manager", "Supervisor"])
+def list_predictions():
+    """Mendapatkan prediksi aktif, diurutkan dari estimasi kerusakan terdekat"""
+    try:
+        query = {"status": "Aktif"}
+        if request.args.get('asset'):
+            query["asset_name"] = request.args.get('asset')
+        if request.args.get('risk_level'):
+            query["risk_level"] = request.args.get('risk_level')
+        
+        predictions = list(get_predictive_collection().find(query))
+        predictions.sort(key=lambda p: (p.get('predicted_failure_date') is None, p.get('predicted_failure_date') or 0))
+        
+        for prediction in predictions:
+            prediction['_id'] = str(prediction['_id'])
+            prediction['predicted_failure_date_formatted'] = format_timestamp(prediction.get('predicted_failure_date'))
+        
+        return jsonify(predictions), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/predictive/rul', methods=['GET'])
+@role_required(["Manager", "Supervisor", "Teknisi"])
+def get_component_rul():
+    """Remaining useful life komponen kritis hasil batch malam, urut RUL terpendek"""
+    try:
+        query = {}
+        if request.args.get('asset'):
+            query["asset_name"] = request.args.get('asset')
+        if request.args.get('max_days', type=float) is not None:
+            query["rul_days"] = {"$lte": request.args.get('max_days', type=float)}
+        limit = request.args.get('limit', 100, type=int)
+        
+        components = list(get_component_rul_collection().find(query, {"_id": 0}).sort("rul_days", 1).limit(limit))
+        for component in components:
+            component['expected_failure_date_formatted'] = format_timestamp(component.get('expected_failure_date'))
+            component['scored_at_formatted'] = format_timestamp(component.get('scored_at'))
+        
+        return jsonify(components), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 @app.route('/api/predictive/risk-assessment', methods=['GET'])
 @role_required(["Manager", "Supervisor"])
 def get_risk_assessment():
-    """Mendapatkan assessment risiko untuk semua aset"""
+    """Assessment risiko per aset dari histori WO (laju breakdown, tren MTBF, umur maintenance, backlog)
+
+    Query: sort, order (asc/desc), risk_level, page, limit. Total baris dikirim di header X-Total-Count."""
     try:
-        # Get assets with high breakdown count
-        assets = list(get_asset_collection().find({"breakdown_count": {"$gt": 0}}).sort("breakdown_count", -1))
+        table, computed_at = get_risk_table()
+        items, total = query_risk_table(
+            table,
+            sort=request.args.get('sort', 'risk_score'),
+            order=request.args.get('order', 'desc'),
+            risk_level=request.args.get('risk_level'),
+            page=request.args.get('page', 1, type=int),
+            limit=request.args.get('limit', 50, type=int)
+        )
         
-        risk_assessment = []
-        for asset in assets:
-            breakdown_count = asset.get('breakdown_count', 0)
-            
-            # Calculate risk based on breakdown frequency
-            if breakdown_count >= 5:
-                risk_level = "Tinggi"
-                recommendation = "Perlu preventive maintenance segera dan evaluasi mendalam"
-            elif breakdown_count >= 3:
-                risk_level = "Sedang" 
-                recommendation = "Perlu penjadwalan preventive maintenance"
-            else:
-                risk_level = "Rendah"
-                recommendation = "Monitoring rutin"
-            
-            risk_assessment.append({
-                "asset_name": asset.get('name'),
-                "asset_type": asset.get('type'),
-                "breakdown_count": breakdown_count,
-                "last_maintenance": format_timestamp(asset.get('last_maintenance')),
-                "risk_level": risk_level,
-                "recommendation": recommendation,
-                "efficiency": asset.get('efficiency', 0)
-            })
+        risk_assessment = [
+            dict(item, last_maintenance=format_timestamp(item.get('last_maintenance_ts')))
+            for item in items
+        ]
         
-        return jsonify(risk_assessment), 200
+        response = jsonify(risk_assessment)
+        response.headers['X-Total-Count'] = str(total)
+        response.headers['X-Computed-At'] = str(computed_at)
+        return response, 200
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/anomaly/alerts', methods=['GET'])
+@role_required(["Manager", "Supervisor"])
+def get_anomaly_alerts():
+    """Mendapatkan alert anomali dari deteksi streaming"""
+    try:
+        query = {}
+        if request.args.get('status'):
+            query["status"] = request.args.get('status')
+        if request.args.get('asset'):
+            query["asset_name"] = request.args.get('asset')
+        limit = request.args.get('limit', 100, type=int)
+
+        alerts = list(get_anomaly_alert_collection().find(query).sort("timestamp", -1).limit(limit))
+
+        for alert in alerts:
+            alert['_id'] = str(alert['_id'])
+            alert['timestamp_formatted'] = format_timestamp(alert.get('timestamp'))
+
+        return jsonify(alerts), 200
+
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # =========================================================
 # FITUR 3: Energy Monitoring
 # =========================================================
@@ -1334,12 +2134,19 @@ def record_energy_consumption():
         for field in required_fields:
             if not data.get(field):
                 return jsonify({"message": f"Field {field} harus diisi"}), 400
+        if isinstance(data['timestamp'], bool) or not isinstance(data['timestamp'], int):
+            return jsonify({"message": "timestamp harus berupa bilangan bulat (epoch detik)"}), 400
+        # Rentang sebelum batas arsip hanya dibaca dari cold archive
+        archived_until = get_archived_until("energy_consumption")
+        if archived_until and data['timestamp'] < archived_until:
+            return jsonify({"message": f"timestamp sebelum batas arsip ({format_timestamp(archived_until)}) tidak dapat dicatat"}), 400
         
         energy_data = {
             "asset_name": data['asset_name'],
             "energy_consumption": data['energy_consumption'],  # in kWh
             "duration_hours": data['duration_hours'],
             "power_consumption": data['energy_consumption'] / data['duration_hours'],  # kW
+            "units_produced": data.get('units_produced', 0),  # opsional, untuk kWh per unit
             "timestamp": data['timestamp'],
             "recorded_by": session['user']['username'],
             "recorded_at": int(time.time())
@@ -1352,8 +2159,18 @@ def record_energy_consumption():
             
         result = energy_collection.insert_one(energy_data)
         
+        asset_hierarchy.record_energy(data['asset_name'], data['energy_consumption'])
+        response_cache.invalidate("energy")
+        
+        # Deteksi anomali online pada daya (kW)
+        anomaly_alert = anomaly_detector.observe(
+            data['asset_name'], "power_consumption", energy_data['power_consumption'], data['timestamp']
+        )
+        if anomaly_alert:
+            record_anomaly_alert(anomaly_alert, session['user']['username'])
+        
         # Update efficiency score based on energy consumption
-        asset = get_asset_collection().find_one({"name": data['asset_name']})
+        asset = asset_registry.get_asset(data['asset_name'])
         if asset:
             # Simple efficiency calculation based on energy consumption
             # Lower energy consumption per hour = higher efficiency
@@ -1376,7 +2193,8 @@ def record_energy_consumption():
         return jsonify({
             "message": "Data konsumsi energi berhasil dicatat",
             "energy_id": str(result.inserted_id),
-            "power_consumption": round(energy_data['power_consumption'], 2)
+            "power_consumption": round(energy_data['power_consumption'], 2),
+            "anomaly": anomaly_alert["anomaly_type"] if anomaly_alert else None
         }), 201
         
     except Exception as e:
@@ -1391,51 +2209,40 @@ def get_energy_analysis():
         if energy_collection is None:
             return jsonify({"message": "Database energy collection tidak tersedia"}), 500
         
-        # Get energy data from last 30 days
-        thirty_days_ago = int(time.time()) - (30 * 24 * 60 * 60)
-        energy_data = list(energy_collection.find({
-            "timestamp": {"$gte": thirty_days_ago}
-        }).sort("timestamp", 1))
-        
-        analysis = {
-            "total_consumption": 0,
-            "average_power": 0,
-            "peak_consumption": 0,
-            "assets_analysis": {}
-        }
-        
-        power_values = []
-        
-        for record in energy_data:
-            analysis["total_consumption"] += record['energy_consumption']
-            power_values.append(record['power_consumption'])
-            
-            asset_name = record['asset_name']
-            if asset_name not in analysis["assets_analysis"]:
-                analysis["assets_analysis"][asset_name] = {
-                    "total_energy": 0,
-                    "average_power": 0,
-                    "records_count": 0
-                }
-            
-            analysis["assets_analysis"][asset_name]["total_energy"] += record['energy_consumption']
-            analysis["assets_analysis"][asset_name]["records_count"] += 1
+        # Default 30 hari terakhir; rentang yang lebih lama otomatis dibaca dari arsip
+        days = request.args.get('days', 30, type=int)
         
-        if power_values:
-            analysis["average_power"] = sum(power_values) / len(power_values)
-            analysis["peak_consumption"] = max(power_values)
-            
-            # Calculate averages per asset
-            for asset in analysis["assets_analysis"]:
-                asset_data = analysis["assets_analysis"][asset]
-                if asset_data["records_count"] > 0:
-                    asset_data["average_power"] = asset_data["total_energy"] / asset_data["records_count"]
+        def compute():
+            since = int(time.time()) - (days * 24 * 60 * 60)
+            return summarize_energy(load_energy_span(since, collection=energy_collection))
         
-        return jsonify(analysis), 200
+        return jsonify(response_cache.get_or_compute(f"energy:analysis:{days}", compute, ANALYSIS_CACHE_TTL, tags=("energy",))), 200
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/energy/statistics', methods=['GET'])
+@role_required(["Manager", "Supervisor"])
+def get_energy_statistics():
+    """Statistik energi per aset: persentil, load factor, baseline di luar shift, kWh per unit"""
+    try:
+        energy_collection = get_energy_collection()
+        if energy_collection is None:
+            return jsonify({"message": "Database energy collection tidak tersedia"}), 500
+
+        days = request.args.get('days', 30, type=int)
+        asset_name = request.args.get('asset')
+        since = int(time.time()) - (days * 24 * 60 * 60)
+
+        columns = load_energy_span(since, asset_name=asset_name, collection=energy_collection)
+        statistics = compute_energy_statistics(columns)
+        statistics["period_days"] = days
+
+        return jsonify(statistics), 200
+
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # =========================================================
 # FITUR 4: Cost Analysis & Budget Tracking
 # =========================================================
@@ -1459,6 +2266,7 @@ def record_maintenance_cost():
             "amount": data['amount'],
             "currency": data.get('currency', 'IDR'),
             "description": data.get('description', ''),
+            "department": data.get('department', 'Maintenance'),
             "timestamp": int(time.time()),
             "recorded_by": session['user']['username']
         }
@@ -1468,6 +2276,9 @@ def record_maintenance_cost():
             return jsonify({"message": "Database maintenance costs collection tidak tersedia"}), 500
             
         result = costs_collection.insert_one(cost_data)
+        record_cost_in_ledger(cost_data)
+        asset_hierarchy.record_cost(cost_data['asset_name'], cost_data['amount'])
+        response_cache.invalidate("costs")
         
         return jsonify({
             "message": "Biaya maintenance berhasil dicatat",
@@ -1486,61 +2297,67 @@ def get_cost_analysis():
         if costs_collection is None:
             return jsonify({"message": "Database maintenance costs collection tidak tersedia"}), 500
         
-        # Get costs from last 12 months
-        one_year_ago = int(time.time()) - (365 * 24 * 60 * 60)
-        costs_data = list(costs_collection.find({
-            "timestamp": {"$gte": one_year_ago}
-        }))
-        
-        analysis = {
-            "total_costs": 0,
-            "costs_by_type": {},
-            "costs_by_asset": {},
-            "monthly_breakdown": {},
-            "budget_vs_actual": {}
-        }
+        def compute():
+            # Get costs from last 12 months
+            now = int(time.time())
+            one_year_ago = now - (365 * 24 * 60 * 60)
+        
+            # Bagian yang sudah diarsip dibaca dari file kolumnar, sisanya dari MongoDB
+            hot_since = one_year_ago
+            archived = None
+            archived_until = get_archived_until("maintenance_costs")
+            if archived_until and one_year_ago < archived_until:
+                archived = read_archived_costs(one_year_ago, archived_until)
+                hot_since = archived_until
+        
+            # Satu aggregation $facet: per tipe, aset, bulan, dan kuartal + budget
+            budget_from_year = datetime.fromtimestamp(one_year_ago).year
+            analysis = aggregate_costs(hot_since, budget_from_year, collection=costs_collection)
+            if archived:
+                merge_cost_breakdowns(analysis, archived)
+        
+            # Kuartal yang seluruhnya di luar jendela 12 bulan tidak ditampilkan
+            quarters = {
+                key: values for key, values in analysis.pop("quarters").items()
+                if quarter_bounds(*key)[1] > one_year_ago
+            }
+            analysis["budget_vs_actual"] = budget_vs_actual(quarters, now)
+            current_quarter = next((q for q in analysis["budget_vs_actual"].values() if q["is_current"]), None)
+            analysis["current_quarter"] = current_quarter
         
-        for cost in costs_data:
-            amount = cost['amount']
-            cost_type = cost['cost_type']
-            asset_name = cost['asset_name']
-            
-            # Total costs
-            analysis["total_costs"] += amount
-            
-            # Costs by type
-            if cost_type not in analysis["costs_by_type"]:
-                analysis["costs_by_type"][cost_type] = 0
-            analysis["costs_by_type"][cost_type] += amount
-            
-            # Costs by asset
-            if asset_name not in analysis["costs_by_asset"]:
-                analysis["costs_by_asset"][asset_name] = 0
-            analysis["costs_by_asset"][asset_name] += amount
-            
-            # Monthly breakdown
-            month_key = datetime.fromtimestamp(cost['timestamp']).strftime('%Y-%m')
-            if month_key not in analysis["monthly_breakdown"]:
-                analysis["monthly_breakdown"][month_key] = 0
-            analysis["monthly_breakdown"][month_key] += amount
-        
-        # Calculate ROI (simplified)
-        wo_collection = get_wo_collection()
-        closed_wo_count = wo_collection.count_documents({
-            "status": "Ditutup",
-            "timestamp_created": {"$gte": one_year_ago}
-        })
+            # Calculate ROI (simplified)
+            wo_collection = get_wo_collection()
+            closed_wo_count = wo_collection.count_documents({
+                "status": "Ditutup",
+                "timestamp_created": {"$gte": one_year_ago}
+            })
         
-        if analysis["total_costs"] > 0:
-            analysis["cost_per_wo"] = analysis["total_costs"] / closed_wo_count
-        else:
-            analysis["cost_per_wo"] = 0
+            analysis["closed_wo_count"] = closed_wo_count
+            analysis["cost_per_wo"] = analysis["total_costs"] / closed_wo_count if closed_wo_count > 0 else 0
+            return analysis
         
+        analysis = response_cache.get_or_compute("costs:analysis", compute, ANALYSIS_CACHE_TTL,
+                                                 tags=("costs", "work_orders"))
         return jsonify(analysis), 200
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+@app.route('/api/costs/ledger', methods=['GET'])
+@role_required(["Manager"])
+def get_cost_ledger():
+    """Laporan biaya per periode dari ledger (total berjalan) beserta budget"""
+    try:
+        year = request.args.get('year', datetime.now().year, type=int)
+        quarter = request.args.get('quarter', type=int)
+        month = request.args.get('month', type=int)
+        department = request.args.get('department')
+
+        return jsonify(get_ledger_report(year, quarter, month, department)), 200
+
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 @app.route('/api/costs/budget', methods=['POST'])
 @role_required(["Manager"])
 def set_maintenance_budget():
@@ -1583,12 +2400,90 @@ def set_maintenance_budget():
         else:
             budget_collection.insert_one(budget_data)
             message = "Budget berhasil ditetapkan"
+        response_cache.invalidate("costs")
         
         return jsonify({"message": message}), 200
         
     except Exception as e:
         return jsonify({"message": f"Error: {str(e)}"}), 500
 
+# =========================================================
+# FITUR 5: Simulasi Kapasitas Teknisi
+# =========================================================
+
+@app.route('/api/simulation/capacity', methods=['POST'])
+@role_required(["Manager"])
+def start_capacity_simulation():
+    """Menjalankan simulasi Monte Carlo kapasitas teknisi di background"""
+    try:
+        data = request.get_json(silent=True) or {}
+        
+        staffing = data.get('technicians')
+        if staffing is not None and (not isinstance(staffing, list) or not all(isinstance(n, int) and n > 0 for n in staffing)):
+            return jsonify({"message": "technicians harus berupa list jumlah teknisi (> 0)"}), 400
+        
+        replicas = data.get('replicas', DEFAULT_REPLICAS)
+        horizon_days = data.get('horizon_days', DEFAULT_HORIZON_DAYS)
+        seed = data.get('seed')
+        for name, value in (("replicas", replicas), ("horizon_days", horizon_days)):
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                return jsonify({"message": f"{name} harus bilangan bulat lebih dari 0"}), 400
+        if seed is not None and (isinstance(seed, bool) or not isinstance(seed, int) or seed < 0):
+            return jsonify({"message": "seed harus bilangan bulat >= 0"}), 400
+        
+        params = {
+            "staffing_levels": staffing,
+            "replicas": min(replicas, MAX_REPLICAS),
+            "horizon_days": horizon_days,
+            "seed": seed
+        }
+        
+        # Ukuran matriks job diperiksa sebelum masuk antrean worker
+        inputs = load_simulation_inputs(horizon_days=params["horizon_days"])
+        error = check_simulation_size(inputs, params["replicas"], params["horizon_days"])
+        if error:
+            return jsonify({"message": error}), 400
+        
+        run_id = submit_capacity_simulation(params, session['user']['username'], inputs)
+        
+        return jsonify({"message": "Simulasi kapasitas dijalankan", "run_id": run_id}), 202
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/simulation/capacity/<run_id>', methods=['GET'])
+@role_required(["Manager"])
+def get_capacity_simulation_result(run_id):
+    """Status dan hasil satu run simulasi kapasitas"""
+    try:
+        if not ObjectId.is_valid(run_id):
+            return jsonify({"message": "Run simulasi tidak ditemukan"}), 404
+        run = get_capacity_simulation(run_id)
+        if run is None:
+            return jsonify({"message": "Run simulasi tidak ditemukan"}), 404
+        
+        run['created_at_formatted'] = format_timestamp(run.get('created_at'))
+        return jsonify(run), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
+@app.route('/api/simulation/capacity', methods=['GET'])
+@role_required(["Manager"])
+def list_capacity_simulations():
+    """Daftar run simulasi kapasitas terbaru (tanpa detail hasil)"""
+    try:
+        limit = request.args.get('limit', 20, type=int)
+        runs = list(get_capacity_simulation_collection().find({}, {"result": 0}).sort("created_at", -1).limit(limit))
+        for run in runs:
+            run['_id'] = str(run['_id'])
+            run['created_at_formatted'] = format_timestamp(run.get('created_at'))
+        
+        return jsonify(runs), 200
+        
+    except Exception as e:
+        return jsonify({"message": f"Error: {str(e)}"}), 500
+
 # --- Health Check ---
 @app.route('/api/health', methods=['GET'])
 def health_check():
@@ -0,0 +1,232 @@
+# asset_hierarchy.py
+import threading
+import time
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from models import (get_hierarchy_collection, get_asset_collection, get_wo_collection,
+                    get_energy_collection, get_cost_ledger_collection)
+from cold_archive import get_archived_until, read_archived_energy
+import asset_registry
+
+# Hierarki: plant -> area/lini (field `location` aset) -> aset.
+# Setiap node menyimpan counter aditif sehingga rollup di level mana pun
+# bisa diperbarui dengan satu $inc ke node aset beserta seluruh leluhurnya.
+PLANT_ID = "plant"
+PLANT_NAME = "Prime Fragrance Plant"
+
+COUNTER_FIELDS = ("assets_count", "breakdowns", "repairs", "repair_seconds",
+                  "energy_kwh", "cost_total", "oee_sum", "oee_count")
+
+_path_cache = {}
+_path_lock = threading.Lock()
+
+
+def line_node_id(location):
+    return f"line:{location or 'Tanpa Lokasi'}"
+
+
+def asset_node_id(asset_name):
+    return f"asset:{asset_name}"
+
+
+def ensure_hierarchy_indexes():
+    hierarchy = get_hierarchy_collection()
+    hierarchy.create_index([("parent", ASCENDING)], name="parent")
+    hierarchy.create_index([("level", ASCENDING)], name="level")
+
+
+def _empty_counters():
+    return {field: 0 for field in COUNTER_FIELDS}
+
+
+def register_asset(asset_name, location, asset_type=None):
+    """Menambahkan node aset (dan plant/lini jika belum ada) ke hierarki."""
+    hierarchy = get_hierarchy_collection()
+    line_id = line_node_id(location)
+    now = int(time.time())
+
+    hierarchy.update_one(
+        {"_id": PLANT_ID},
+        {"$setOnInsert": dict(_empty_counters(), name=PLANT_NAME, level="plant", parent=None, ancestors=[], created_at=now)},
+        upsert=True
+    )
+    hierarchy.update_one(
+        {"_id": line_id},
+        {"$setOnInsert": dict(_empty_counters(), name=location, level="line", parent=PLANT_ID, ancestors=[PLANT_ID], created_at=now)},
+        upsert=True
+    )
+    result = hierarchy.update_one(
+        {"_id": asset_node_id(asset_name)},
+        {"$setOnInsert": dict(
+            _empty_counters(), name=asset_name, level="asset", asset_type=asset_type, oee=None,
+            parent=line_id, ancestors=[PLANT_ID, line_id], created_at=now
+        )},
+        upsert=True
+    )
+    if result.upserted_id is not None:
+        hierarchy.update_many({"_id": {"$in": [PLANT_ID, line_id]}}, {"$inc": {"assets_count": 1}})
+
+    with _path_lock:
+        _path_cache[asset_name] = [asset_node_id(asset_name), line_id, PLANT_ID]
+
+
+def _asset_path(asset_name):
+    """ID node aset + leluhurnya (cache per proses; lokasi aset jarang berubah)."""
+    path = _path_cache.get(asset_name)
+    if path is not None:
+        return path
+
+    node = get_hierarchy_collection().find_one({"_id": asset_node_id(asset_name)}, {"ancestors": 1})
+    if node is None:
+        asset = asset_registry.get_asset(asset_name)
+        if asset is None:
+            return None
+        register_asset(asset_name, asset.get("location"), asset.get("type"))
+        return _path_cache.get(asset_name)
+
+    path = [node["_id"]] + list(reversed(node.get("ancestors", [])))
+    with _path_lock:
+        _path_cache[asset_name] = path
+    return path
+
+
+def _increment(asset_name, increments):
+    path = _asset_path(asset_name)
+    if not path:
+        return
+    get_hierarchy_collection().update_many(
+        {"_id": {"$in": path}},
+        {"$inc": increments, "$set": {"updated_at": int(time.time())}}
+    )
+
+
+def record_breakdown(asset_name):
+    _increment(asset_name, {"breakdowns": 1})
+
+
+def record_repair(asset_name, repair_seconds):
+    if repair_seconds and repair_seconds > 0:
+        _increment(asset_name, {"repairs": 1, "repair_seconds": repair_seconds})
+
+
+def record_energy(asset_name, energy_kwh):
+    _increment(asset_name, {"energy_kwh": energy_kwh})
+
+
+def record_cost(asset_name, amount):
+    _increment(asset_name, {"cost_total": amount})
+
+
+def record_oee(asset_name, oee):
+    """Mengganti OEE terbaru aset; leluhur menerima selisihnya (rata-rata tetap konsisten)."""
+    path = _asset_path(asset_name)
+    if not path:
+        return
+    hierarchy = get_hierarchy_collection()
+    # find_one_and_update mengembalikan dokumen sebelum update (atomik)
+    node = hierarchy.find_one_and_update({"_id": path[0]}, {"$set": {"oee": oee}}, projection={"oee": 1})
+    previous = node.get("oee") if node else None
+
+    increments = {"oee_sum": oee - (previous or 0)}
+    if previous is None:
+        increments["oee_count"] = 1
+    hierarchy.update_many({"_id": {"$in": path[1:]}}, {"$inc": increments, "$set": {"updated_at": int(time.time())}})
+    hierarchy.update_one({"_id": path[0]}, {"$inc": increments})
+
+
+def _with_kpis(node):
+    node = dict(node)
+    node["id"] = node.pop("_id")
+    repairs = node.get("repairs", 0)
+    node["mttr_minutes"] = round(node.get("repair_seconds", 0) / repairs / 60, 1) if repairs else 0.0
+    oee_count = node.get("oee_count", 0)
+    node["oee_average"] = round(node.get("oee_sum", 0) / oee_count, 2) if oee_count else None
+    return node
+
+
+def get_hierarchy_node(node_id=PLANT_ID, include_children=True):
+    """Node beserta KPI rollup-nya, dan (opsional) anak langsungnya."""
+    hierarchy = get_hierarchy_collection()
+    node = hierarchy.find_one({"_id": node_id})
+    if node is None:
+        return None
+    result = _with_kpis(node)
+    if include_children:
+        result["children"] = [_with_kpis(child) for child in hierarchy.find({"parent": node_id}).sort("name", 1)]
+    return result
+
+
+def rebuild_hierarchy():
+    """Membangun ulang seluruh hierarki dan counter dari koleksi sumber.
+
+    Energi dijumlah dari MongoDB + arsip kolumnar; biaya memakai cost_ledger
+    sehingga bulan yang sudah diarsip tetap ikut terhitung."""
+    ensure_hierarchy_indexes()
+    assets = list(get_asset_collection().find({}, {"name": 1, "location": 1, "type": 1, "breakdown_count": 1, "oee_data": 1}))
+
+    repairs = {row["_id"]: row for row in get_wo_collection().aggregate([
+        {"$match": {"status": "Ditutup", "type": "Korektif", "timestamp_completed": {"$ne": None}}},
+        {"$group": {
+            "_id": "$asset_name",
+            "repairs": {"$sum": 1},
+            "repair_seconds": {"$sum": {"$subtract": ["$timestamp_completed", "$timestamp_created"]}}
+        }}
+    ])}
+    energy = {row["_id"]: row["kwh"] for row in get_energy_collection().aggregate([
+        {"$group": {"_id": "$asset_name", "kwh": {"$sum": "$energy_consumption"}}}
+    ])}
+    archived_until = get_archived_until("energy_consumption")
+    if archived_until:
+        archived = read_archived_energy(0, archived_until)
+        totals = np.bincount(archived["asset"], weights=archived["energy"], minlength=len(archived["asset_names"]))
+        for name, kwh in zip(archived["asset_names"], totals.tolist()):
+            energy[name] = energy.get(name, 0) + kwh
+    costs = {row["_id"]: row["amount"] for row in get_cost_ledger_collection().aggregate([
+        {"$group": {"_id": "$asset_name", "amount": {"$sum": "$amount"}}}
+    ])}
+
+    now = int(time.time())
+    nodes = {PLANT_ID: dict(_empty_counters(), name=PLANT_NAME, level="plant", parent=None, ancestors=[])}
+    for asset in assets:
+        name = asset["name"]
+        line_id = line_node_id(asset.get("location"))
+        nodes.setdefault(line_id, dict(
+            _empty_counters(), name=asset.get("location"), level="line", parent=PLANT_ID, ancestors=[PLANT_ID]
+        ))
+        oee = (asset.get("oee_data") or {}).get("oee")
+        counters = {
+            "assets_count": 1,
+            "breakdowns": asset.get("breakdown_count", 0),
+            "repairs": repairs.get(name, {}).get("repairs", 0),
+            "repair_seconds": repairs.get(name, {}).get("repair_seconds", 0),
+            "energy_kwh": energy.get(name, 0),
+            "cost_total": costs.get(name, 0),
+            "oee_sum": oee or 0,
+            "oee_count": 1 if oee is not None else 0
+        }
+        nodes[asset_node_id(name)] = dict(
+            counters, name=name, level="asset", asset_type=asset.get("type"), oee=oee,
+            parent=line_id, ancestors=[PLANT_ID, line_id]
+        )
+        for ancestor in (line_id, PLANT_ID):
+            for field, value in counters.items():
+                nodes[ancestor][field] += value
+
+    operations = [
+        UpdateOne({"_id": node_id}, {"$set": dict(node, updated_at=now)}, upsert=True)
+        for node_id, node in nodes.items()
+    ]
+    hierarchy = get_hierarchy_collection()
+    hierarchy.bulk_write(operations, ordered=False)
+    hierarchy.delete_many({"_id": {"$nin": list(nodes)}})
+
+    with _path_lock:
+        _path_cache.clear()
+    return {"nodes": len(nodes), "assets": len(assets)}
+
+
+if __name__ == '__main__':
+    summary = rebuild_hierarchy()
+    print(f"Hierarki dibangun ulang: {summary['nodes']} node, {summary['assets']} aset")
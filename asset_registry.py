@@ -0,0 +1,81 @@
+# asset_registry.py
+import threading
+import time
+
+from pymongo import ReturnDocument
+
+from models import get_asset_collection, get_cache_version_collection
+
+# Katalog aset (nama -> _id, tipe, lokasi, status, komponen kritis) di memori
+# per proses. Setiap penulisan yang mengubah field katalog memanggil
+# `invalidate()`, yang menaikkan versi di `cache_versions`; worker lain cukup
+# membaca dokumen versi itu (maks. sekali tiap VERSION_CHECK_SECONDS) dan
+# memuat ulang katalog bila versinya berubah. Counter yang sering berubah
+# (breakdown_count, oee_data, efficiency, ...) sengaja tidak di-cache.
+VERSION_KEY = "assets"
+VERSION_CHECK_SECONDS = 2
+REGISTRY_FIELDS = ("name", "type", "location", "status", "critical_components",
+                   "installation_date", "manufacturer", "model")
+
+_state = {"assets": None, "ordered": [], "version": None, "checked_at": 0}
+_lock = threading.Lock()
+
+
+def _read_version():
+    doc = get_cache_version_collection().find_one({"_id": VERSION_KEY}, {"version": 1})
+    return doc.get("version", 0) if doc else 0
+
+
+def _load(version):
+    ordered = list(get_asset_collection().find({}, {field: 1 for field in REGISTRY_FIELDS}))
+    with _lock:
+        _state["assets"] = {asset["name"]: asset for asset in ordered}
+        _state["ordered"] = ordered
+        _state["version"] = version
+        _state["checked_at"] = time.time()
+
+
+def _ensure_fresh():
+    if _state["assets"] is not None and time.time() - _state["checked_at"] < VERSION_CHECK_SECONDS:
+        return
+    version = _read_version()
+    if _state["assets"] is None or version != _state["version"]:
+        _load(version)
+    else:
+        _state["checked_at"] = time.time()
+
+
+def _copy(asset):
+    copy = dict(asset)
+    copy["critical_components"] = list(asset.get("critical_components") or [])
+    return copy
+
+
+def get_asset(name):
+    """Dokumen katalog aset berdasarkan nama (salinan), atau None."""
+    _ensure_fresh()
+    asset = _state["assets"].get(name)
+    return _copy(asset) if asset is not None else None
+
+
+def asset_exists(name):
+    _ensure_fresh()
+    return name in _state["assets"]
+
+
+def list_assets(fields=None):
+    """Semua aset dalam urutan insert (seperti find({}) tanpa sort)."""
+    _ensure_fresh()
+    if fields is None:
+        return [_copy(asset) for asset in _state["ordered"]]
+    return [{field: asset[field] for field in fields if field in asset} for asset in _state["ordered"]]
+
+
+def invalidate():
+    """Dipanggil setelah menulis field katalog aset: naikkan versi & muat ulang lokal."""
+    doc = get_cache_version_collection().find_one_and_update(
+        {"_id": VERSION_KEY},
+        {"$inc": {"version": 1}, "$set": {"updated_at": int(time.time())}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    _load(doc["version"])
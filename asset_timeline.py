@@ -0,0 +1,161 @@
+# asset_timeline.py
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from cold_archive import get_archived_until, iter_archived_records
+from models import (get_wo_collection, get_schedule_collection, get_energy_collection,
+                    get_maintenance_costs_collection, get_predictive_collection)
+
+# Timeline satu aset: setiap sumber dibaca dengan range query ber-index
+# (asset_name, waktu, _id) terurut menurun, lalu kursor-kursornya digabung
+# k-way (heapq.merge) secara lazy. Tiap kursor paling banyak mengambil
+# limit + 1 dokumen, sehingga satu halaman tidak pernah memuat satu sumber
+# secara penuh. Urutan total: (waktu, peringkat sumber, _id) menurun;
+# cursor halaman berikutnya berbentuk "<waktu>_<sumber>_<id>".
+#
+# Energi dan biaya yang sudah dipindah ke arsip kolumnar (cold_archive)
+# dibaca dari partisi untuk [from, archived_until) sebagai stream tambahan
+# dengan sumber & peringkat yang sama; MongoDB hanya melayani sisanya.
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 500
+
+SOURCES = {
+    # nama: (collection getter, field waktu, peringkat tie-break, proyeksi)
+    "work_order": (get_wo_collection, "timestamp_created", 0,
+                   {"asset_name": 1, "timestamp_created": 1, "type": 1, "status": 1, "priority": 1, "description": 1,
+                    "assigned_to": 1, "timestamp_completed": 1}),
+    "schedule": (get_schedule_collection, "scheduled_date", 1,
+                 {"asset_name": 1, "scheduled_date": 1, "type": 1, "status": 1, "description": 1, "assigned_to": 1}),
+    "energy": (get_energy_collection, "timestamp", 2,
+               {"asset_name": 1, "timestamp": 1, "energy_consumption": 1, "power_consumption": 1, "duration_hours": 1}),
+    "cost": (get_maintenance_costs_collection, "timestamp", 3,
+             {"asset_name": 1, "timestamp": 1, "cost_type": 1, "amount": 1, "currency": 1, "description": 1, "wo_id": 1}),
+    "prediction": (get_predictive_collection, "created_at", 4,
+                   {"asset_name": 1, "created_at": 1, "sensor_type": 1, "risk_level": 1, "risk_percentage": 1,
+                    "predicted_failure_date": 1, "recommended_action": 1, "status": 1}),
+}
+
+# sumber timeline -> dataset cold_archive
+ARCHIVED_SOURCES = {"energy": "energy_consumption", "cost": "maintenance_costs"}
+
+_executor = ThreadPoolExecutor(max_workers=len(SOURCES), thread_name_prefix="timeline")
+
+
+def archived_boundaries():
+    """Batas arsip (eksklusif) per sumber; None bila belum ada yang diarsip."""
+    return {name: get_archived_until(dataset) for name, dataset in ARCHIVED_SOURCES.items()}
+
+
+def ensure_timeline_indexes():
+    for name, (collection, time_field, _, _) in SOURCES.items():
+        collection().create_index(
+            [("asset_name", ASCENDING), (time_field, DESCENDING), ("_id", DESCENDING)],
+            name=f"asset_{time_field}_id"
+        )
+
+
+def encode_cursor(event):
+    return f"{event['timestamp']}_{event['source']}_{event['id']}"
+
+
+def decode_cursor(cursor):
+    timestamp, rest = cursor.split("_", 1)
+    source, event_id = rest.rsplit("_", 1)
+    if source not in SOURCES or not ObjectId.is_valid(event_id):
+        raise ValueError("cursor tidak valid")
+    return int(timestamp), source, ObjectId(event_id)
+
+
+def _source_query(asset_name, time_field, rank, date_from, date_to, after):
+    """Range query satu sumber; `after` = posisi terakhir halaman sebelumnya."""
+    time_range = {"$gte": date_from, "$lt": date_to}
+    query = {"asset_name": asset_name, time_field: time_range}
+    if after is None:
+        return query
+    after_time, after_source, after_id = after
+    after_rank = SOURCES[after_source][2]
+    if rank < after_rank:
+        time_range["$lte"] = after_time
+    elif rank > after_rank:
+        time_range["$lt"] = min(after_time, date_to)
+    else:
+        query["$or"] = [
+            {time_field: {"$lt": after_time}},
+            {time_field: after_time, "_id": {"$lt": after_id}}
+        ]
+    return query
+
+
+def _open_source(name, asset_name, date_from, date_to, after, limit):
+    """Buka kursor sumber dan ambil batch pertama (dijalankan paralel)."""
+    collection, time_field, rank, projection = SOURCES[name]
+    cursor = (collection()
+              .find(_source_query(asset_name, time_field, rank, date_from, date_to, after), projection)
+              .sort([(time_field, DESCENDING), ("_id", DESCENDING)])
+              .limit(limit + 1)
+              .batch_size(limit + 1))
+    first = next(cursor, None)
+    if first is None:
+        return iter(())
+    return (_to_event(name, time_field, rank, doc) for doc in itertools.chain([first], cursor))
+
+
+def _open_archived_source(name, asset_name, date_from, date_to, after, limit):
+    """Seperti _open_source, tetapi dari partisi arsip (filter cursor di Python)."""
+    _, time_field, rank, projection = SOURCES[name]
+    fields = [field for field in projection if field not in ("asset_name", time_field)]
+    if after is not None:
+        after_time, after_source, after_id = after
+        after_rank = SOURCES[after_source][2]
+        date_to = min(date_to, after_time + 1)
+        if rank < after_rank:
+            keep = lambda record: record["timestamp"] <= after_time
+        elif rank > after_rank:
+            keep = lambda record: record["timestamp"] < after_time
+        else:
+            keep = lambda record: (record["timestamp"], record["_id"]) < (after_time, after_id)
+    else:
+        keep = lambda record: True
+    records = (record for record in iter_archived_records(ARCHIVED_SOURCES[name], date_from, date_to, asset_name, fields)
+               if keep(record))
+    return iter([_to_event(name, "timestamp", rank, dict(record, archived=True))
+                 for record in itertools.islice(records, limit + 1)])
+
+
+def _to_event(source, time_field, rank, doc):
+    event_id = doc.pop("_id")
+    timestamp = doc.pop(time_field)
+    doc.pop("asset_name", None)
+    return {"timestamp": timestamp, "source": source, "id": str(event_id), "_rank": rank, "_oid": event_id, "data": doc}
+
+
+def asset_timeline(asset_name, date_from, date_to, sources=None, cursor=None, limit=DEFAULT_LIMIT):
+    """Satu halaman event aset dalam [date_from, date_to), terbaru dulu.
+
+    Mengembalikan (events, next_cursor)."""
+    after = decode_cursor(cursor) if cursor else None
+    names = [name for name in SOURCES if not sources or name in sources]
+    boundaries = archived_boundaries()
+    futures = []
+    for name in names:
+        archived_until = boundaries.get(name)
+        if archived_until and date_from < archived_until:
+            futures.append(_executor.submit(_open_archived_source, name, asset_name, date_from,
+                                            min(date_to, archived_until), after, limit))
+            if archived_until < date_to:
+                futures.append(_executor.submit(_open_source, name, asset_name, archived_until, date_to, after, limit))
+        else:
+            futures.append(_executor.submit(_open_source, name, asset_name, date_from, date_to, after, limit))
+    streams = [future.result() for future in futures]
+
+    merged = heapq.merge(*streams, key=lambda event: (event["timestamp"], event["_rank"], event["_oid"]), reverse=True)
+    page = list(itertools.islice(merged, limit + 1))
+    next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+    events = page[:limit]
+    for event in events:
+        del event["_rank"], event["_oid"]
+    return events, next_cursor
@@ -0,0 +1,312 @@
+# capacity_simulator.py
+import argparse
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from bson import ObjectId
+
+from models import (MACHINE_COMPONENTS, get_asset_collection, get_wo_collection, get_user_collection,
+                    get_schedule_collection, get_capacity_simulation_collection)
+
+# Simulasi Monte Carlo antrean maintenance: kerusakan per aset dibangkitkan
+# sebagai renewal process dari interval kerusakan empiris per tipe aset
+# (bootstrap), ditambah jadwal PM yang sudah ada, lalu dilayani FIFO oleh c
+# teknisi. Semua replika disimulasikan sekaligus: state antrean berbentuk
+# (replika, teknisi) dan rekursi Kiefer-Wolfowitz berjalan per job.
+HOUR_SECONDS = 60 * 60
+HISTORY_DAYS = 365
+DEFAULT_HORIZON_DAYS = 90
+MAX_HORIZON_DAYS = 365
+DEFAULT_REPLICAS = 2000
+MAX_REPLICAS = 20000
+MIN_EMPIRICAL_SAMPLES = 5
+DEFAULT_MTBF_HOURS = 30 * 24
+DEFAULT_REPAIR_HOURS = 4.0
+DEFAULT_PM_MINUTES = 60
+# Batas jumlah elemen matriks job (replika x slot); setiap array float64
+# sebesar ini ~80 MB dan generate_jobs/simulate_queue memegang beberapa
+MAX_JOB_ELEMENTS = 10_000_000
+
+# Satu simulasi berjalan pada satu waktu; request lain mengantre
+_executor = ThreadPoolExecutor(max_workers=1)
+
+
+def _hours(seconds):
+    return np.asarray(seconds, dtype=np.float64) / HOUR_SECONDS
+
+
+def load_simulation_inputs(now=None, horizon_days=DEFAULT_HORIZON_DAYS):
+    """Interval kerusakan, durasi perbaikan, jumlah aset per tipe, teknisi dan rencana PM."""
+    now = int(now or time.time())
+    since = now - HISTORY_DAYS * 24 * HOUR_SECONDS
+
+    asset_types = {}
+    for asset in get_asset_collection().find({}, {"name": 1, "type": 1}):
+        asset_types[asset['name']] = asset.get('type') or "lainnya"
+    counts = {asset_type: 0 for asset_type in MACHINE_COMPONENTS}
+    for asset_type in asset_types.values():
+        counts[asset_type] = counts.get(asset_type, 0) + 1
+
+    failures, repairs = {}, {}
+    cursor = get_wo_collection().find(
+        {"type": "Korektif", "timestamp_created": {"$gte": since}},
+        {"_id": 0, "asset_name": 1, "timestamp_created": 1, "timestamp_started": 1, "timestamp_completed": 1}
+    ).sort("timestamp_created", 1)
+    for wo in cursor:
+        asset_type = asset_types.get(wo.get('asset_name'))
+        if asset_type is None:
+            continue
+        failures.setdefault(wo['asset_name'], []).append(wo['timestamp_created'])
+        if wo.get('timestamp_completed'):
+            started = wo.get('timestamp_started') or wo['timestamp_created']
+            if wo['timestamp_completed'] > started:
+                repairs.setdefault(asset_type, []).append(wo['timestamp_completed'] - started)
+
+    intervals = {}
+    failure_counts = {}
+    for asset_name, times in failures.items():
+        asset_type = asset_types[asset_name]
+        failure_counts[asset_type] = failure_counts.get(asset_type, 0) + len(times)
+        intervals.setdefault(asset_type, []).extend(np.diff(times).tolist())
+
+    types = {}
+    for asset_type, n_assets in counts.items():
+        if n_assets == 0:
+            continue
+        observed = _hours([i for i in intervals.get(asset_type, []) if i > 0])
+        if observed.size >= MIN_EMPIRICAL_SAMPLES:
+            interval_model = {"kind": "empirical", "samples": observed}
+        else:
+            # Data sedikit: eksponensial dengan MTBF = jam operasi / jumlah kerusakan
+            failures_seen = failure_counts.get(asset_type, 0)
+            mtbf = n_assets * HISTORY_DAYS * 24 / failures_seen if failures_seen else DEFAULT_MTBF_HOURS
+            interval_model = {"kind": "exponential", "mean": mtbf}
+        repair_hours = _hours(repairs.get(asset_type, []))
+        if repair_hours.size >= MIN_EMPIRICAL_SAMPLES:
+            repair_model = {"kind": "empirical", "samples": repair_hours}
+        else:
+            mean = float(repair_hours.mean()) if repair_hours.size else DEFAULT_REPAIR_HOURS
+            repair_model = {"kind": "exponential", "mean": mean}
+        types[asset_type] = {"assets": n_assets, "interval": interval_model, "repair": repair_model}
+
+    technicians = get_user_collection().count_documents({"role": "Teknisi"})
+
+    horizon_end = now + horizon_days * 24 * HOUR_SECONDS
+    pm_jobs = [
+        ((item['scheduled_date'] - now) / HOUR_SECONDS, (item.get('duration') or DEFAULT_PM_MINUTES) / 60)
+        for item in get_schedule_collection().find(
+            {"status": "Dijadwalkan", "scheduled_date": {"$gte": now, "$lt": horizon_end}},
+            {"scheduled_date": 1, "duration": 1}
+        )
+    ]
+    return {"types": types, "technicians": technicians, "pm_jobs": pm_jobs}
+
+
+def _sample(model, rng, shape):
+    if model["kind"] == "empirical":
+        return rng.choice(model["samples"], size=shape)
+    return rng.exponential(model["mean"], size=shape)
+
+
+def _model_mean(model):
+    return float(np.mean(model["samples"])) if model["kind"] == "empirical" else model["mean"]
+
+
+def _slots_per_asset(model, horizon_hours):
+    mean_interval = max(_model_mean(model["interval"]), 1e-3)
+    return int(np.ceil(horizon_hours / mean_interval * 3)) + 5
+
+
+def estimate_job_elements(inputs, replicas, horizon_hours):
+    """Jumlah elemen matriks job yang akan dibangkitkan generate_jobs."""
+    slots = sum(model["assets"] * _slots_per_asset(model, horizon_hours) for model in inputs["types"].values())
+    return replicas * (slots + len(inputs["pm_jobs"]))
+
+
+def check_simulation_size(inputs, replicas, horizon_days):
+    """Mengembalikan pesan error atau None jika ukuran simulasi masih dalam batas."""
+    if horizon_days > MAX_HORIZON_DAYS:
+        return f"horizon_days maksimal {MAX_HORIZON_DAYS}"
+    elements = estimate_job_elements(inputs, replicas, horizon_days * 24.0)
+    if elements > MAX_JOB_ELEMENTS:
+        return (f"Simulasi terlalu besar: {elements} elemen job (maks. {MAX_JOB_ELEMENTS}), "
+                f"kurangi replicas atau horizon_days")
+    return None
+
+
+def generate_jobs(inputs, replicas, horizon_hours, rng):
+    """Job per replika (arrival, service, is_corrective), terurut per baris.
+
+    Kerusakan tiap aset = renewal process dengan fase awal acak; slot yang
+    jatuh di luar horizon diberi arrival = horizon dan service = 0 sehingga
+    tidak memengaruhi statistik."""
+    arrivals, services, corrective = [], [], []
+    for model in inputs["types"].values():
+        per_asset = _slots_per_asset(model, horizon_hours)
+        shape = (replicas, model["assets"], per_asset)
+        intervals = _sample(model["interval"], rng, shape)
+        times = np.cumsum(intervals, axis=2) - intervals[:, :, :1] * rng.random((replicas, model["assets"], 1))
+        arrivals.append(times.reshape(replicas, -1))
+        services.append(_sample(model["repair"], rng, arrivals[-1].shape))
+        corrective.append(np.ones(arrivals[-1].shape, dtype=bool))
+
+    if inputs["pm_jobs"]:
+        pm = np.asarray(inputs["pm_jobs"], dtype=np.float64)
+        arrivals.append(np.broadcast_to(pm[:, 0], (replicas, len(pm))))
+        services.append(np.broadcast_to(pm[:, 1], (replicas, len(pm))))
+        corrective.append(np.zeros((replicas, len(pm)), dtype=bool))
+
+    if not arrivals:
+        empty = np.zeros((replicas, 0))
+        return empty, empty, empty.astype(bool), empty.astype(bool)
+
+    arrivals = np.concatenate(arrivals, axis=1)
+    services = np.concatenate(services, axis=1)
+    corrective = np.concatenate(corrective, axis=1)
+    valid = arrivals < horizon_hours
+    arrivals = np.where(valid, arrivals, horizon_hours)
+    services = np.where(valid, services, 0.0)
+
+    order = np.argsort(arrivals, axis=1, kind="stable")
+    return tuple(np.take_along_axis(values, order, axis=1) for values in (arrivals, services, corrective, valid))
+
+
+def simulate_queue(arrivals, services, servers):
+    """Waktu tunggu setiap job pada antrean FIFO c-server (Kiefer-Wolfowitz), semua replika sekaligus."""
+    replicas, n_jobs = arrivals.shape
+    workload = np.zeros((replicas, servers))
+    waits = np.zeros((replicas, n_jobs))
+    previous = np.zeros(replicas)
+    for j in range(n_jobs):
+        workload -= (arrivals[:, j] - previous)[:, None]
+        np.maximum(workload, 0, out=workload)
+        waits[:, j] = workload[:, 0]
+        workload[:, 0] += services[:, j]
+        workload.sort(axis=1)
+        previous = arrivals[:, j]
+    return waits
+
+
+def summarize_replicas(waits, services, corrective, valid, servers, n_assets, horizon_hours):
+    corrective_jobs = corrective & valid
+    downtime = np.sum(np.where(corrective_jobs, waits + services, 0), axis=1)
+    availability = np.clip(1 - downtime / max(n_assets * horizon_hours, 1e-9), 0, 1) * 100
+    # Little's law: rata-rata job menunggu = total waktu tunggu / horizon
+    backlog = np.sum(np.where(valid, waits, 0), axis=1) / horizon_hours
+    utilization = np.sum(services, axis=1) / (servers * horizon_hours) * 100
+    corrective_waits = waits[corrective_jobs]
+    if corrective_waits.size == 0:
+        corrective_waits = np.zeros(1)
+
+    return {
+        "technicians": servers,
+        "wait_hours_mean": round(float(corrective_waits.mean()), 2),
+        "wait_hours_p50": round(float(np.percentile(corrective_waits, 50)), 2),
+        "wait_hours_p95": round(float(np.percentile(corrective_waits, 95)), 2),
+        "availability_mean": round(float(availability.mean()), 2),
+        "availability_p5": round(float(np.percentile(availability, 5)), 2),
+        "backlog_jobs_mean": round(float(backlog.mean()), 2),
+        "backlog_jobs_p95": round(float(np.percentile(backlog, 95)), 2),
+        "utilization_mean": round(float(utilization.mean()), 1),
+        "corrective_jobs_mean": round(float(corrective_jobs.sum(axis=1).mean()), 1)
+    }
+
+
+def run_capacity_simulation(staffing_levels=None, replicas=DEFAULT_REPLICAS,
+                            horizon_days=DEFAULT_HORIZON_DAYS, seed=None, inputs=None):
+    """Mensimulasikan beberapa jumlah teknisi dengan job yang sama (common random numbers)."""
+    inputs = inputs or load_simulation_inputs(horizon_days=horizon_days)
+    baseline = max(inputs["technicians"], 1)
+    staffing_levels = sorted({int(level) for level in (staffing_levels or range(max(baseline - 1, 1), baseline + 4)) if int(level) > 0})
+    horizon_hours = horizon_days * 24.0
+    replicas = max(min(int(replicas), MAX_REPLICAS), 1)
+    error = check_simulation_size(inputs, replicas, horizon_days)
+    if error:
+        raise ValueError(error)
+    n_assets = sum(model["assets"] for model in inputs["types"].values())
+
+    rng = np.random.default_rng(seed)
+    arrivals, services, corrective, valid = generate_jobs(inputs, replicas, horizon_hours, rng)
+
+    results = []
+    for servers in staffing_levels:
+        waits = simulate_queue(arrivals, services, servers)
+        results.append(summarize_replicas(waits, services, corrective, valid, servers, n_assets, horizon_hours))
+
+    return {
+        "staffing": results,
+        "baseline_technicians": inputs["technicians"],
+        "assets": n_assets,
+        "pm_jobs": len(inputs["pm_jobs"]),
+        "asset_types": {
+            asset_type: {
+                "assets": model["assets"],
+                "interval_model": model["interval"]["kind"],
+                "mtbf_hours": round(_model_mean(model["interval"]), 1),
+                "repair_model": model["repair"]["kind"],
+                "mean_repair_hours": round(_model_mean(model["repair"]), 2)
+            }
+            for asset_type, model in inputs["types"].items()
+        }
+    }
+
+
+def _execute_run(run_id, params, inputs=None):
+    collection = get_capacity_simulation_collection()
+    started = time.time()
+    collection.update_one({"_id": run_id}, {"$set": {"status": "Berjalan", "started_at": int(started)}})
+    try:
+        result = run_capacity_simulation(**params, inputs=inputs)
+        collection.update_one({"_id": run_id}, {"$set": {
+            "status": "Selesai",
+            "result": result,
+            "finished_at": int(time.time()),
+            "duration_seconds": round(time.time() - started, 2)
+        }})
+    except Exception as e:
+        traceback.print_exc()
+        collection.update_one({"_id": run_id}, {"$set": {
+            "status": "Gagal", "error": str(e), "finished_at": int(time.time())
+        }})
+
+
+def submit_capacity_simulation(params, created_by, inputs=None):
+    """Mencatat run baru dan menjalankannya di background; mengembalikan id run.
+
+    `inputs` yang sudah dimuat (mis. untuk check_simulation_size) dipakai ulang."""
+    run = {
+        "params": params,
+        "status": "Antre",
+        "created_by": created_by,
+        "created_at": int(time.time())
+    }
+    run_id = get_capacity_simulation_collection().insert_one(run).inserted_id
+    _executor.submit(_execute_run, run_id, params, inputs)
+    return str(run_id)
+
+
+def get_capacity_simulation(run_id):
+    run = get_capacity_simulation_collection().find_one({"_id": ObjectId(run_id)})
+    if run:
+        run["_id"] = str(run["_id"])
+    return run
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Simulasi Monte Carlo kapasitas teknisi maintenance")
+    parser.add_argument("--technicians", type=int, nargs="*", help="Jumlah teknisi yang disimulasikan")
+    parser.add_argument("--replicas", type=int, default=DEFAULT_REPLICAS)
+    parser.add_argument("--horizon-days", type=int, default=DEFAULT_HORIZON_DAYS)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    started = time.time()
+    summary = run_capacity_simulation(args.technicians, args.replicas, args.horizon_days, args.seed)
+    print(f"{summary['assets']} aset, {summary['pm_jobs']} job PM, {args.replicas} replika "
+          f"({time.time() - started:.1f} detik)")
+    for row in summary["staffing"]:
+        print(f"  {row['technicians']} teknisi: tunggu rata-rata {row['wait_hours_mean']} jam "
+              f"(p95 {row['wait_hours_p95']}), availability {row['availability_mean']}%, "
+              f"utilisasi {row['utilization_mean']}%")
@@ -0,0 +1,430 @@
+# cold_archive.py
+import argparse
+import hashlib
+import json
+import os
+import re
+import shutil
+import time
+from datetime import datetime
+
+import numpy as np
+from bson import ObjectId
+
+from models import get_energy_collection, get_maintenance_costs_collection
+from energy_analytics import empty_energy_columns, concat_energy_columns, load_energy_columns
+
+# Arsip kolumnar untuk data historis yang sudah melewati masa retensi.
+# Struktur: <ARCHIVE_DIR>/<dataset>/<YYYY-MM>/<aset>/<kolom>.npy + meta.json
+# Setiap partisi diurutkan berdasarkan timestamp sehingga pembaca bisa
+# memotong rentang waktu dengan searchsorted pada file yang di-memory-map.
+# `_id` dokumen sumber ikut disimpan (source_id.npy, 12 byte ObjectId) agar
+# run ulang setelah gagal sebelum delete_many tidak menggandakan baris.
+ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+ARCHIVE_RETENTION_DAYS = int(os.environ.get('ARCHIVE_RETENTION_DAYS', 180))
+
+# Kolom string disimpan sebagai kode integer + kamus di meta.json
+ARCHIVE_DATASETS = {
+    "energy_consumption": {
+        "collection": get_energy_collection,
+        "columns": {
+            "timestamp": "int64",
+            "energy_consumption": "float64",
+            "duration_hours": "float32",
+            "power_consumption": "float64",
+            "units_produced": "float32",
+            "recorded_at": "int64",
+            "recorded_by": "str"
+        }
+    },
+    "maintenance_costs": {
+        "collection": get_maintenance_costs_collection,
+        "columns": {
+            "timestamp": "int64",
+            "amount": "float64",
+            "cost_type": "str",
+            "wo_id": "str",
+            "currency": "str",
+            "description": "str",
+            "department": "str",
+            "recorded_by": "str"
+        }
+    }
+}
+
+DELETE_BATCH_SIZE = 5000
+SOURCE_ID_COLUMN = "source_id"
+SOURCE_ID_DTYPE = "S12"
+
+
+def _month_key(ts):
+    return datetime.fromtimestamp(ts).strftime('%Y-%m')
+
+
+def _month_start(dt):
+    return int(datetime(dt.year, dt.month, 1).timestamp())
+
+
+def _asset_dirname(asset_name):
+    # Slug + hash pendek supaya nama aset yang mirip tidak berbagi direktori
+    asset_name = asset_name or 'unknown'
+    slug = re.sub(r'[^A-Za-z0-9_-]+', '_', asset_name).strip('_') or 'asset'
+    return f"{slug}-{hashlib.md5(asset_name.encode('utf-8')).hexdigest()[:8]}"
+
+
+def _dataset_dir(dataset):
+    return os.path.join(ARCHIVE_DIR, dataset)
+
+
+def _manifest_path(dataset):
+    return os.path.join(_dataset_dir(dataset), 'manifest.json')
+
+
+def get_archived_until(dataset):
+    """Batas atas (eksklusif) timestamp yang sudah dipindah ke arsip, atau None."""
+    try:
+        with open(_manifest_path(dataset)) as f:
+            return json.load(f).get("archived_until")
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_manifest(dataset, archived_until, rows_archived):
+    path = _manifest_path(dataset)
+    previous = {}
+    if os.path.exists(path):
+        with open(path) as f:
+            previous = json.load(f)
+    manifest = {
+        "archived_until": max(archived_until, previous.get("archived_until") or 0),
+        "rows_archived_total": previous.get("rows_archived_total", 0) + rows_archived,
+        "updated_at": int(time.time())
+    }
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+
+
+# =========================================================
+# PARTISI: baca / tulis
+# =========================================================
+
+def _load_partition(directory, schema, mmap=True):
+    """Memuat satu partisi; kolom string dikembalikan sebagai (kode, kamus)."""
+    with open(os.path.join(directory, 'meta.json')) as f:
+        meta = json.load(f)
+    mode = 'r' if mmap else None
+    columns = {}
+    for column, dtype in schema.items():
+        path = os.path.join(directory, f'{column}.npy')
+        if not os.path.exists(path):
+            continue
+        data = np.load(path, mmap_mode=mode)
+        if dtype == "str":
+            columns[column] = (data, meta["dictionaries"].get(column, []))
+        else:
+            columns[column] = data
+    return meta, columns
+
+
+def _decode_strings(encoded):
+    codes, dictionary = encoded
+    return np.asarray(dictionary, dtype=object)[codes] if len(dictionary) else np.full(len(codes), "", dtype=object)
+
+
+def _write_partition(dataset, month_key, asset_name, rows, source_ids):
+    """Menulis (atau menggabungkan dengan) partisi bulan/aset secara atomik.
+
+    Baris yang `_id` sumbernya sudah ada di partisi dilewati; mengembalikan
+    jumlah baris yang benar-benar ditambahkan."""
+    schema = ARCHIVE_DATASETS[dataset]["columns"]
+    directory = os.path.join(_dataset_dir(dataset), month_key, _asset_dirname(asset_name))
+
+    merged = {}
+    for column, dtype in schema.items():
+        values = [row[column] for row in rows]
+        merged[column] = np.array(values, dtype=object if dtype == "str" else dtype)
+    merged[SOURCE_ID_COLUMN] = np.array(source_ids, dtype=SOURCE_ID_DTYPE)
+
+    if os.path.exists(directory):
+        meta, existing = _load_partition(directory, schema, mmap=False)
+        id_path = os.path.join(directory, f'{SOURCE_ID_COLUMN}.npy')
+        # Partisi lama (sebelum source_id disimpan) diisi id kosong
+        old_ids = np.load(id_path) if os.path.exists(id_path) else np.full(meta["rows"], b"", dtype=SOURCE_ID_DTYPE)
+        fresh = ~np.isin(merged[SOURCE_ID_COLUMN], old_ids[old_ids != b""])
+        if not fresh.any():
+            return 0
+        merged = {column: values[fresh] for column, values in merged.items()}
+        for column, dtype in schema.items():
+            if column not in existing:
+                # Kolom baru di skema: partisi lama diisi nilai default
+                old = np.full(meta["rows"], "" if dtype == "str" else 0, dtype=object if dtype == "str" else dtype)
+            elif dtype == "str":
+                old = _decode_strings(existing[column])
+            else:
+                old = existing[column]
+            merged[column] = np.concatenate([old, merged[column]])
+        merged[SOURCE_ID_COLUMN] = np.concatenate([old_ids, merged[SOURCE_ID_COLUMN]])
+        added = int(fresh.sum())
+    else:
+        added = len(rows)
+
+    order = np.argsort(merged["timestamp"], kind='stable')
+    tmp_dir = directory + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    dictionaries = {}
+    for column, dtype in schema.items():
+        values = merged[column][order]
+        if dtype == "str":
+            dictionary, codes = np.unique(values.astype(str), return_inverse=True)
+            code_dtype = np.uint8 if len(dictionary) <= 0xFF else np.uint16 if len(dictionary) <= 0xFFFF else np.int32
+            dictionaries[column] = dictionary.tolist()
+            values = codes.astype(code_dtype)
+        np.save(os.path.join(tmp_dir, f'{column}.npy'), values)
+    np.save(os.path.join(tmp_dir, f'{SOURCE_ID_COLUMN}.npy'), merged[SOURCE_ID_COLUMN][order])
+
+    timestamps = merged["timestamp"][order]
+    meta = {
+        "dataset": dataset,
+        "asset_name": asset_name,
+        "month": month_key,
+        "rows": int(timestamps.size),
+        "min_timestamp": int(timestamps[0]),
+        "max_timestamp": int(timestamps[-1]),
+        "dictionaries": dictionaries
+    }
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+
+    old_dir = directory + '.old'
+    if os.path.exists(directory):
+        os.replace(directory, old_dir)
+    os.replace(tmp_dir, directory)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return added
+
+
+def _iter_partitions(dataset, since, until, asset_name=None, newest_first=False):
+    """Direktori partisi yang bulannya beririsan dengan [since, until)."""
+    root = _dataset_dir(dataset)
+    if not os.path.isdir(root):
+        return
+    first_month = _month_key(since)
+    last_month = _month_key(max(since, until - 1))
+    for month_key in sorted(os.listdir(root), reverse=newest_first):
+        if not re.fullmatch(r'\d{4}-\d{2}', month_key) or not first_month <= month_key <= last_month:
+            continue
+        month_dir = os.path.join(root, month_key)
+        if asset_name:
+            candidates = [_asset_dirname(asset_name)]
+        else:
+            candidates = sorted(name for name in os.listdir(month_dir) if not name.endswith(('.tmp', '.old')))
+        for dirname in candidates:
+            directory = os.path.join(month_dir, dirname)
+            if os.path.isdir(directory):
+                yield directory
+
+
+def _read_range(dataset, since, until, asset_name=None, newest_first=False):
+    """Membaca potongan [since, until) dari setiap partisi (memory-mapped)."""
+    schema = ARCHIVE_DATASETS[dataset]["columns"]
+    for directory in _iter_partitions(dataset, since, until, asset_name, newest_first):
+        meta, columns = _load_partition(directory, schema)
+        if asset_name and meta["asset_name"] != asset_name:
+            continue
+        timestamps = columns["timestamp"]
+        lo = int(np.searchsorted(timestamps, since, side='left'))
+        hi = int(np.searchsorted(timestamps, until, side='left'))
+        if hi > lo:
+            yield meta, columns, lo, hi
+
+
+# =========================================================
+# READER
+# =========================================================
+
+def read_archived_energy(since, until, asset_name=None):
+    """Kolom energi (format energy_analytics) dari arsip untuk [since, until)."""
+    asset_codes = {}
+    parts = {"asset": [], "timestamp": [], "energy": [], "power": [], "units": []}
+    for meta, columns, lo, hi in _read_range("energy_consumption", since, until, asset_name):
+        code = asset_codes.setdefault(meta["asset_name"], len(asset_codes))
+        parts["asset"].append(np.full(hi - lo, code, dtype=np.int32))
+        parts["timestamp"].append(np.asarray(columns["timestamp"][lo:hi], dtype=np.int64))
+        parts["energy"].append(np.asarray(columns["energy_consumption"][lo:hi], dtype=np.float64))
+        parts["power"].append(np.asarray(columns["power_consumption"][lo:hi], dtype=np.float64))
+        if "units_produced" in columns:
+            parts["units"].append(np.asarray(columns["units_produced"][lo:hi], dtype=np.float64))
+        else:
+            parts["units"].append(np.zeros(hi - lo))
+
+    result = empty_energy_columns()
+    result["asset_names"] = list(asset_codes)
+    for key, chunks in parts.items():
+        if chunks:
+            result[key] = np.concatenate(chunks)
+    return result
+
+
+def load_energy_span(since, until=None, asset_name=None, collection=None):
+    """Kolom energi untuk rentang waktu, menggabungkan arsip dan koleksi hot.
+
+    Arsip melayani [since, archived_until), MongoDB melayani sisanya, sehingga
+    dokumen yang sedang dipindahkan tidak pernah terhitung dua kali."""
+    archived_until = get_archived_until("energy_consumption")
+    parts = []
+    if archived_until and since < archived_until:
+        archive_end = archived_until if until is None else min(until, archived_until)
+        parts.append(read_archived_energy(since, archive_end, asset_name))
+        since = archived_until
+    if until is None or since < until:
+        parts.append(load_energy_columns(since, until, asset_name, collection))
+    return concat_energy_columns(*parts)
+
+
+def _source_ids(directory, meta, timestamps, lo, hi):
+    """`_id` sumber baris [lo, hi); partisi lama tanpa source_id diberi id
+    deterministik dari timestamp + posisi baris."""
+    path = os.path.join(directory, f'{SOURCE_ID_COLUMN}.npy')
+    ids = np.array(np.load(path, mmap_mode='r')[lo:hi]) if os.path.exists(path) else np.full(hi - lo, b"", dtype=SOURCE_ID_DTYPE)
+    for offset in np.flatnonzero(ids == b""):
+        seed = f"{meta['dataset']}/{meta['asset_name']}/{meta['month']}/{lo + offset}".encode('utf-8')
+        ids[offset] = int(timestamps[offset]).to_bytes(4, 'big') + hashlib.md5(seed).digest()[:8]
+    return ids
+
+
+def iter_archived_records(dataset, since, until, asset_name, columns):
+    """Baris arsip satu aset dalam [since, until) sebagai dict, terbaru dulu
+    (timestamp, lalu `_id` menurun). Partisi dibaca per bulan dari yang
+    terbaru sehingga pembaca yang berhenti lebih awal tidak memuat semuanya."""
+    for meta, partition, lo, hi in _read_range(dataset, since, until, asset_name, newest_first=True):
+        timestamps = np.asarray(partition["timestamp"][lo:hi], dtype=np.int64)
+        directory = os.path.join(_dataset_dir(dataset), meta["month"], _asset_dirname(meta["asset_name"]))
+        ids = _source_ids(directory, meta, timestamps, lo, hi)
+        values = {}
+        for column in columns:
+            if column not in partition:
+                continue
+            if ARCHIVE_DATASETS[dataset]["columns"][column] == "str":
+                codes, dictionary = partition[column]
+                values[column] = _decode_strings((np.asarray(codes[lo:hi]), dictionary)).tolist()
+            else:
+                values[column] = np.asarray(partition[column][lo:hi]).tolist()
+        for index in np.lexsort((ids, timestamps))[::-1].tolist():
+            record = {column: column_values[index] for column, column_values in values.items()}
+            # numpy membuang byte nol di akhir nilai S12
+            record["_id"] = ObjectId(bytes(ids[index]).ljust(12, b"\0"))
+            record["timestamp"] = int(timestamps[index])
+            yield record
+
+
+def read_archived_costs(since, until):
+    """Breakdown biaya dari arsip untuk [since, until): total, per tipe, per aset, per bulan."""
+    breakdown = {"total_costs": 0.0, "costs_by_type": {}, "costs_by_asset": {}, "monthly_breakdown": {}, "records_count": 0}
+    utc_offset = int(datetime.now().astimezone().utcoffset().total_seconds())
+
+    for meta, columns, lo, hi in _read_range("maintenance_costs", since, until):
+        amounts = np.asarray(columns["amount"][lo:hi], dtype=np.float64)
+        total = float(amounts.sum())
+        breakdown["total_costs"] += total
+        breakdown["records_count"] += int(amounts.size)
+        asset_name = meta["asset_name"]
+        breakdown["costs_by_asset"][asset_name] = breakdown["costs_by_asset"].get(asset_name, 0) + total
+
+        codes, dictionary = columns["cost_type"]
+        per_type = np.bincount(np.asarray(codes[lo:hi], dtype=np.int64), weights=amounts, minlength=len(dictionary))
+        for cost_type, amount in zip(dictionary, per_type.tolist()):
+            if amount:
+                breakdown["costs_by_type"][cost_type] = breakdown["costs_by_type"].get(cost_type, 0) + amount
+
+        # Partisi sudah per bulan, tapi kunci bulan dihitung dari timestamp
+        # agar konsisten dengan zona waktu lokal server
+        months = (np.asarray(columns["timestamp"][lo:hi]) + utc_offset).astype('datetime64[s]').astype('datetime64[M]')
+        unique_months, inverse = np.unique(months, return_inverse=True)
+        per_month = np.bincount(inverse, weights=amounts)
+        for month, amount in zip(unique_months.astype(str).tolist(), per_month.tolist()):
+            breakdown["monthly_breakdown"][month] = breakdown["monthly_breakdown"].get(month, 0) + amount
+
+    return breakdown
+
+
+# =========================================================
+# ARCHIVER
+# =========================================================
+
+def archive_dataset(dataset, retention_days=ARCHIVE_RETENTION_DAYS):
+    """Memindahkan dokumen yang lebih tua dari retensi ke arsip kolumnar.
+
+    Hanya bulan penuh yang diarsip (batas = awal bulan dari now - retensi).
+    Urutan: tulis semua partisi -> update manifest -> hapus dokumen hot.
+    Aman dijalankan ulang setelah gagal di tengah: dokumen yang sudah ada di
+    partisi (berdasarkan `_id`) tidak ditulis lagi."""
+    config = ARCHIVE_DATASETS[dataset]
+    collection = config["collection"]()
+    if collection is None:
+        return {"dataset": dataset, "archived": 0, "message": "Database tidak terkoneksi"}
+
+    cutoff = _month_start(datetime.fromtimestamp(time.time() - retention_days * 24 * 60 * 60))
+    projection = {column: 1 for column in config["columns"]}
+    projection["asset_name"] = 1
+
+    cursor = collection.find({"timestamp": {"$lt": cutoff}}, projection).sort(
+        [("asset_name", 1), ("timestamp", 1)]
+    )
+
+    archived_ids = []
+    partitions = 0
+    added = 0
+    current_key = None
+    rows = []
+    row_ids = []
+
+    for doc in cursor:
+        key = (doc.get("asset_name"), _month_key(doc["timestamp"]))
+        if key != current_key and rows:
+            added += _write_partition(dataset, current_key[1], current_key[0], rows, row_ids)
+            partitions += 1
+            rows, row_ids = [], []
+        current_key = key
+
+        row = {}
+        for column, dtype in config["columns"].items():
+            value = doc.get(column)
+            if dtype == "str":
+                row[column] = "" if value is None else str(value)
+            else:
+                row[column] = value or 0
+        rows.append(row)
+        row_ids.append(doc["_id"].binary)
+        archived_ids.append(doc["_id"])
+
+    if rows:
+        added += _write_partition(dataset, current_key[1], current_key[0], rows, row_ids)
+        partitions += 1
+
+    os.makedirs(_dataset_dir(dataset), exist_ok=True)
+    _write_manifest(dataset, cutoff, added)
+
+    for start in range(0, len(archived_ids), DELETE_BATCH_SIZE):
+        collection.delete_many({"_id": {"$in": archived_ids[start:start + DELETE_BATCH_SIZE]}})
+
+    return {
+        "dataset": dataset,
+        "archived": len(archived_ids),
+        "partitions": partitions,
+        "archived_until": cutoff
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Arsip data energi & biaya ke file kolumnar")
+    parser.add_argument("--retention-days", type=int, default=ARCHIVE_RETENTION_DAYS)
+    parser.add_argument("--dataset", choices=list(ARCHIVE_DATASETS), action='append')
+    args = parser.parse_args()
+
+    for dataset in args.dataset or list(ARCHIVE_DATASETS):
+        summary = archive_dataset(dataset, args.retention_days)
+        print(f"{dataset}: {summary['archived']} dokumen diarsip ke {summary.get('partitions', 0)} partisi")
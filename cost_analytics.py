@@ -0,0 +1,171 @@
+# cost_analytics.py
+import time
+from datetime import datetime
+
+from models import get_maintenance_costs_collection
+
+
+def local_timezone_offset():
+    """Offset zona waktu server dalam format yang diterima MongoDB, misal +0700."""
+    return datetime.now().astimezone().strftime('%z')
+
+
+def quarter_of_month(month):
+    return (month - 1) // 3 + 1
+
+
+def quarter_bounds(year, quarter):
+    """Timestamp awal dan akhir (eksklusif) sebuah kuartal, waktu lokal."""
+    start = datetime(year, 3 * (quarter - 1) + 1, 1)
+    end = datetime(year + 1, 1, 1) if quarter == 4 else datetime(year, 3 * quarter + 1, 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def _date_from_timestamp(field):
+    return {"$toDate": {"$multiply": [field, 1000]}}
+
+
+def build_cost_analysis_pipeline(since, budget_from_year, timezone=None):
+    """Pipeline tunggal: biaya per tipe, aset, bulan dan per kuartal + budget.
+
+    Dokumen maintenance_budget digabung ke stream lewat $unionWith sehingga
+    kuartal yang punya budget tetapi belum ada biaya tetap muncul."""
+    timezone = timezone or local_timezone_offset()
+    cost_date = _date_from_timestamp("$timestamp")
+    only_costs = {"$match": {"_budget": {"$exists": False}}}
+
+    return [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$project": {"asset_name": 1, "cost_type": 1, "amount": 1, "_date": cost_date}},
+        {"$unionWith": {
+            "coll": "maintenance_budget",
+            "pipeline": [
+                {"$match": {"year": {"$gte": budget_from_year}}},
+                {"$project": {"_id": 0, "year": 1, "quarter": 1, "_budget": "$amount"}}
+            ]
+        }},
+        {"$facet": {
+            "total": [
+                only_costs,
+                {"$group": {"_id": None, "amount": {"$sum": "$amount"}, "count": {"$sum": 1}}}
+            ],
+            "by_type": [
+                only_costs,
+                {"$group": {"_id": "$cost_type", "amount": {"$sum": "$amount"}}}
+            ],
+            "by_asset": [
+                only_costs,
+                {"$group": {"_id": "$asset_name", "amount": {"$sum": "$amount"}}}
+            ],
+            "by_month": [
+                only_costs,
+                {"$group": {
+                    "_id": {"$dateToString": {
+                        "format": "%Y-%m",
+                        "date": {"$dateTrunc": {"date": "$_date", "unit": "month", "timezone": timezone}},
+                        "timezone": timezone
+                    }},
+                    "amount": {"$sum": "$amount"}
+                }}
+            ],
+            "by_quarter": [
+                {"$group": {
+                    "_id": {
+                        "year": {"$ifNull": ["$year", {"$year": {"date": "$_date", "timezone": timezone}}]},
+                        "quarter": {"$ifNull": ["$quarter", {"$ceil": {
+                            "$divide": [{"$month": {"date": "$_date", "timezone": timezone}}, 3]
+                        }}]}
+                    },
+                    "actual": {"$sum": {"$cond": [{"$ifNull": ["$_budget", False]}, 0, "$amount"]}},
+                    "budget": {"$sum": {"$ifNull": ["$_budget", 0]}}
+                }}
+            ]
+        }}
+    ]
+
+
+def budget_vs_actual(quarters, now=None):
+    """Menghitung realisasi vs budget, burn rate dan proyeksi akhir kuartal.
+
+    `quarters` berisi {(year, quarter): {"actual": x, "budget": y}}."""
+    now = now or int(time.time())
+    report = {}
+
+    for (year, quarter), values in sorted(quarters.items()):
+        start, end = quarter_bounds(year, quarter)
+        if start > now:
+            continue
+
+        actual = values.get("actual", 0)
+        budget = values.get("budget", 0)
+        days_in_quarter = (end - start) / 86400
+        days_elapsed = min(max((now - start) / 86400, 1), days_in_quarter)
+
+        burn_rate = actual / days_elapsed
+        projected = burn_rate * days_in_quarter if now < end else actual
+
+        report[f"{year}-Q{quarter}"] = {
+            "year": year,
+            "quarter": quarter,
+            "budget": budget,
+            "actual": actual,
+            "remaining": budget - actual,
+            "utilization": round(actual / budget * 100, 1) if budget > 0 else None,
+            "burn_rate_per_day": round(burn_rate, 2),
+            "days_elapsed": round(days_elapsed, 1),
+            "days_in_quarter": round(days_in_quarter),
+            "projected_quarter_end": round(projected, 2),
+            "projected_overrun": round(max(projected - budget, 0), 2) if budget > 0 else None,
+            "is_current": start <= now < end
+        }
+
+    return report
+
+
+def aggregate_costs(since, budget_from_year, collection=None):
+    """Menjalankan pipeline analisis biaya dan mengembalikan hasil ter-normalisasi."""
+    if collection is None:
+        collection = get_maintenance_costs_collection()
+
+    result = next(collection.aggregate(build_cost_analysis_pipeline(since, budget_from_year)), {})
+    total = (result.get("total") or [{}])[0]
+
+    return {
+        "total_costs": total.get("amount", 0),
+        "records_count": total.get("count", 0),
+        "costs_by_type": {row["_id"]: row["amount"] for row in result.get("by_type", [])},
+        "costs_by_asset": {row["_id"]: row["amount"] for row in result.get("by_asset", [])},
+        "monthly_breakdown": {row["_id"]: row["amount"] for row in sorted(result.get("by_month", []), key=lambda r: r["_id"])},
+        "quarters": {
+            (int(row["_id"]["year"]), int(row["_id"]["quarter"])): {"actual": row["actual"], "budget": row["budget"]}
+            for row in result.get("by_quarter", [])
+            if row["_id"].get("year") is not None and row["_id"].get("quarter") is not None
+        }
+    }
+
+
+def merge_cost_breakdowns(base, extra):
+    """Menambahkan breakdown `extra` (misal dari arsip) ke `base`.
+
+    Jika `extra` tidak punya data per kuartal, kuartal diturunkan dari
+    monthly_breakdown-nya."""
+    base["total_costs"] += extra.get("total_costs", 0)
+    base["records_count"] = base.get("records_count", 0) + extra.get("records_count", 0)
+    for key in ("costs_by_type", "costs_by_asset", "monthly_breakdown"):
+        for name, amount in extra.get(key, {}).items():
+            base[key][name] = base[key].get(name, 0) + amount
+
+    extra_quarters = extra.get("quarters")
+    if extra_quarters is None:
+        extra_quarters = {}
+        for month_key, amount in extra.get("monthly_breakdown", {}).items():
+            year, month = (int(part) for part in month_key.split('-'))
+            bucket = extra_quarters.setdefault((year, quarter_of_month(month)), {"actual": 0})
+            bucket["actual"] += amount
+    for key, values in extra_quarters.items():
+        bucket = base["quarters"].setdefault(key, {"actual": 0, "budget": 0})
+        bucket["actual"] += values.get("actual", 0)
+        bucket["budget"] += values.get("budget", 0)
+
+    base["monthly_breakdown"] = dict(sorted(base["monthly_breakdown"].items()))
+    return base
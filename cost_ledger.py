@@ -0,0 +1,172 @@
+# cost_ledger.py
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import ASCENDING
+
+from models import get_maintenance_costs_collection, get_cost_ledger_collection, get_maintenance_budget_collection
+from cost_analytics import local_timezone_offset, quarter_of_month
+from cold_archive import get_archived_until
+
+# Ledger berisi total berjalan per (tahun, bulan, aset, tipe biaya,
+# departemen). Kuartal disimpan ikut di setiap baris agar laporan kuartalan
+# cukup membaca beberapa baris tanpa menjumlah ulang dokumen biaya mentah.
+LEDGER_KEY_FIELDS = ("year", "month", "asset_name", "cost_type", "department")
+DEFAULT_DEPARTMENT = "Maintenance"
+
+
+def ensure_cost_ledger_indexes():
+    ledger = get_cost_ledger_collection()
+    ledger.create_index([(field, ASCENDING) for field in LEDGER_KEY_FIELDS], unique=True, name="ledger_key")
+    ledger.create_index([("year", ASCENDING), ("quarter", ASCENDING)], name="ledger_quarter")
+    ledger.create_index([("period_start", ASCENDING)], name="ledger_period_start")
+
+
+def ledger_key(timestamp, asset_name, cost_type, department=None):
+    period = datetime.fromtimestamp(timestamp)
+    return {
+        "year": period.year,
+        "month": period.month,
+        "asset_name": asset_name,
+        "cost_type": cost_type,
+        "department": department or DEFAULT_DEPARTMENT
+    }
+
+
+def record_cost_in_ledger(cost_data):
+    """Menambahkan satu baris biaya ke ledger dengan $inc atomik (upsert)."""
+    key = ledger_key(cost_data['timestamp'], cost_data['asset_name'], cost_data['cost_type'], cost_data.get('department'))
+    period_start = int(datetime(key["year"], key["month"], 1).timestamp())
+
+    get_cost_ledger_collection().update_one(
+        key,
+        {
+            "$inc": {"amount": cost_data['amount'], "count": 1},
+            "$set": {"updated_at": int(time.time())},
+            "$setOnInsert": {"quarter": quarter_of_month(key["month"]), "period_start": period_start}
+        },
+        upsert=True
+    )
+
+
+def rebuild_cost_ledger():
+    """Rekonsiliasi: membangun ulang ledger dari maintenance_costs.
+
+    Hanya periode yang masih ada di koleksi hot (>= batas arsip) yang dibangun
+    ulang; baris ledger untuk bulan yang sudah diarsip dipertahankan. Hasil
+    di-$merge dengan penanda rebuild_id, lalu baris lama yang tidak tersentuh
+    dihapus, sehingga pembaca tidak pernah melihat ledger kosong.
+    Increment yang masuk tepat saat pipeline berjalan bisa tertimpa; jalankan
+    di luar jam sibuk."""
+    ensure_cost_ledger_indexes()
+    since = get_archived_until("maintenance_costs") or 0
+    timezone = local_timezone_offset()
+    rebuild_id = uuid.uuid4().hex
+    now = int(time.time())
+
+    pipeline = [
+        {"$match": {"timestamp": {"$gte": since}}},
+        {"$addFields": {"_parts": {"$dateToParts": {
+            "date": {"$toDate": {"$multiply": ["$timestamp", 1000]}},
+            "timezone": timezone
+        }}}},
+        {"$group": {
+            "_id": {
+                "year": "$_parts.year",
+                "month": "$_parts.month",
+                "asset_name": "$asset_name",
+                "cost_type": "$cost_type",
+                "department": {"$ifNull": ["$department", DEFAULT_DEPARTMENT]}
+            },
+            "amount": {"$sum": "$amount"},
+            "count": {"$sum": 1}
+        }},
+        {"$project": {
+            "_id": 0,
+            "year": "$_id.year",
+            "month": "$_id.month",
+            "quarter": {"$ceil": {"$divide": ["$_id.month", 3]}},
+            "asset_name": "$_id.asset_name",
+            "cost_type": "$_id.cost_type",
+            "department": "$_id.department",
+            "period_start": {"$toLong": {"$divide": [{"$toLong": {"$dateFromParts": {
+                "year": "$_id.year", "month": "$_id.month", "day": 1, "timezone": timezone
+            }}}, 1000]}},
+            "amount": 1,
+            "count": 1,
+            "updated_at": {"$literal": now},
+            "rebuild_id": {"$literal": rebuild_id}
+        }},
+        {"$merge": {
+            "into": get_cost_ledger_collection().name,
+            "on": list(LEDGER_KEY_FIELDS),
+            "whenMatched": "replace",
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+    get_maintenance_costs_collection().aggregate(pipeline)
+    stale = get_cost_ledger_collection().delete_many({
+        "period_start": {"$gte": since},
+        "rebuild_id": {"$ne": rebuild_id}
+    })
+
+    return {
+        "rebuild_id": rebuild_id,
+        "rebuilt_from": since,
+        "rows": get_cost_ledger_collection().count_documents({"rebuild_id": rebuild_id}),
+        "stale_rows_removed": stale.deleted_count
+    }
+
+
+def get_ledger_report(year, quarter=None, month=None, department=None):
+    """Total biaya dari ledger untuk satu periode, lengkap dengan budget kuartal."""
+    query = {"year": year}
+    if quarter:
+        query["quarter"] = quarter
+    if month:
+        query["month"] = month
+    if department:
+        query["department"] = department
+
+    report = {
+        "year": year,
+        "quarter": quarter,
+        "month": month,
+        "total": 0,
+        "count": 0,
+        "by_asset": {},
+        "by_cost_type": {},
+        "by_department": {},
+        "by_month": {}
+    }
+
+    for row in get_cost_ledger_collection().find(query, {"_id": 0}):
+        amount = row.get("amount", 0)
+        report["total"] += amount
+        report["count"] += row.get("count", 0)
+        for bucket, field in (("by_asset", "asset_name"), ("by_cost_type", "cost_type"), ("by_department", "department")):
+            report[bucket][row[field]] = report[bucket].get(row[field], 0) + amount
+        month_key = f"{row['year']}-{row['month']:02d}"
+        report["by_month"][month_key] = report["by_month"].get(month_key, 0) + amount
+
+    report["by_month"] = dict(sorted(report["by_month"].items()))
+
+    budget_query = {"year": year}
+    if quarter:
+        budget_query["quarter"] = quarter
+    if department:
+        budget_query["department"] = department
+    budget = sum(doc.get("amount", 0) for doc in get_maintenance_budget_collection().find(budget_query, {"amount": 1}))
+    if month is None:
+        report["budget"] = budget
+        report["remaining"] = budget - report["total"]
+        report["utilization"] = round(report["total"] / budget * 100, 1) if budget > 0 else None
+
+    return report
+
+
+if __name__ == '__main__':
+    summary = rebuild_cost_ledger()
+    print(f"Ledger dibangun ulang: {summary['rows']} baris, {summary['stale_rows_removed']} baris lama dihapus")
@@ -0,0 +1,261 @@
+# dispatch_optimizer.py
+import time
+
+import numpy as np
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from models import get_wo_collection, get_user_collection
+from technician_capacity import index as capacity_index, DEFAULT_WO_MINUTES
+from wo_events import make_event, append_events, EVENT_ASSIGNED
+
+# Dispatch otomatis WO `Baru`: setiap pasangan (WO, teknisi) diberi nilai
+# urgensi WO x kecocokan skill teknisi pada tipe aset, dikurangi penalti
+# beban kuadratik teknisi (supaya pekerjaan tersebar). Penugasan dibangun
+# greedy (WO paling mendesak dulu, ke teknisi dengan marginal gain terbesar
+# yang kapasitasnya masih cukup), lalu diperbaiki dengan local search
+# relokasi. Semua perhitungan per baris memakai vektor NumPy atas teknisi.
+HOUR_SECONDS = 60 * 60
+SKILL_HISTORY_DAYS = 365
+DISPATCH_HORIZON_HOURS = 8
+PRIORITY_WEIGHT = {"Kritis": 4.0, "Tinggi": 3.0, "Sedang": 2.0, "Rendah": 1.0}
+SLA_HOURS = {"Kritis": 4, "Tinggi": 8, "Sedang": 24, "Rendah": 72}
+SLA_AGE_CAP = 3.0
+SKILL_FLOOR = 0.2
+LOAD_PENALTY = 0.5
+MAX_IMPROVE_PASSES = 5
+MIN_GAIN = 1e-9
+
+
+def urgency_of(priority, age_hours):
+    """Bobot prioritas, naik linear dengan umur WO relatif terhadap SLA-nya."""
+    sla = SLA_HOURS.get(priority, SLA_HOURS["Sedang"])
+    weight = PRIORITY_WEIGHT.get(priority, PRIORITY_WEIGHT["Sedang"])
+    return weight * (1 + min(max(age_hours, 0) / sla, SLA_AGE_CAP))
+
+
+def _load_cost(load, capacity):
+    return LOAD_PENALTY * load * load / capacity
+
+
+def solve_dispatch(urgency, duration, skill, load, capacity):
+    """Penugasan WO -> indeks teknisi (-1 jika tidak ada kapasitas).
+
+    urgency, duration: (W,) ; skill: (W, T) dalam [0, 1] ;
+    load, capacity: (T,) jam. `load` tidak diubah."""
+    urgency = np.asarray(urgency, dtype=np.float64)
+    duration = np.asarray(duration, dtype=np.float64)
+    value = urgency[:, None] * (SKILL_FLOOR + np.asarray(skill, dtype=np.float64))
+    load = np.array(load, dtype=np.float64)
+    capacity = np.maximum(np.asarray(capacity, dtype=np.float64), 1e-6)
+    assignment = np.full(len(urgency), -1, dtype=np.int64)
+    if not len(urgency) or not len(capacity):
+        return assignment, load
+
+    def insert_gain(w):
+        after = load + duration[w]
+        gain = value[w] - (_load_cost(after, capacity) - _load_cost(load, capacity))
+        gain[after > capacity + 1e-9] = -np.inf
+        return gain
+
+    # Greedy: WO paling mendesak memilih duluan
+    for w in np.argsort(-urgency, kind="stable"):
+        gain = insert_gain(w)
+        t = int(np.argmax(gain))
+        if np.isfinite(gain[t]):
+            assignment[w] = t
+            load[t] += duration[w]
+
+    # Local search: pindahkan satu WO ke teknisi lain bila total nilai naik
+    for _ in range(MAX_IMPROVE_PASSES):
+        improved = False
+        for w in np.flatnonzero(assignment >= 0):
+            current = assignment[w]
+            load[current] -= duration[w]
+            gain = insert_gain(w)
+            t = int(np.argmax(gain))
+            if t != current and gain[t] > gain[current] + MIN_GAIN:
+                assignment[w] = t
+                improved = True
+            load[assignment[w]] += duration[w]
+        # Kapasitas yang bergeser bisa memberi tempat bagi WO yang belum tertampung
+        for w in np.flatnonzero(assignment < 0)[np.argsort(-urgency[assignment < 0], kind="stable")]:
+            gain = insert_gain(w)
+            t = int(np.argmax(gain))
+            if np.isfinite(gain[t]):
+                assignment[w] = t
+                load[t] += duration[w]
+                improved = True
+        if not improved:
+            break
+    return assignment, load
+
+
+def load_skill_matrix(usernames, asset_types, now):
+    """Skill (tipe aset x teknisi) dari jumlah WO yang diselesaikan setahun terakhir.
+
+    Dinormalisasi log per tipe aset (teknisi paling berpengalaman = 1);
+    tipe aset di field `skills` user dianggap dikuasai penuh."""
+    type_index = {asset_type: i for i, asset_type in enumerate(asset_types)}
+    tech_index = {username: j for j, username in enumerate(usernames)}
+    counts = np.zeros((len(asset_types), len(usernames)))
+    for row in get_wo_collection().aggregate([
+        {"$match": {
+            "status": {"$in": ["Selesai", "Ditutup"]},
+            "assigned_to": {"$in": list(usernames)},
+            "timestamp_created": {"$gte": now - SKILL_HISTORY_DAYS * 24 * HOUR_SECONDS}
+        }},
+        {"$group": {"_id": {"technician": "$assigned_to", "asset_type": "$asset_type"}, "count": {"$sum": 1}}}
+    ]):
+        i = type_index.get(row['_id'].get('asset_type'))
+        j = tech_index.get(row['_id'].get('technician'))
+        if i is not None and j is not None:
+            counts[i, j] = row['count']
+
+    experience = np.log1p(counts)
+    top = experience.max(axis=1, keepdims=True)
+    skill = np.divide(experience, top, out=np.zeros_like(experience), where=top > 0)
+    for user in get_user_collection().find({"username": {"$in": list(usernames)}, "skills": {"$exists": True}},
+                                           {"username": 1, "skills": 1}):
+        for asset_type in user.get('skills') or []:
+            if asset_type in type_index:
+                skill[type_index[asset_type], tech_index[user['username']]] = 1.0
+    return skill
+
+
+def plan_dispatch(now=None, horizon_hours=DISPATCH_HORIZON_HOURS):
+    """Rencana penugasan semua WO `Baru` (tanpa menulis ke database)."""
+    started_at = time.perf_counter()
+    now = int(now or time.time())
+    horizon_end = now + int(horizon_hours * HOUR_SECONDS)
+
+    wos = list(get_wo_collection().find(
+        {"status": "Baru"},
+        {"asset_name": 1, "asset_type": 1, "priority": 1, "description": 1, "timestamp_created": 1, "estimated_duration": 1}
+    ))
+    technicians = list(get_user_collection().find({"role": "Teknisi"}, {"username": 1, "name": 1}))
+    usernames = [technician['username'] for technician in technicians]
+
+    age_hours = np.array([(now - (wo.get('timestamp_created') or now)) / HOUR_SECONDS for wo in wos])
+    priorities = [wo.get('priority') or "Sedang" for wo in wos]
+    urgency = np.array([urgency_of(priority, age) for priority, age in zip(priorities, age_hours)])
+    duration = np.array([int(wo.get('estimated_duration') or DEFAULT_WO_MINUTES) / 60 for wo in wos])
+
+    asset_types = sorted({wo.get('asset_type') or "" for wo in wos})
+    type_row = np.array([asset_types.index(wo.get('asset_type') or "") for wo in wos], dtype=np.int64)
+    skill = load_skill_matrix(usernames, asset_types, now)[type_row] if wos else np.zeros((0, len(usernames)))
+
+    # Beban awal = jam yang sudah terisi jadwal / WO aktif dalam horizon
+    load = np.array([capacity_index.busy_seconds(username, now, horizon_end) / HOUR_SECONDS for username in usernames])
+    capacity = np.full(len(usernames), float(horizon_hours))
+    assignment, final_load = solve_dispatch(urgency, duration, skill, load, capacity)
+
+    names = {technician['username']: technician.get('name', technician['username']) for technician in technicians}
+    assignments, unassigned = [], []
+    for w in np.argsort(-urgency, kind="stable"):
+        wo = wos[w]
+        item = {
+            "wo_id": str(wo['_id']),
+            "asset_name": wo.get('asset_name'),
+            "asset_type": wo.get('asset_type'),
+            "description": wo.get('description'),
+            "priority": priorities[w],
+            "age_hours": round(float(age_hours[w]), 1),
+            "sla_breached": bool(age_hours[w] > SLA_HOURS.get(priorities[w], SLA_HOURS["Sedang"])),
+            "estimated_minutes": int(round(duration[w] * 60)),
+            "urgency": round(float(urgency[w]), 2)
+        }
+        t = int(assignment[w])
+        if t < 0:
+            unassigned.append(item)
+            continue
+        item.update({"technician": usernames[t], "technician_name": names[usernames[t]], "skill": round(float(skill[w, t]), 2)})
+        assignments.append(item)
+
+    return {
+        "generated_at": now,
+        "horizon_hours": horizon_hours,
+        "assignments": assignments,
+        "unassigned": unassigned,
+        "technicians": [
+            {
+                "username": username,
+                "name": names[username],
+                "load_hours_before": round(float(load[j]), 1),
+                "load_hours_after": round(float(final_load[j]), 1),
+                "capacity_hours": float(horizon_hours)
+            }
+            for j, username in enumerate(usernames)
+        ],
+        "elapsed_ms": round((time.perf_counter() - started_at) * 1000, 1)
+    }
+
+
+def apply_dispatch(assignments, now=None, actor=None):
+    """Tulis penugasan secara bulk. Hanya WO yang masih `Baru` yang diubah.
+
+    Interval tiap WO diurutkan per teknisi mulai dari slot kosong pertama
+    (disimpan sebagai `planned_start`); hanya WO yang benar-benar tertulis
+    yang dimasukkan ke index kapasitas."""
+    now = int(now or time.time())
+    usernames = sorted({item['technician'] for item in assignments})
+    names = {user['username']: user.get('name', user['username'])
+             for user in get_user_collection().find({"username": {"$in": usernames}, "role": "Teknisi"}, {"username": 1, "name": 1})}
+    wo_ids = [ObjectId(item['wo_id']) for item in assignments]
+    wos = {wo['_id']: wo for wo in get_wo_collection().find(
+        {"_id": {"$in": wo_ids}, "status": "Baru"},
+        {"estimated_duration": 1, "asset_name": 1, "description": 1, "type": 1, "timestamp_created": 1}
+    )}
+
+    operations, planned, skipped = [], [], []
+    cursor = {}
+    for item, wo_id in zip(assignments, wo_ids):
+        technician = item['technician']
+        if wo_id not in wos or technician not in names:
+            skipped.append(item['wo_id'])
+            continue
+        wo = wos[wo_id]
+        duration = int(wo.get('estimated_duration') or DEFAULT_WO_MINUTES) * 60
+        start = capacity_index.next_free_slot(technician, duration, cursor.get(technician, now), within_work_hours=False)
+        start = start or cursor.get(technician, now)
+        cursor[technician] = start + duration
+        planned.append((technician, wo, start, start + duration))
+        operations.append(UpdateOne(
+            {"_id": wo_id, "status": "Baru"},
+            {"$set": {
+                "status": "Ditugaskan",
+                "assigned_to": technician,
+                "technician": names[technician],
+                "timestamp_assigned": now,
+                "planned_start": start,
+                "dispatched_by": "auto"
+            }}
+        ))
+
+    modified = get_wo_collection().bulk_write(operations, ordered=False).modified_count if operations else 0
+    written = set()
+    if modified:
+        # Hanya WO yang benar-benar berubah oleh batch ini (masih `Baru` saat ditulis)
+        written = {wo['_id'] for wo in get_wo_collection().find(
+            {"_id": {"$in": [wo['_id'] for _, wo, _, _ in planned]}, "timestamp_assigned": now, "dispatched_by": "auto"},
+            {"_id": 1}
+        )}
+        for technician, wo, start, end in planned:
+            if wo['_id'] in written:
+                capacity_index.upsert(technician, f"wo:{wo['_id']}", start, end,
+                                      {"kind": "wo", "asset_name": wo.get('asset_name'), "description": wo.get('description')})
+        append_events([
+            make_event(wo, EVENT_ASSIGNED, actor, now, technician=technician, previous_technician=None,
+                       previous_status="Baru", created_at=wo.get('timestamp_created'), planned_start=start)
+            for technician, wo, start, _ in planned if wo['_id'] in written
+        ])
+    # WO yang sudah diambil proses lain di antara find dan bulk_write
+    skipped += [str(wo['_id']) for _, wo, _, _ in planned if wo['_id'] not in written]
+    return {
+        "assigned": modified,
+        "skipped": skipped,
+        "planned": [
+            {"wo_id": str(wo['_id']), "technician": technician, "planned_start": start, "planned_end": end}
+            for technician, wo, start, end in planned if wo['_id'] in written
+        ]
+    }
@@ -0,0 +1,140 @@
+# failure_pareto.py
+import time
+
+from pymongo import ASCENDING
+
+from models import get_wo_collection
+
+# Analisis Pareto kegagalan dari WO yang sudah diselesaikan teknisi
+# (`component_failed`, `root_cause`, `asset_type`). Semua dimensi dihitung
+# dalam satu aggregation $facet; label dinormalisasi (trim, case-insensitive)
+# dan isian kosong/default ("Data belum diisi") dikelompokkan sebagai
+# UNKNOWN_LABEL. Downtime = timestamp_completed - timestamp_created, sama
+# dengan definisi mttr_calculator.
+CLOSED_STATUSES = ["Selesai", "Ditutup"]
+DIMENSIONS = {
+    "component": "$component_failed",
+    "asset_type": "$asset_type",
+    "root_cause": "$root_cause",
+    "asset": "$asset_name",
+}
+METRICS = ("failures", "downtime")
+UNKNOWN_LABEL = "Tidak diisi"
+UNKNOWN_VALUES = ["", "data belum diisi", "n/a", "-", "tidak ada data", "belum diisi"]
+VITAL_FEW_SHARE = 80
+DEFAULT_WINDOW_DAYS = 90
+DEFAULT_TOP = 10
+
+
+def ensure_pareto_indexes():
+    get_wo_collection().create_index(
+        [("status", ASCENDING), ("timestamp_completed", ASCENDING)], name="status_completed"
+    )
+
+
+def _label(field):
+    """Ekspresi label bersih untuk satu field (UNKNOWN_LABEL bila kosong/default)."""
+    return {"$let": {
+        "vars": {"value": {"$trim": {"input": {"$toString": {"$ifNull": [field, ""]}}}}},
+        "in": {"$cond": [{"$in": [{"$toLower": "$$value"}, UNKNOWN_VALUES]}, UNKNOWN_LABEL, "$$value"]}
+    }}
+
+
+def _group_stage(field):
+    return {"$group": {
+        "_id": {"$toLower": field},
+        "label": {"$first": field},
+        "failures": {"$sum": 1},
+        "downtime": {"$sum": "$downtime"}
+    }}
+
+
+def build_pareto_pipeline(date_from, date_to, wo_type=None):
+    """Pipeline tunggal: jumlah kegagalan & downtime per komponen, tipe aset,
+    akar masalah dan aset, plus total."""
+    match = {"status": {"$in": CLOSED_STATUSES}, "timestamp_completed": {"$gte": date_from, "$lt": date_to}}
+    if wo_type:
+        match["type"] = wo_type
+
+    projection = {"_id": 0, "downtime": {"$max": [0, {"$subtract": [
+        "$timestamp_completed", {"$ifNull": ["$timestamp_created", "$timestamp_completed"]}
+    ]}]}}
+    projection.update({name: _label(field) for name, field in DIMENSIONS.items()})
+
+    facets = {name: [_group_stage(f"${name}")] for name in DIMENSIONS}
+    # component_failed bisa berisi beberapa komponen dipisah koma ("Bearing, Seal")
+    parts = {"$filter": {"input": {"$split": ["$component", ","]}, "cond": {"$ne": [{"$trim": {"input": "$$this"}}, ""]}}}
+    facets["component"] = [
+        {"$set": {"component": {"$cond": [
+            {"$eq": [{"$size": parts}, 0]}, [UNKNOWN_LABEL], {"$map": {"input": parts, "in": _label("$$this")}}
+        ]}}},
+        {"$unwind": "$component"},
+        _group_stage("$component")
+    ]
+    facets["total"] = [{"$group": {"_id": None, "failures": {"$sum": 1}, "downtime": {"$sum": "$downtime"}}}]
+
+    return [
+        {"$match": match},
+        {"$project": projection},
+        {"$facet": facets}
+    ]
+
+
+def pareto_table(rows, metric, total, top=DEFAULT_TOP):
+    """Urutkan baris menurut metric, hitung share & kumulatif, tandai vital few.
+
+    Baris di luar `top` diringkas menjadi satu baris "others"."""
+    rows = sorted(rows, key=lambda row: (-row[metric], -row["failures"], row["label"]))
+    table, cumulative = [], 0
+    for row in rows:
+        value = row[metric]
+        share = value / total * 100 if total else 0
+        table.append({
+            "label": row["label"],
+            "failures": row["failures"],
+            "downtime_hours": round(row["downtime"] / 3600, 2),
+            "mttr_hours": round(row["downtime"] / row["failures"] / 3600, 2) if row["failures"] else 0,
+            "share": round(share, 1),
+            "cumulative_share": round((cumulative + value) / total * 100, 1) if total else 0,
+            # termasuk baris yang melewati ambang 80%
+            "vital_few": total > 0 and cumulative / total * 100 < VITAL_FEW_SHARE
+        })
+        cumulative += value
+
+    others = table[top:]
+    return {
+        "rows": table[:top],
+        "others": {
+            "count": len(others),
+            "failures": sum(row["failures"] for row in others),
+            "downtime_hours": round(sum(row["downtime_hours"] for row in others), 2)
+        },
+        "distinct": len(table),
+        "vital_few_count": sum(1 for row in table if row["vital_few"])
+    }
+
+
+def failure_pareto(date_from, date_to, wo_type=None, metric="failures", top=DEFAULT_TOP, collection=None):
+    """Tabel Pareto semua dimensi untuk WO yang selesai dalam [date_from, date_to)."""
+    if collection is None:
+        collection = get_wo_collection()
+
+    result = next(collection.aggregate(build_pareto_pipeline(date_from, date_to, wo_type)), {})
+    total = (result.get("total") or [{}])[0]
+    totals = {"failures": total.get("failures", 0), "downtime": total.get("downtime", 0)}
+
+    report = {
+        "from": date_from,
+        "to": date_to,
+        "type": wo_type,
+        "metric": metric,
+        "total_failures": totals["failures"],
+        "total_downtime_hours": round(totals["downtime"] / 3600, 2),
+        "generated_at": int(time.time())
+    }
+    for name in DIMENSIONS:
+        # Satu WO bisa menyumbang beberapa komponen: share komponen dihitung dari jumlah barisnya
+        dimension_total = (sum(row[metric] for row in result.get(name, []))
+                           if name == "component" else totals[metric])
+        report[name] = pareto_table(result.get(name, []), metric, dimension_total, top)
+    return report
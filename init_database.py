@@ -1,5 +1,19 @@
 # init_database.py
 from models import create_initial_users, create_initial_assets, create_initial_inventory, create_initial_schedule, create_initial_work_orders, db
+from cost_ledger import ensure_cost_ledger_indexes
+from oee_engine import ensure_oee_indexes
+from asset_hierarchy import rebuild_hierarchy
+from predictive_engine import ensure_predictive_indexes
+from rul_engine import ensure_rul_indexes
+from pm_recurrence import ensure_pm_plan_indexes
+from schedule_queries import ensure_schedule_indexes, backfill_assignee
+from inventory_stock import ensure_inventory_indexes, backfill_stock_flags
+import asset_registry
+from asset_timeline import ensure_timeline_indexes
+from wo_search import ensure_search_index, backfill_search
+from failure_pareto import ensure_pareto_indexes
+from kpi_series import ensure_kpi_series_indexes
+from wo_events import ensure_event_indexes, backfill_events
 
 if __name__ == '__main__':
     if db is not None:
@@ -9,6 +23,24 @@ if __name__ == '__main__':
         create_initial_inventory()
         create_initial_schedule()
         create_initial_work_orders() 
+        ensure_cost_ledger_indexes()
+        ensure_oee_indexes()
+        rebuild_hierarchy()
+        ensure_predictive_indexes()
+        ensure_rul_indexes()
+        ensure_pm_plan_indexes()
+        ensure_schedule_indexes()
+        backfill_assignee()
+        ensure_inventory_indexes()
+        backfill_stock_flags()
+        asset_registry.invalidate()
+        ensure_timeline_indexes()
+        ensure_search_index()
+        backfill_search()
+        ensure_pareto_indexes()
+        ensure_kpi_series_indexes()
+        ensure_event_indexes()
+        backfill_events()
         print("Database initialized successfully with clean, realistic data!")
         print("Tidak ada data dummy WO atau schedule - sistem siap untuk data real.")
     else:
@@ -0,0 +1,175 @@
+# inventory_stock.py
+import re
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from models import get_inventory_collection
+
+# Setiap perubahan stok menghitung ulang `below_min` dan `deficit`
+# (min_stock - current_stock, minimal 0) di dokumen yang sama, sehingga daftar
+# stok rendah dilayani index {below_min, deficit} tanpa $expr / full scan.
+# Pemakaian part saat WO selesai dilakukan dua fase dalam bulk_write:
+# reserve (kurangi stok bersyarat + tandai `reserved_by`) lalu commit atau
+# rollback, sehingga stok tidak pernah negatif dan tidak ada pemakaian parsial.
+QUANTITY_PATTERN = re.compile(r"^(?P<name>.+?)\s*(?:[xX]\s*(?P<suffix>\d+)|\((?P<paren>\d+)\))$")
+
+
+def stock_flags_stage():
+    """Stage pipeline update yang menurunkan status, below_min & deficit dari stok."""
+    return {"$set": {
+        "below_min": {"$lt": ["$current_stock", "$min_stock"]},
+        "deficit": {"$max": [{"$subtract": ["$min_stock", "$current_stock"]}, 0]},
+        "status": {"$cond": [{"$lt": ["$current_stock", "$min_stock"]}, "Rendah", "Aman"]}
+    }}
+
+
+def ensure_inventory_indexes():
+    inventory = get_inventory_collection()
+    inventory.create_index([("below_min", ASCENDING), ("deficit", DESCENDING)], name="below_min_deficit")
+    inventory.create_index([("part_number", ASCENDING)], name="part_number")
+    inventory.create_index([("reserved_by", ASCENDING)], name="reserved_by", sparse=True)
+
+
+def backfill_stock_flags():
+    """Migrasi: hitung below_min / deficit untuk semua item (satu update pipeline)."""
+    return get_inventory_collection().update_many({}, [stock_flags_stage()]).modified_count
+
+
+def set_stock(item_id, current_stock=None, min_stock=None):
+    """Ubah stok / minimum stok dan flag turunannya secara atomik."""
+    update = {}
+    if current_stock is not None:
+        update['current_stock'] = current_stock
+    if min_stock is not None:
+        update['min_stock'] = min_stock
+    return get_inventory_collection().update_one({"_id": item_id}, [{"$set": update}, stock_flags_stage()])
+
+
+def parse_part(entry):
+    """Entry parts_used -> (kunci part, jumlah).
+
+    Mendukung {"part_number"/"item_name", "quantity"} maupun teks bebas
+    dari form teknisi: "Mechanical Seal", "Mechanical Seal x2", "V-Belt (3)"."""
+    if isinstance(entry, dict):
+        key = entry.get('part_number') or entry.get('item_name') or entry.get('name') or ""
+        return str(key).strip(), int(entry.get('quantity') or 1)
+    text = str(entry).strip()
+    match = QUANTITY_PATTERN.match(text)
+    if match:
+        return match.group('name').strip(), int(match.group('suffix') or match.group('paren'))
+    return text, 1
+
+
+def resolve_parts(parts_used):
+    """Cocokkan entry ke item inventory (part_number atau nama, tanpa beda huruf besar/kecil).
+
+    Mengembalikan ({item_id: (item, quantity)}, [entry yang tidak dikenali])."""
+    wanted = [parse_part(entry) for entry in parts_used or []]
+    keys = {key.lower() for key, quantity in wanted if key and quantity > 0}
+    if not keys:
+        return {}, [key for key, _ in wanted if key]
+
+    items = {}
+    pattern = "^(" + "|".join(re.escape(key) for key in keys) + ")$"
+    for item in get_inventory_collection().find(
+        {"$or": [{"part_number": {"$regex": pattern, "$options": "i"}}, {"item_name": {"$regex": pattern, "$options": "i"}}]},
+        {"item_name": 1, "part_number": 1, "unit": 1, "value": 1}
+    ):
+        items.setdefault(str(item.get('part_number', '')).lower(), item)
+        items.setdefault(str(item.get('item_name', '')).lower(), item)
+
+    resolved, unmatched = {}, []
+    for key, quantity in wanted:
+        item = items.get(key.lower())
+        if item is None or quantity <= 0:
+            if key:
+                unmatched.append(key)
+            continue
+        previous = resolved.get(item['_id'], (item, 0))[1]
+        resolved[item['_id']] = (item, previous + quantity)
+    return resolved, unmatched
+
+
+def consume_parts(wo_id, resolved):
+    """Kurangi stok semua part sekaligus; semua berhasil atau tidak sama sekali.
+
+    Mengembalikan (consumed, shortages). Bila ada part yang stoknya kurang,
+    reservasi yang sempat berhasil dikembalikan dan `consumed` kosong."""
+    if not resolved:
+        return [], []
+    inventory = get_inventory_collection()
+    wo_id = str(wo_id)
+
+    reserve = [
+        UpdateOne(
+            {"_id": item_id, "current_stock": {"$gte": quantity}, "reserved_by": {"$ne": wo_id}},
+            [
+                {"$set": {
+                    "current_stock": {"$subtract": ["$current_stock", quantity]},
+                    "reserved_by": {"$concatArrays": [{"$ifNull": ["$reserved_by", []]}, [wo_id]]}
+                }},
+                stock_flags_stage()
+            ]
+        )
+        for item_id, (_, quantity) in resolved.items()
+    ]
+    result = inventory.bulk_write(reserve, ordered=False)
+
+    if result.modified_count == len(reserve):
+        inventory.update_many({"reserved_by": wo_id}, {"$pull": {"reserved_by": wo_id}})
+        return [
+            {"item_id": str(item_id), "part_number": item.get('part_number'), "item_name": item.get('item_name'),
+             "quantity": quantity, "unit": item.get('unit'), "value": item.get('value', 0)}
+            for item_id, (item, quantity) in resolved.items()
+        ], []
+
+    # Rollback: kembalikan stok item yang sudah tereservasi oleh WO ini
+    reserved = {doc['_id'] for doc in inventory.find({"reserved_by": wo_id}, {"_id": 1})}
+    rollback = [
+        UpdateOne(
+            {"_id": item_id, "reserved_by": wo_id},
+            [
+                {"$set": {
+                    "current_stock": {"$add": ["$current_stock", quantity]},
+                    "reserved_by": {"$setDifference": ["$reserved_by", [wo_id]]}
+                }},
+                stock_flags_stage()
+            ]
+        )
+        for item_id, (_, quantity) in resolved.items() if item_id in reserved
+    ]
+    if rollback:
+        inventory.bulk_write(rollback, ordered=False)
+
+    stock = {doc['_id']: doc.get('current_stock', 0)
+             for doc in inventory.find({"_id": {"$in": [item_id for item_id in resolved if item_id not in reserved]}}, {"current_stock": 1})}
+    shortages = [
+        {"item_name": item.get('item_name'), "part_number": item.get('part_number'),
+         "requested": quantity, "available": stock.get(item_id, 0)}
+        for item_id, (item, quantity) in resolved.items() if item_id not in reserved
+    ]
+    return [], shortages
+
+
+def restock_parts(consumed):
+    """Kembalikan part yang sudah dipakai (mis. WO gagal disimpan setelah stok dikurangi)."""
+    if consumed:
+        get_inventory_collection().bulk_write([
+            UpdateOne({"_id": ObjectId(part['item_id'])},
+                      [{"$set": {"current_stock": {"$add": ["$current_stock", part['quantity']]}}}, stock_flags_stage()])
+            for part in consumed
+        ], ordered=False)
+
+
+def low_stock_items(limit=None):
+    """Item di bawah minimum, urut kekurangan terbesar (index below_min_deficit)."""
+    cursor = get_inventory_collection().find({"below_min": True}).sort("deficit", DESCENDING)
+    if limit:
+        cursor = cursor.limit(limit)
+    return list(cursor)
+
+
+if __name__ == '__main__':
+    ensure_inventory_indexes()
+    print(f"{backfill_stock_flags()} item inventory diperbarui (below_min / deficit)")
@@ -0,0 +1,180 @@
+# kpi_series.py
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING
+
+import asset_registry
+from cost_analytics import local_timezone_offset
+from models import get_wo_collection
+
+# KPI per bucket waktu (hari/minggu/bulan) dalam rentang [from, to):
+# - MTTR: WO Korektif Ditutup, completed - created (definisi mttr_calculator),
+#   dikelompokkan menurut bulan selesai;
+# - MTBF: jam operasi (jumlah aset x panjang bucket) / jumlah WO Korektif
+#   dibuat, seperti capacity_simulator;
+# - PM compliance: WO Preventif dibuat dalam bucket yang sudah Ditutup;
+# - backlog: WO yang belum diselesaikan teknisi pada akhir bucket.
+# Satu aggregation $facet mengelompokkan per (bucket, aset) atau
+# (bucket, teknisi); rollup ke tipe aset / lokasi dilakukan di Python lewat
+# asset_registry karena semua nilai berupa jumlah yang bisa dijumlahkan.
+BUCKETS = ("day", "week", "month")
+GROUP_BY = ("asset", "type", "technician", "location")
+MAX_BUCKETS = 400
+ALL_GROUP = "Semua"
+
+
+def ensure_kpi_series_indexes():
+    collection = get_wo_collection()
+    collection.create_index([("timestamp_created", ASCENDING)], name="created")
+    collection.create_index([("timestamp_completed", ASCENDING)], name="completed")
+
+
+def bucket_starts(date_from, date_to, bucket):
+    """Awal setiap bucket (timestamp, waktu lokal) yang beririsan dengan [date_from, date_to)."""
+    start = datetime.fromtimestamp(date_from).replace(hour=0, minute=0, second=0, microsecond=0)
+    if bucket == "week":
+        start -= timedelta(days=start.weekday())
+    elif bucket == "month":
+        start = start.replace(day=1)
+
+    starts = []
+    while int(start.timestamp()) < date_to:
+        starts.append(int(start.timestamp()))
+        if bucket == "month":
+            start = start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1)
+        else:
+            start += timedelta(days=7 if bucket == "week" else 1)
+    return starts
+
+
+def _bucket_expr(field, bucket, timezone):
+    truncated = {"$dateTrunc": {
+        "date": {"$toDate": {"$multiply": [field, 1000]}},
+        "unit": bucket, "timezone": timezone, "startOfWeek": "monday"
+    }}
+    return {"$toLong": {"$divide": [{"$toLong": truncated}, 1000]}}
+
+
+def build_series_pipeline(date_from, date_to, bucket, group_field, timezone=None):
+    timezone = timezone or local_timezone_offset()
+    corrective = {"$eq": ["$type", "Korektif"]}
+    preventive = {"$eq": ["$type", "Preventif"]}
+
+    def count_if(*conditions):
+        return {"$sum": {"$cond": [{"$and": list(conditions)}, 1, 0]}}
+
+    return [
+        # Semua WO yang dibuat sebelum `to` dan belum selesai sebelum `from`
+        {"$match": {
+            "timestamp_created": {"$lt": date_to},
+            "$or": [{"timestamp_completed": None}, {"timestamp_completed": {"$gte": date_from}}]
+        }},
+        {"$project": {"_id": 0, "group": {"$ifNull": [group_field, ""]}, "type": 1, "status": 1,
+                      "timestamp_created": 1, "timestamp_completed": 1}},
+        {"$facet": {
+            "created": [
+                {"$match": {"timestamp_created": {"$gte": date_from}}},
+                {"$group": {
+                    "_id": {"bucket": _bucket_expr("$timestamp_created", bucket, timezone), "group": "$group"},
+                    "opened": {"$sum": 1},
+                    "failures": count_if(corrective),
+                    "pm_total": count_if(preventive),
+                    "pm_closed": count_if(preventive, {"$eq": ["$status", "Ditutup"]})
+                }}
+            ],
+            "completed": [
+                {"$match": {"timestamp_completed": {"$gte": date_from, "$lt": date_to}}},
+                {"$group": {
+                    "_id": {"bucket": _bucket_expr("$timestamp_completed", bucket, timezone), "group": "$group"},
+                    "completed": {"$sum": 1},
+                    "repairs": count_if(corrective, {"$eq": ["$status", "Ditutup"]}),
+                    "repair_seconds": {"$sum": {"$cond": [
+                        {"$and": [corrective, {"$eq": ["$status", "Ditutup"]}]},
+                        {"$subtract": ["$timestamp_completed", "$timestamp_created"]}, 0
+                    ]}}
+                }}
+            ],
+            "initial_backlog": [
+                {"$match": {"timestamp_created": {"$lt": date_from}}},
+                {"$group": {"_id": "$group", "count": {"$sum": 1}}}
+            ]
+        }}
+    ]
+
+
+def _group_resolver(group_by):
+    """Fungsi nama aset/teknisi -> label grup, dan jumlah aset per grup (untuk MTBF)."""
+    assets = asset_registry.list_assets(("name", "type", "location"))
+    if group_by is None:
+        return (lambda key: ALL_GROUP), {ALL_GROUP: len(assets)}
+    if group_by == "technician":
+        return (lambda key: key or "Belum ditugaskan"), {}
+    if group_by == "asset":
+        return (lambda key: key), {asset["name"]: 1 for asset in assets}
+
+    field = "type" if group_by == "type" else "location"
+    labels = {asset["name"]: asset.get(field) or "Lainnya" for asset in assets}
+    counts = {}
+    for label in labels.values():
+        counts[label] = counts.get(label, 0) + 1
+    return (lambda key: labels.get(key, "Lainnya")), counts
+
+
+def kpi_series(date_from, date_to, bucket="week", group_by=None, collection=None):
+    """Deret KPI per bucket (dan per grup bila group_by diisi)."""
+    if collection is None:
+        collection = get_wo_collection()
+
+    starts = bucket_starts(date_from, date_to, bucket)
+    if len(starts) > MAX_BUCKETS:
+        raise ValueError(f"Rentang terlalu panjang: {len(starts)} bucket (maks. {MAX_BUCKETS})")
+
+    group_field = "$assigned_to" if group_by == "technician" else "$asset_name"
+    result = next(collection.aggregate(build_series_pipeline(date_from, date_to, bucket, group_field)), {})
+    resolve, asset_counts = _group_resolver(group_by)
+
+    cells = {}
+    for facet in ("created", "completed"):
+        for row in result.get(facet, []):
+            cell = cells.setdefault((resolve(row["_id"]["group"]), row["_id"]["bucket"]), {})
+            for key, value in row.items():
+                if key != "_id":
+                    cell[key] = cell.get(key, 0) + value
+    backlog = {}
+    for row in result.get("initial_backlog", []):
+        group = resolve(row["_id"])
+        backlog[group] = backlog.get(group, 0) + row["count"]
+
+    groups = sorted({group for group, _ in cells} | set(backlog) | (set(asset_counts) if group_by != "asset" else set()))
+    bounds = starts[1:] + [date_to]
+    series = {}
+    for group in groups:
+        open_count = backlog.get(group, 0)
+        points = []
+        for start, end in zip(starts, bounds):
+            cell = cells.get((group, start), {})
+            open_count += cell.get("opened", 0) - cell.get("completed", 0)
+            failures, repairs = cell.get("failures", 0), cell.get("repairs", 0)
+            operating_hours = asset_counts.get(group, 0) * (min(end, date_to) - max(start, date_from)) / 3600
+            points.append({
+                "bucket": start,
+                "bucket_formatted": datetime.fromtimestamp(start).strftime('%Y-%m-%d'),
+                "mttr_hours": round(cell.get("repair_seconds", 0) / repairs / 3600, 2) if repairs else None,
+                "repairs": repairs,
+                "mtbf_hours": round(operating_hours / failures, 1) if failures and operating_hours else None,
+                "failures": failures,
+                "pm_compliance": round(cell.get("pm_closed", 0) / cell["pm_total"] * 100, 1) if cell.get("pm_total") else None,
+                "pm_total": cell.get("pm_total", 0),
+                "opened": cell.get("opened", 0),
+                "completed": cell.get("completed", 0),
+                "backlog": open_count
+            })
+        series[group] = points
+
+    return {
+        "from": date_from,
+        "to": date_to,
+        "bucket": bucket,
+        "group_by": group_by,
+        "series": series
+    }
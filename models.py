@@ -284,6 +284,9 @@ def create_initial_inventory():
         ]
         
         initial_inventory.extend(special_items)
+        for item in initial_inventory:
+            item["below_min"] = item["current_stock"] < item["min_stock"]
+            item["deficit"] = max(item["min_stock"] - item["current_stock"], 0)
         inventory.insert_many(initial_inventory)
         print("Inventory awal berhasil dibuat.")
 
@@ -474,6 +477,121 @@ def create_initial_predictive_data():
         predictive_collection.insert_many(predictive_data)
         print("Data predictive maintenance awal berhasil dibuat.")
 
+# ==========================================
+# 10. ANOMALY DETECTION COLLECTIONS - Alert & State Detektor Streaming
+# ==========================================
+def get_anomaly_alert_collection():
+    if db is not None: 
+        return db['anomaly_alerts']
+    return None
+
+def get_anomaly_state_collection():
+    if db is not None: 
+        return db['anomaly_detector_state']
+    return None
+
+# ==========================================
+# 11. COST LEDGER COLLECTION - Total Biaya Berjalan per Periode
+# ==========================================
+def get_cost_ledger_collection():
+    if db is not None: 
+        return db['cost_ledger']
+    return None
+
+# ==========================================
+# 12. OEE COLLECTIONS - Production Run & Snapshot OEE
+# ==========================================
+def get_production_run_collection():
+    if db is not None: 
+        return db['production_runs']
+    return None
+
+def get_oee_snapshot_collection():
+    if db is not None: 
+        return db['oee_snapshots']
+    return None
+
+# ==========================================
+# 13. ASSET HIERARCHY COLLECTION - Rollup KPI Plant / Lini / Aset
+# ==========================================
+def get_hierarchy_collection():
+    if db is not None: 
+        return db['asset_hierarchy']
+    return None
+
+# ==========================================
+# 14. SENSOR COLLECTIONS - Registry Sensor & Pembacaan Time-Series
+# ==========================================
+def get_sensor_collection():
+    if db is not None: 
+        return db['sensors']
+    return None
+
+def get_sensor_reading_collection():
+    if db is not None: 
+        return db['sensor_readings']
+    return None
+
+# ==========================================
+# 15. COMPONENT RUL COLLECTION - Remaining Useful Life per Komponen
+# ==========================================
+def get_component_rul_collection():
+    if db is not None: 
+        return db['component_rul']
+    return None
+
+# ==========================================
+# 16. CAPACITY SIMULATION COLLECTION - Run Simulasi Kapasitas Teknisi
+# ==========================================
+def get_capacity_simulation_collection():
+    if db is not None: 
+        return db['capacity_simulations']
+    return None
+
+# ==========================================
+# 17. PM PLAN COLLECTION - Rencana Preventive Maintenance Berulang
+# ==========================================
+def get_pm_plan_collection():
+    if db is not None: 
+        return db['pm_plans']
+    return None
+
+# ==========================================
+# 18. CACHE VERSION COLLECTION - Versi Data untuk Invalidasi Cache antar Worker
+# ==========================================
+def get_cache_version_collection():
+    if db is not None: 
+        return db['cache_versions']
+    return None
+
+# ==========================================
+# 19. WO EVENT LOG - Event Transisi WO (Append-only) & Read Model Proyeksi
+# ==========================================
+def get_wo_event_collection():
+    if db is not None: 
+        return db['wo_events']
+    return None
+
+def get_counter_collection():
+    if db is not None: 
+        return db['counters']
+    return None
+
+def get_projection_checkpoint_collection():
+    if db is not None: 
+        return db['projection_checkpoints']
+    return None
+
+def get_technician_workload_collection():
+    if db is not None: 
+        return db['technician_workload']
+    return None
+
+def get_wo_kpi_daily_collection():
+    if db is not None: 
+        return db['wo_kpi_daily']
+    return None
+
 # --- Auto Init jika dijalankan langsung ---
 if __name__ == '__main__':
     if db is not None:
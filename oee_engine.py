@@ -0,0 +1,315 @@
+# oee_engine.py
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+
+from models import get_production_run_collection, get_oee_snapshot_collection, get_asset_collection
+from asset_hierarchy import record_oee as record_hierarchy_oee
+
+# Shift default jika production run tidak menyertakan field `shift`
+SHIFTS = (
+    ("Shift 1", 6, 14),
+    ("Shift 2", 14, 22),
+    ("Shift 3", 22, 6)
+)
+ALL_SHIFTS = "ALL"
+
+RUN_FIELDS = ('asset_name', 'planned_production_time', 'actual_production_time',
+              'ideal_cycle_time', 'total_units', 'good_units')
+
+RUN_PROJECTION = {
+    "_id": 0,
+    "asset_name": 1,
+    "shift": 1,
+    "run_start": 1,
+    "planned_production_time": 1,
+    "actual_production_time": 1,
+    "ideal_cycle_time": 1,
+    "total_units": 1,
+    "good_units": 1
+}
+
+
+def ensure_oee_indexes():
+    get_production_run_collection().create_index([("run_start", ASCENDING)], name="run_start")
+    snapshots = get_oee_snapshot_collection()
+    snapshots.create_index(
+        [("asset_name", ASCENDING), ("shift", ASCENDING), ("period_start", ASCENDING)],
+        unique=True, name="snapshot_key"
+    )
+    snapshots.create_index([("shift", ASCENDING), ("period_start", DESCENDING)], name="shift_period")
+
+
+def shift_for_timestamp(ts):
+    hour = datetime.fromtimestamp(ts).hour
+    for name, start, end in SHIFTS:
+        if (start <= hour < end) if start < end else (hour >= start or hour < end):
+            return name
+    return SHIFTS[0][0]
+
+
+def day_start(ts):
+    dt = datetime.fromtimestamp(ts)
+    return int(datetime(dt.year, dt.month, dt.day).timestamp())
+
+
+def validate_run(run):
+    """Mengembalikan pesan error atau None jika data production run valid."""
+    for field in RUN_FIELDS:
+        if not run.get(field):
+            return f"Field {field} harus diisi"
+    if run['actual_production_time'] > run['planned_production_time']:
+        return "actual_production_time tidak boleh melebihi planned_production_time"
+    if run['good_units'] > run['total_units']:
+        return "good_units tidak boleh melebihi total_units"
+    return None
+
+
+def ingest_production_runs(runs, recorded_by):
+    """Menyimpan production run secara bulk dan menghitung snapshot hari terkait."""
+    now = int(time.time())
+    documents = []
+    for run in runs:
+        run_start = int(run.get('run_start') or now)
+        documents.append({
+            "asset_name": run['asset_name'],
+            "shift": run.get('shift') or shift_for_timestamp(run_start),
+            "run_start": run_start,
+            "planned_production_time": float(run['planned_production_time']),
+            "actual_production_time": float(run['actual_production_time']),
+            "ideal_cycle_time": float(run['ideal_cycle_time']),
+            "total_units": float(run['total_units']),
+            "good_units": float(run['good_units']),
+            "recorded_by": recorded_by,
+            "recorded_at": now
+        })
+
+    if not documents:
+        return {"runs": 0, "snapshots": 0}
+
+    get_production_run_collection().insert_many(documents)
+
+    days = sorted({day_start(doc['run_start']) for doc in documents})
+    snapshots = 0
+    for day in days:
+        snapshots += compute_oee_snapshots(day, day_start(day + 36 * 60 * 60))["snapshots"]
+    return {"runs": len(documents), "snapshots": snapshots}
+
+
+def _load_run_columns(since, until):
+    cursor = get_production_run_collection().find(
+        {"run_start": {"$gte": since, "$lt": until}}, RUN_PROJECTION, batch_size=10000
+    )
+    assets, shifts = {}, {}
+    asset_codes, shift_codes, days, values = [], [], [], []
+    for run in cursor:
+        asset_codes.append(assets.setdefault(run['asset_name'], len(assets)))
+        shift = run.get('shift') or shift_for_timestamp(run['run_start'])
+        shift_codes.append(shifts.setdefault(shift, len(shifts)))
+        days.append(day_start(run['run_start']))
+        values.append((
+            run.get('planned_production_time', 0), run.get('actual_production_time', 0),
+            run.get('ideal_cycle_time', 0), run.get('total_units', 0), run.get('good_units', 0)
+        ))
+
+    values = np.array(values, dtype=np.float64).reshape(-1, 5)
+    return {
+        "asset_names": list(assets),
+        "shift_names": list(shifts),
+        "asset": np.array(asset_codes, dtype=np.int64),
+        "shift": np.array(shift_codes, dtype=np.int64),
+        "day": np.array(days, dtype=np.int64),
+        "planned": values[:, 0],
+        "actual": values[:, 1],
+        "ideal_cycle": values[:, 2],
+        "total": values[:, 3],
+        "good": values[:, 4]
+    }
+
+
+def _ratio(numerator, denominator):
+    out = np.zeros_like(numerator)
+    np.divide(numerator, denominator, out=out, where=denominator > 0)
+    return out
+
+
+def grouped_oee(group_codes, n_groups, planned, actual, ideal_cycle, total, good):
+    """Availability, performance, quality dan OEE (%) per grup, vektorisasi.
+
+    Setiap komponen dihitung dari jumlah per grup (bukan rata-rata rasio per
+    run), sehingga run panjang berbobot sesuai durasinya."""
+    planned_sum = np.bincount(group_codes, weights=planned, minlength=n_groups)
+    actual_sum = np.bincount(group_codes, weights=actual, minlength=n_groups)
+    ideal_time_sum = np.bincount(group_codes, weights=ideal_cycle * total, minlength=n_groups)
+    total_sum = np.bincount(group_codes, weights=total, minlength=n_groups)
+    good_sum = np.bincount(group_codes, weights=good, minlength=n_groups)
+
+    availability = _ratio(actual_sum, planned_sum) * 100
+    performance = _ratio(ideal_time_sum, actual_sum) * 100
+    quality = _ratio(good_sum, total_sum) * 100
+    oee = availability * performance * quality / 10000
+
+    return {
+        "availability": availability,
+        "performance": performance,
+        "quality": quality,
+        "oee": oee,
+        "planned_time": planned_sum,
+        "actual_time": actual_sum,
+        "total_units": total_sum,
+        "good_units": good_sum,
+        "runs_count": np.bincount(group_codes, minlength=n_groups)
+    }
+
+
+def compute_oee_snapshots(since, until):
+    """Menghitung snapshot OEE harian per (aset, shift) dan per aset (ALL).
+
+    Snapshot di-upsert per (aset, shift, hari) sehingga histori hari lain
+    tidak pernah ditimpa; assets.oee_data ikut diperbarui dengan snapshot
+    terbaru agar tampilan lama tetap konsisten."""
+    columns = _load_run_columns(since, until)
+    if columns["asset"].size == 0:
+        return {"snapshots": 0, "assets": 0}
+
+    n_shifts = len(columns["shift_names"]) + 1  # slot terakhir = ALL
+    all_code = n_shifts - 1
+    n_rows = columns["asset"].size
+
+    # Setiap run dihitung dua kali: di shift-nya sendiri dan di ALL
+    asset = np.concatenate([columns["asset"], columns["asset"]])
+    shift = np.concatenate([columns["shift"], np.full(n_rows, all_code)])
+    day = np.concatenate([columns["day"], columns["day"]])
+    combined = (asset * n_shifts + shift) * (1 << 40) + day
+    keys, group_codes = np.unique(combined, return_inverse=True)
+
+    metrics = grouped_oee(
+        group_codes, keys.size,
+        *(np.concatenate([columns[field], columns[field]]) for field in ("planned", "actual", "ideal_cycle", "total", "good"))
+    )
+
+    key_day = keys % (1 << 40)
+    key_shift = (keys // (1 << 40)) % n_shifts
+    key_asset = (keys // (1 << 40)) // n_shifts
+    shift_names = columns["shift_names"] + [ALL_SHIFTS]
+    now = int(time.time())
+
+    operations = []
+    latest_per_asset = {}
+    for i in range(keys.size):
+        asset_name = columns["asset_names"][key_asset[i]]
+        period_start = int(key_day[i])
+        snapshot = {
+            "asset_name": asset_name,
+            "shift": shift_names[key_shift[i]],
+            "period_start": period_start,
+            "period": datetime.fromtimestamp(period_start).strftime('%Y-%m-%d'),
+            "availability": round(float(metrics["availability"][i]), 2),
+            "performance": round(float(metrics["performance"][i]), 2),
+            "quality": round(float(metrics["quality"][i]), 2),
+            "oee": round(float(metrics["oee"][i]), 2),
+            "planned_time": float(metrics["planned_time"][i]),
+            "actual_time": float(metrics["actual_time"][i]),
+            "total_units": float(metrics["total_units"][i]),
+            "good_units": float(metrics["good_units"][i]),
+            "runs_count": int(metrics["runs_count"][i]),
+            "computed_at": now
+        }
+        operations.append(UpdateOne(
+            {"asset_name": asset_name, "shift": snapshot["shift"], "period_start": period_start},
+            {"$set": snapshot},
+            upsert=True
+        ))
+        if snapshot["shift"] == ALL_SHIFTS:
+            current = latest_per_asset.get(asset_name)
+            if current is None or period_start > current["period_start"]:
+                latest_per_asset[asset_name] = snapshot
+
+    get_oee_snapshot_collection().bulk_write(operations, ordered=False)
+
+    # Hanya perbarui aset (dan rollup hierarkinya) jika snapshot ini memang
+    # periode terbaru aset tersebut; backfill hari lama tidak menimpa apa pun
+    computed_assets = len(latest_per_asset)
+    stored = {
+        asset['name']: (asset.get('oee_data') or {}).get('period_start')
+        for asset in get_asset_collection().find({"name": {"$in": list(latest_per_asset)}}, {"name": 1, "oee_data.period_start": 1})
+    }
+    latest_per_asset = {
+        asset_name: snapshot for asset_name, snapshot in latest_per_asset.items()
+        if asset_name in stored and (stored[asset_name] is None or stored[asset_name] <= snapshot["period_start"])
+    }
+    asset_updates = [
+        UpdateOne(
+            {"name": asset_name, "$or": [
+                {"oee_data.period_start": {"$exists": False}},
+                {"oee_data.period_start": {"$lte": snapshot["period_start"]}}
+            ]},
+            {"$set": {
+                "oee_data": {
+                    "availability": snapshot["availability"],
+                    "performance": snapshot["performance"],
+                    "quality": snapshot["quality"],
+                    "oee": snapshot["oee"],
+                    "period_start": snapshot["period_start"],
+                    "calculated_at": now
+                },
+                "efficiency": round(snapshot["oee"], 1)
+            }}
+        )
+        for asset_name, snapshot in latest_per_asset.items()
+    ]
+    if asset_updates:
+        get_asset_collection().bulk_write(asset_updates, ordered=False)
+        for asset_name, snapshot in latest_per_asset.items():
+            record_hierarchy_oee(asset_name, snapshot["oee"])
+
+    return {"snapshots": len(operations), "assets": computed_assets}
+
+
+def get_oee_overview(trend_days=30, shift=ALL_SHIFTS):
+    """Snapshot terbaru dan tren OEE harian untuk semua aset dalam satu aggregation."""
+    since = day_start(int(time.time()) - trend_days * 24 * 60 * 60)
+    pipeline = [
+        {"$match": {"shift": shift, "period_start": {"$gte": since}}},
+        {"$sort": {"asset_name": 1, "period_start": 1}},
+        {"$group": {
+            "_id": "$asset_name",
+            "latest": {"$last": "$$ROOT"},
+            "trend": {"$push": {
+                "period": "$period",
+                "oee": "$oee",
+                "availability": "$availability",
+                "performance": "$performance",
+                "quality": "$quality"
+            }}
+        }}
+    ]
+    overview = {}
+    for row in get_oee_snapshot_collection().aggregate(pipeline):
+        latest = row["latest"]
+        overview[row["_id"]] = {
+            "oee_data": {
+                "availability": latest["availability"],
+                "performance": latest["performance"],
+                "quality": latest["quality"],
+                "oee": latest["oee"],
+                "period": latest["period"],
+                "calculated_at": latest["computed_at"]
+            },
+            "oee_trend": row["trend"]
+        }
+    return overview
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hitung ulang snapshot OEE dari production run")
+    parser.add_argument("--days", type=int, default=1, help="Jumlah hari ke belakang yang dihitung ulang")
+    args = parser.parse_args()
+
+    until = day_start(int(time.time())) + 24 * 60 * 60
+    since = int((datetime.fromtimestamp(until) - timedelta(days=args.days)).timestamp())
+    summary = compute_oee_snapshots(since, until)
+    print(f"{summary['snapshots']} snapshot OEE dihitung untuk {summary['assets']} aset")
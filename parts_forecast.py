@@ -0,0 +1,162 @@
+# parts_forecast.py
+import argparse
+import math
+import time
+
+import numpy as np
+from pymongo import UpdateOne
+
+from models import get_inventory_collection, get_wo_collection
+from inventory_stock import parse_part, stock_flags_stage
+
+# Forecast kebutuhan sparepart: pemakaian per part per minggu dibangun dari
+# histori WO (`parts_consumed`, atau `parts_used` / `component_failed` untuk
+# WO lama yang belum mengurangi stok), lalu semua part dihitung sekaligus
+# sebagai matriks (part x minggu): rata-rata & deviasi permintaan, safety
+# stock, reorder point dan EOQ. Hasil disimpan di field `forecast` item.
+WEEK_SECONDS = 7 * 24 * 60 * 60
+HISTORY_WEEKS = 52
+DEFAULT_LEAD_TIME_DAYS = 14
+SERVICE_LEVEL_Z = 1.65  # ~95% siklus tanpa stockout
+ORDER_COST = 250000  # biaya per pemesanan (Rp)
+HOLDING_RATE = 0.25  # biaya simpan per tahun, fraksi dari harga part
+
+
+def load_demand(item_ids, key_index, component_index, now, weeks=HISTORY_WEEKS):
+    """Matriks permintaan (part x minggu); kolom terakhir = minggu berjalan."""
+    since = now - weeks * WEEK_SECONDS
+    rows, columns, quantities = [], [], []
+    cursor = get_wo_collection().find(
+        {"status": {"$in": ["Selesai", "Ditutup"]}, "timestamp_completed": {"$gte": since}},
+        {"_id": 0, "timestamp_completed": 1, "asset_type": 1, "component_failed": 1, "parts_used": 1, "parts_consumed": 1}
+    )
+    for wo in cursor:
+        week = min((wo['timestamp_completed'] - since) // WEEK_SECONDS, weeks - 1)
+        if 'parts_consumed' in wo:
+            usage = [(item_ids.get(part['item_id']), part['quantity']) for part in wo['parts_consumed']]
+        else:
+            usage = []
+            for entry in wo.get('parts_used') or []:
+                key, quantity = parse_part(entry)
+                usage.append((key_index.get(key.lower()), quantity))
+            # Komponen yang rusak dianggap diganti bila tidak tercatat di parts_used
+            if not any(row is not None for row, _ in usage):
+                usage = [(component_index.get((wo.get('asset_type'), str(wo.get('component_failed', '')).lower())), 1)]
+        for row, quantity in usage:
+            if row is not None and quantity > 0:
+                rows.append(row)
+                columns.append(week)
+                quantities.append(quantity)
+
+    flat = np.asarray(rows, dtype=np.int64) * weeks + np.asarray(columns, dtype=np.int64)
+    demand = np.bincount(flat, weights=np.asarray(quantities, dtype=np.float64), minlength=len(item_ids) * weeks)
+    return demand.reshape(len(item_ids), weeks)
+
+
+def reorder_policy(demand, current_stock, unit_cost, lead_time_days, service_z=SERVICE_LEVEL_Z):
+    """Reorder point & jumlah pesan untuk semua part (vektor per baris demand)."""
+    weekly_mean = demand.mean(axis=1)
+    weekly_std = demand.std(axis=1, ddof=1) if demand.shape[1] > 1 else np.zeros(len(demand))
+    lead_weeks = np.asarray(lead_time_days, dtype=np.float64) / 7
+
+    safety_stock = service_z * weekly_std * np.sqrt(lead_weeks)
+    reorder_point = np.ceil(weekly_mean * lead_weeks + safety_stock)
+    annual_demand = weekly_mean * 52
+    holding_cost = np.maximum(HOLDING_RATE * np.asarray(unit_cost, dtype=np.float64), 1.0)
+    eoq = np.ceil(np.sqrt(2 * annual_demand * ORDER_COST / holding_cost))
+
+    current_stock = np.asarray(current_stock, dtype=np.float64)
+    needs_order = (current_stock <= reorder_point) & (annual_demand > 0)
+    order_quantity = np.where(needs_order, np.maximum(eoq, reorder_point - current_stock + 1), 0)
+    days_of_cover = np.divide(current_stock * 7, weekly_mean, out=np.full(len(demand), np.inf), where=weekly_mean > 0)
+    return {
+        "weekly_demand": weekly_mean,
+        "demand_std": weekly_std,
+        "zero_weeks": (demand == 0).mean(axis=1),
+        "safety_stock": np.ceil(safety_stock),
+        "reorder_point": reorder_point,
+        "eoq": eoq,
+        "order_quantity": order_quantity,
+        "days_of_cover": days_of_cover
+    }
+
+
+def run_parts_forecast(now=None, weeks=HISTORY_WEEKS, apply_min_stock=False):
+    """Hitung forecast semua part dan simpan ke `inventory.forecast`.
+
+    Dengan apply_min_stock=True, min_stock diganti reorder point hasil
+    forecast (part tanpa pemakaian tidak diubah)."""
+    now = int(now or time.time())
+    items = list(get_inventory_collection().find(
+        {}, {"item_name": 1, "part_number": 1, "machine_type": 1, "current_stock": 1, "value": 1, "lead_time_days": 1}
+    ))
+    if not items:
+        return {"items": 0, "reorder": 0}
+
+    item_ids = {str(item['_id']): row for row, item in enumerate(items)}
+    key_index, component_index = {}, {}
+    for row, item in enumerate(items):
+        key_index.setdefault(str(item.get('part_number', '')).lower(), row)
+        key_index.setdefault(str(item.get('item_name', '')).lower(), row)
+        component_index[(item.get('machine_type'), str(item.get('item_name', '')).lower())] = row
+
+    demand = load_demand(item_ids, key_index, component_index, now, weeks)
+    policy = reorder_policy(
+        demand,
+        [item.get('current_stock', 0) for item in items],
+        [item.get('value', 0) for item in items],
+        [item.get('lead_time_days') or DEFAULT_LEAD_TIME_DAYS for item in items]
+    )
+
+    operations = []
+    for row, item in enumerate(items):
+        cover = policy['days_of_cover'][row]
+        forecast = {
+            "weekly_demand": round(float(policy['weekly_demand'][row]), 3),
+            "demand_std": round(float(policy['demand_std'][row]), 3),
+            "zero_weeks_ratio": round(float(policy['zero_weeks'][row]), 2),
+            "safety_stock": int(policy['safety_stock'][row]),
+            "reorder_point": int(policy['reorder_point'][row]),
+            "eoq": int(policy['eoq'][row]),
+            "order_quantity": int(policy['order_quantity'][row]),
+            "days_of_cover": round(float(cover), 1) if math.isfinite(cover) else None,
+            "lead_time_days": item.get('lead_time_days') or DEFAULT_LEAD_TIME_DAYS,
+            "history_weeks": weeks,
+            "calculated_at": now
+        }
+        if apply_min_stock and forecast['weekly_demand'] > 0:
+            update = [{"$set": {"forecast": forecast, "min_stock": forecast['reorder_point']}}, stock_flags_stage()]
+        else:
+            update = {"$set": {"forecast": forecast}}
+        operations.append(UpdateOne({"_id": item['_id']}, update))
+    get_inventory_collection().bulk_write(operations, ordered=False)
+
+    return {"items": len(items), "reorder": int((policy['order_quantity'] > 0).sum())}
+
+
+def reorder_recommendations(include_all=False):
+    """Item yang perlu dipesan (stok <= reorder point), paling cepat habis dulu."""
+    query = {"forecast": {"$exists": True}}
+    if not include_all:
+        query["forecast.order_quantity"] = {"$gt": 0}
+    items = list(get_inventory_collection().find(
+        query, {"item_name": 1, "part_number": 1, "machine_type": 1, "current_stock": 1, "min_stock": 1, "unit": 1,
+                "value": 1, "supplier": 1, "forecast": 1}
+    ))
+    items.sort(key=lambda item: (item['forecast']['days_of_cover'] is None, item['forecast']['days_of_cover'] or 0))
+    for item in items:
+        item['_id'] = str(item['_id'])
+        item['order_value'] = item['forecast']['order_quantity'] * item.get('value', 0)
+    return items
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Forecast kebutuhan sparepart & reorder point")
+    parser.add_argument("--weeks", type=int, default=HISTORY_WEEKS)
+    parser.add_argument("--apply-min-stock", action="store_true", help="Set min_stock = reorder point hasil forecast")
+    args = parser.parse_args()
+
+    started = time.time()
+    summary = run_parts_forecast(weeks=args.weeks, apply_min_stock=args.apply_min_stock)
+    print(f"Forecast {summary['items']} part selesai dalam {time.time() - started:.1f} detik, "
+          f"{summary['reorder']} part perlu dipesan")
@@ -0,0 +1,288 @@
+# pm_recurrence.py
+import argparse
+import calendar
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from models import get_pm_plan_collection, get_schedule_collection, get_production_run_collection
+from schedule_queries import assignee_of
+
+# Rencana PM berulang disimpan sekali per rencana. Occurrence dibuat
+# (materialized) ke maintenance_schedule hanya untuk jendela bergulir ke
+# depan oleh job berkala; di luar jendela itu occurrence dihitung saat query
+# (virtual) dan baru disimpan ketika ada yang mengubahnya.
+MATERIALIZE_WINDOW_DAYS = 14
+DEFAULT_READ_HORIZON_DAYS = 90
+RUNTIME_RATE_DAYS = 30
+DEFAULT_HOUR = 8
+RULE_KINDS = ("interval", "weekly", "monthly", "monthly_nth", "runtime")
+VIRTUAL_PREFIX = "plan:"
+DAY_SECONDS = 24 * 60 * 60
+
+
+def ensure_pm_plan_indexes():
+    get_pm_plan_collection().create_index([("active", ASCENDING), ("asset_name", ASCENDING)], name="active_asset")
+    get_schedule_collection().create_index(
+        [("plan_id", ASCENDING), ("scheduled_date", ASCENDING)],
+        unique=True, name="plan_occurrence",
+        partialFilterExpression={"plan_id": {"$exists": True}}
+    )
+
+
+def validate_rule(rule):
+    """Mengembalikan pesan error atau None jika aturan recurrence valid."""
+    if not isinstance(rule, dict) or rule.get('kind') not in RULE_KINDS:
+        return f"rule.kind harus salah satu dari {', '.join(RULE_KINDS)}"
+    kind = rule['kind']
+    if kind == "interval" and not (isinstance(rule.get('every_days'), int) and rule['every_days'] > 0):
+        return "rule.every_days harus bilangan bulat > 0"
+    if kind == "weekly":
+        weekdays = rule.get('weekdays')
+        if not weekdays or not all(isinstance(d, int) and 0 <= d <= 6 for d in weekdays):
+            return "rule.weekdays harus berisi hari 0 (Senin) - 6 (Minggu)"
+    if kind == "monthly" and not (isinstance(rule.get('day'), int) and 1 <= rule['day'] <= 31):
+        return "rule.day harus 1 - 31"
+    if kind == "monthly_nth":
+        if rule.get('nth') not in (1, 2, 3, 4, -1):
+            return "rule.nth harus 1, 2, 3, 4 atau -1 (terakhir)"
+        if not (isinstance(rule.get('weekday'), int) and 0 <= rule['weekday'] <= 6):
+            return "rule.weekday harus 0 (Senin) - 6 (Minggu)"
+    if kind == "runtime" and not (isinstance(rule.get('every_hours'), (int, float)) and rule['every_hours'] > 0):
+        return "rule.every_hours harus > 0"
+    return None
+
+
+def _at_hour(day, hour):
+    return int(datetime(day.year, day.month, day.day, hour).timestamp())
+
+
+def _nth_weekday(year, month, nth, weekday):
+    days = [d for d in range(1, calendar.monthrange(year, month)[1] + 1)
+            if calendar.weekday(year, month, d) == weekday]
+    return days[-1] if nth == -1 else days[nth - 1]
+
+
+def calendar_occurrences(rule, start, window_from, window_to, hour=DEFAULT_HOUR):
+    """Timestamp occurrence aturan kalender dalam [window_from, window_to)."""
+    first = datetime.fromtimestamp(max(start, window_from)).date()
+    last = datetime.fromtimestamp(window_to).date()
+    start_day = datetime.fromtimestamp(start).date()
+    result = []
+
+    if rule['kind'] == "interval":
+        every = rule['every_days']
+        offset = (first - start_day).days
+        day = first + timedelta(days=(-offset) % every)
+        while day <= last:
+            result.append(_at_hour(day, hour))
+            day += timedelta(days=every)
+
+    elif rule['kind'] == "weekly":
+        every_weeks = rule.get('every_weeks', 1)
+        weekdays = set(rule['weekdays'])
+        week_zero = start_day - timedelta(days=start_day.weekday())
+        day = first
+        while day <= last:
+            if day.weekday() in weekdays and ((day - week_zero).days // 7) % every_weeks == 0:
+                result.append(_at_hour(day, hour))
+            day += timedelta(days=1)
+
+    else:
+        every_months = rule.get('every_months', 1)
+        year, month = first.year, first.month
+        while (year, month) <= (last.year, last.month):
+            if ((year - start_day.year) * 12 + month - start_day.month) % every_months == 0:
+                if rule['kind'] == "monthly":
+                    day_of_month = min(rule['day'], calendar.monthrange(year, month)[1])
+                else:
+                    day_of_month = _nth_weekday(year, month, rule['nth'], rule['weekday'])
+                result.append(_at_hour(datetime(year, month, day_of_month).date(), hour))
+            month += 1
+            if month > 12:
+                year, month = year + 1, 1
+
+    return [ts for ts in result if start <= ts and window_from <= ts < window_to]
+
+
+def runtime_rates(asset_names, now=None):
+    """Rata-rata jam operasi per hari per aset dari production_runs 30 hari terakhir."""
+    now = int(now or time.time())
+    rows = get_production_run_collection().aggregate([
+        {"$match": {"asset_name": {"$in": list(asset_names)}, "run_start": {"$gte": now - RUNTIME_RATE_DAYS * DAY_SECONDS}}},
+        {"$group": {"_id": "$asset_name", "hours": {"$sum": "$actual_production_time"}}}
+    ])
+    return {row["_id"]: row["hours"] / RUNTIME_RATE_DAYS for row in rows}
+
+
+def _runtime_since(asset_name, since):
+    row = next(get_production_run_collection().aggregate([
+        {"$match": {"asset_name": asset_name, "run_start": {"$gte": since}}},
+        {"$group": {"_id": None, "hours": {"$sum": "$actual_production_time"}}}
+    ]), None)
+    return row["hours"] if row else 0.0
+
+
+def runtime_due_date(plan, rate_per_day, now):
+    """Perkiraan tanggal jatuh tempo PM berbasis jam operasi sejak anchor terakhir."""
+    if not rate_per_day:
+        return None
+    anchor = plan.get('runtime_anchor') or plan['start_date']
+    used = _runtime_since(plan['asset_name'], anchor)
+    remaining = max(plan['rule']['every_hours'] - used, 0)
+    return int(now + remaining / rate_per_day * DAY_SECONDS)
+
+
+def occurrence_document(plan, scheduled_date, now=None):
+    return {
+        "asset_name": plan['asset_name'],
+        "type": plan.get('type', "Preventif"),
+        "description": plan['description'],
+        "scheduled_date": scheduled_date,
+        "duration": plan.get('duration', 60),
+        "priority": plan.get('priority', "Sedang"),
+        "status": "Dijadwalkan",
+        "assigned_to": plan.get('assigned_to', ''),
+        "assignee": assignee_of(plan.get('assigned_to', '')),
+        "created_by": plan.get('created_by', 'system'),
+        "created_at": int(now or time.time()),
+        "notes": "",
+        "completed_by": "",
+        "completed_at": None,
+        "plan_id": str(plan['_id']),
+        "recurring": True
+    }
+
+
+def _plan_occurrences(plan, window_from, window_to, rates, now):
+    if plan['rule']['kind'] == "runtime":
+        due = runtime_due_date(plan, rates.get(plan['asset_name']), now)
+        return [due] if due is not None and window_from <= due < window_to else []
+    end = plan.get('end_date') or window_to
+    return calendar_occurrences(plan['rule'], plan['start_date'], window_from, min(window_to, end),
+                                plan.get('hour', DEFAULT_HOUR))
+
+
+def materialize_pm_plans(window_days=MATERIALIZE_WINDOW_DAYS, plan_ids=None, now=None):
+    """Job berkala: simpan occurrence hingga now + window ke maintenance_schedule.
+
+    Idempoten (upsert per plan_id + scheduled_date). Rencana berbasis jam
+    operasi hanya punya satu occurrence tertunda pada satu waktu; berikutnya
+    dibuat setelah occurrence itu selesai."""
+    now = int(now or time.time())
+    horizon = now + window_days * DAY_SECONDS
+    query = {"active": True}
+    if plan_ids:
+        query["_id"] = {"$in": [ObjectId(plan_id) for plan_id in plan_ids]}
+    plans = list(get_pm_plan_collection().find(query))
+    rates = runtime_rates({p['asset_name'] for p in plans if p['rule']['kind'] == "runtime"}, now)
+
+    schedule = get_schedule_collection()
+    operations, plan_updates = [], []
+    for plan in plans:
+        if plan['rule']['kind'] == "runtime":
+            pending = schedule.find_one({"plan_id": str(plan['_id']), "status": {"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}})
+            dates = [] if pending else _plan_occurrences(plan, now, horizon, rates, now)
+        else:
+            window_from = max(plan.get('materialized_until') or plan['start_date'], now)
+            dates = _plan_occurrences(plan, window_from, horizon, rates, now)
+            plan_updates.append(UpdateOne({"_id": plan['_id']}, {"$max": {"materialized_until": horizon}}))
+        for scheduled_date in dates:
+            operations.append(UpdateOne(
+                {"plan_id": str(plan['_id']), "scheduled_date": scheduled_date},
+                {"$setOnInsert": occurrence_document(plan, scheduled_date, now)},
+                upsert=True
+            ))
+
+    if operations:
+        schedule.bulk_write(operations, ordered=False)
+    if plan_updates:
+        get_pm_plan_collection().bulk_write(plan_updates, ordered=False)
+    return {"plans": len(plans), "occurrences": len(operations)}
+
+
+def expand_virtual_occurrences(window_from, window_to, plan_query=None, now=None):
+    """Occurrence yang belum di-materialize dalam jendela query (tidak disimpan)."""
+    now = int(now or time.time())
+    query = dict(plan_query or {}, active=True)
+    plans = [p for p in get_pm_plan_collection().find(query) if p['rule']['kind'] != "runtime"]
+
+    # Occurrence yang sudah disimpan (job materialize atau materialize_virtual
+    # saat di-update) tidak diulang sebagai salinan virtual
+    stored = set()
+    if plans:
+        for doc in get_schedule_collection().find(
+            {"plan_id": {"$in": [str(p['_id']) for p in plans]},
+             "scheduled_date": {"$gte": window_from, "$lt": window_to}},
+            {"_id": 0, "plan_id": 1, "scheduled_date": 1}
+        ):
+            stored.add((doc['plan_id'], doc['scheduled_date']))
+
+    virtual = []
+    for plan in plans:
+        # Semua yang sebelum materialized_until sudah ada di maintenance_schedule
+        start = max(window_from, plan.get('materialized_until') or plan['start_date'], now)
+        for scheduled_date in _plan_occurrences(plan, start, window_to, {}, now):
+            if (str(plan['_id']), scheduled_date) in stored:
+                continue
+            doc = occurrence_document(plan, scheduled_date, now)
+            doc["_id"] = f"{VIRTUAL_PREFIX}{plan['_id']}:{scheduled_date}"
+            doc["virtual"] = True
+            virtual.append(doc)
+    return virtual
+
+
+def materialize_virtual(virtual_id):
+    """Menyimpan satu occurrence virtual (misal saat di-update) dan mengembalikan ObjectId-nya."""
+    try:
+        plan_id, scheduled_date = virtual_id[len(VIRTUAL_PREFIX):].rsplit(":", 1)
+        plan = get_pm_plan_collection().find_one({"_id": ObjectId(plan_id)})
+    except Exception:
+        return None
+    if plan is None:
+        return None
+    scheduled_date = int(scheduled_date)
+    schedule = get_schedule_collection()
+    schedule.update_one(
+        {"plan_id": plan_id, "scheduled_date": scheduled_date},
+        {"$setOnInsert": occurrence_document(plan, scheduled_date)},
+        upsert=True
+    )
+    return schedule.find_one({"plan_id": plan_id, "scheduled_date": scheduled_date}, {"_id": 1})['_id']
+
+
+def on_occurrence_completed(schedule_doc, completed_at):
+    """Rencana berbasis jam operasi: reset anchor dan buat occurrence berikutnya."""
+    plan_id = schedule_doc.get('plan_id')
+    if not plan_id:
+        return
+    plan = get_pm_plan_collection().find_one_and_update(
+        {"_id": ObjectId(plan_id), "rule.kind": "runtime"},
+        {"$set": {"runtime_anchor": completed_at}}
+    )
+    if plan:
+        materialize_pm_plans(plan_ids=[plan_id])
+
+
+def deactivate_pm_plan(plan_id, now=None):
+    """Menonaktifkan rencana dan menghapus occurrence mendatang yang belum dikerjakan."""
+    now = int(now or time.time())
+    result = get_pm_plan_collection().update_one({"_id": ObjectId(plan_id)}, {"$set": {"active": False, "deactivated_at": now}})
+    if not result.matched_count:
+        return None
+    removed = get_schedule_collection().delete_many({
+        "plan_id": plan_id, "status": "Dijadwalkan", "scheduled_date": {"$gte": now}
+    })
+    return removed.deleted_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Materialize occurrence PM berulang ke maintenance_schedule")
+    parser.add_argument("--window-days", type=int, default=MATERIALIZE_WINDOW_DAYS)
+    args = parser.parse_args()
+
+    summary = materialize_pm_plans(args.window_days)
+    print(f"{summary['occurrences']} occurrence dari {summary['plans']} rencana PM "
+          f"(jendela {args.window_days} hari)")
@@ -0,0 +1,317 @@
+# predictive_engine.py
+import argparse
+import time
+from datetime import datetime
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from models import (get_sensor_reading_collection, get_sensor_collection,
+                    get_predictive_collection, get_schedule_collection)
+from schedule_queries import UNASSIGNED
+
+# Model tren per (aset, sensor): regresi linear berbobot eksponensial atas
+# jendela geser. Bobot exp(-umur / TAU) membuat pembacaan terbaru dominan
+# (setara exponential smoothing dengan tren), dan semua sensor dihitung
+# sekaligus lewat np.bincount tanpa loop per sensor.
+FORECAST_WINDOW_HOURS = 72
+SMOOTHING_TAU_HOURS = 24
+FORECAST_HORIZON_DAYS = 90
+MIN_SAMPLES = 10
+# Jadwal dibuat sekian hari sebelum estimasi batas (batas bawah pita keyakinan)
+SCHEDULE_LEAD_DAYS = 7
+CONFIDENCE_SIGMA = 2.0
+MIN_SLOPE_PER_DAY = 1e-9
+
+READING_PROJECTION = {"_id": 0, "asset_name": 1, "sensor_type": 1, "value": 1, "timestamp": 1}
+DAY_SECONDS = 24 * 60 * 60
+
+
+def ensure_predictive_indexes():
+    readings = get_sensor_reading_collection()
+    readings.create_index([("timestamp", ASCENDING)], name="timestamp")
+    readings.create_index(
+        [("asset_name", ASCENDING), ("sensor_type", ASCENDING), ("timestamp", ASCENDING)],
+        name="sensor_timestamp"
+    )
+    get_sensor_collection().create_index(
+        [("asset_name", ASCENDING), ("sensor_type", ASCENDING)], unique=True, name="sensor_key"
+    )
+    get_predictive_collection().create_index(
+        [("asset_name", ASCENDING), ("sensor_type", ASCENDING), ("source", ASCENDING)], name="prediction_key"
+    )
+
+
+def register_sensor(asset_name, sensor_type, threshold, direction="above", unit=None):
+    """Mendaftarkan / memperbarui batas sensor. direction: 'above' atau 'below'."""
+    update = {"threshold": float(threshold), "direction": direction, "updated_at": int(time.time())}
+    if unit:
+        update["unit"] = unit
+    get_sensor_collection().update_one(
+        {"asset_name": asset_name, "sensor_type": sensor_type},
+        {"$set": update, "$setOnInsert": {"created_at": int(time.time())}},
+        upsert=True
+    )
+
+
+def validate_reading(reading):
+    """Mengembalikan pesan error atau None jika pembacaan sensor valid."""
+    for field in ('asset_name', 'sensor_type'):
+        if not reading.get(field):
+            return f"Field {field} harus diisi"
+    if not isinstance(reading.get('value'), (int, float)):
+        return "Field value harus berupa angka"
+    return None
+
+
+def store_sensor_readings(readings):
+    """Menyimpan pembacaan sensor secara bulk; threshold opsional ikut didaftarkan."""
+    now = int(time.time())
+    documents = []
+    for reading in readings:
+        documents.append({
+            "asset_name": reading['asset_name'],
+            "sensor_type": reading['sensor_type'],
+            "value": float(reading['value']),
+            "timestamp": int(reading.get('timestamp') or now)
+        })
+        if reading.get('threshold'):
+            register_sensor(reading['asset_name'], reading['sensor_type'], reading['threshold'],
+                            reading.get('direction', 'above'), reading.get('unit'))
+    if documents:
+        get_sensor_reading_collection().insert_many(documents)
+    return documents
+
+
+def _load_thresholds(asset_name=None):
+    """Batas per (aset, sensor) dari registry; prediksi lama dipakai sebagai cadangan."""
+    query = {"asset_name": asset_name} if asset_name else {}
+    thresholds = {}
+    for doc in get_predictive_collection().find(dict(query, threshold={"$gt": 0}), {"asset_name": 1, "sensor_type": 1, "threshold": 1}):
+        thresholds[(doc['asset_name'], doc['sensor_type'])] = (float(doc['threshold']), "above")
+    for doc in get_sensor_collection().find(query):
+        thresholds[(doc['asset_name'], doc['sensor_type'])] = (float(doc['threshold']), doc.get('direction', 'above'))
+    return thresholds
+
+
+def _load_reading_columns(since, asset_name=None):
+    query = {"timestamp": {"$gte": since}}
+    if asset_name:
+        query["asset_name"] = asset_name
+    cursor = get_sensor_reading_collection().find(query, READING_PROJECTION, batch_size=10000)
+
+    sensors = {}
+    codes, timestamps, values = [], [], []
+    for reading in cursor:
+        codes.append(sensors.setdefault((reading['asset_name'], reading['sensor_type']), len(sensors)))
+        timestamps.append(reading['timestamp'])
+        values.append(reading['value'])
+
+    return {
+        "sensor_keys": list(sensors),
+        "sensor": np.array(codes, dtype=np.int64),
+        "timestamp": np.array(timestamps, dtype=np.int64),
+        "value": np.array(values, dtype=np.float64)
+    }
+
+
+def fit_trends(codes, n_groups, timestamps, values, now, tau_hours=SMOOTHING_TAU_HOURS):
+    """Regresi linear berbobot per grup, vektorisasi.
+
+    Sumbu waktu dalam hari relatif terhadap `now` dan dipusatkan per grup
+    (dua pass) agar stabil secara numerik. Mengembalikan level saat `now`,
+    slope per hari, simpangan residual dan jumlah sampel per grup."""
+    x = (timestamps - now) / DAY_SECONDS
+    w = np.exp(x * 24 / tau_hours)
+
+    weight_sum = np.bincount(codes, weights=w, minlength=n_groups)
+    safe_weight = np.where(weight_sum > 0, weight_sum, 1)
+    mean_x = np.bincount(codes, weights=w * x, minlength=n_groups) / safe_weight
+    mean_y = np.bincount(codes, weights=w * values, minlength=n_groups) / safe_weight
+
+    xc = x - mean_x[codes]
+    sxx = np.bincount(codes, weights=w * xc * xc, minlength=n_groups)
+    sxy = np.bincount(codes, weights=w * xc * values, minlength=n_groups)
+    samples = np.bincount(codes, minlength=n_groups)
+
+    slope = np.zeros(n_groups)
+    fitted = (samples >= MIN_SAMPLES) & (sxx > 0)
+    np.divide(sxy, sxx, out=slope, where=fitted)
+    level = mean_y - slope * mean_x
+
+    residual = values - (mean_y[codes] + slope[codes] * xc)
+    sigma = np.sqrt(np.bincount(codes, weights=w * residual * residual, minlength=n_groups) / safe_weight)
+
+    return {"level": level, "slope": slope, "sigma": sigma, "samples": samples, "fitted": fitted}
+
+
+def days_to_threshold(level, slope, threshold, fitted):
+    """Estimasi hari hingga level menyentuh batas atas (nan = tidak menuju batas)."""
+    gap = threshold - level
+    days = np.full(level.shape, np.nan)
+    rising = fitted & (slope > MIN_SLOPE_PER_DAY)
+    np.divide(gap, slope, out=days, where=rising)
+    days[gap <= 0] = 0.0
+    return days
+
+
+def _risk_level(days, risk_percentage):
+    by_days = "Rendah"
+    if days is not None:
+        by_days = "Tinggi" if days <= SCHEDULE_LEAD_DAYS else "Sedang" if days <= 30 else "Rendah"
+    by_ratio = "Tinggi" if risk_percentage >= 80 else "Sedang" if risk_percentage >= 60 else "Rendah"
+    order = ("Rendah", "Sedang", "Tinggi")
+    return max(by_days, by_ratio, key=order.index)
+
+
+def _recommendation(sensor_type, risk_level, days):
+    if days == 0:
+        return f"{sensor_type} sudah melewati batas, lakukan inspeksi segera"
+    if risk_level == "Tinggi":
+        return f"Jadwalkan perbaikan sebelum {sensor_type} mencapai batas"
+    if risk_level == "Sedang":
+        return f"Rencanakan inspeksi, tren {sensor_type} mendekati batas"
+    return "Monitoring dan inspeksi rutin"
+
+
+def run_predictive_forecast(window_hours=FORECAST_WINDOW_HOURS, asset_name=None, now=None):
+    """Batch job: fit tren semua sensor, tulis prediksi, dan buat jadwal otomatis.
+
+    Prediksi di-upsert per (aset, sensor) di predictive_maintenance dengan
+    source 'forecast'. Jadwal Predictive dibuat sekali per prediksi dan hanya
+    dimajukan (tidak pernah dimundurkan) saat estimasi memburuk."""
+    now = int(now or time.time())
+    columns = _load_reading_columns(now - window_hours * 60 * 60, asset_name)
+    thresholds = _load_thresholds(asset_name)
+
+    keys = columns["sensor_keys"]
+    known = [i for i, key in enumerate(keys) if key in thresholds]
+    if not known:
+        return {"sensors": 0, "predictions": [], "schedules": 0}
+
+    # Sensor dengan batas bawah dibalik tandanya agar semua dihitung sebagai batas atas
+    sign = np.array([-1.0 if thresholds.get(key, (0, "above"))[1] == "below" else 1.0 for key in keys])
+    threshold = np.array([thresholds.get(key, (0, "above"))[0] for key in keys])
+    signed_values = columns["value"] * sign[columns["sensor"]]
+
+    trend = fit_trends(columns["sensor"], len(keys), columns["timestamp"], signed_values, now)
+    signed_threshold = threshold * sign
+    days = days_to_threshold(trend["level"], trend["slope"], signed_threshold, trend["fitted"])
+    days_early = days_to_threshold(trend["level"] + CONFIDENCE_SIGMA * trend["sigma"], trend["slope"],
+                                   signed_threshold, trend["fitted"])
+
+    latest_ts = np.zeros(len(keys), dtype=np.int64)
+    np.maximum.at(latest_ts, columns["sensor"], columns["timestamp"])
+    latest_value = np.zeros(len(keys))
+    is_latest = columns["timestamp"] == latest_ts[columns["sensor"]]
+    latest_value[columns["sensor"][is_latest]] = columns["value"][is_latest]
+
+    operations, predictions = [], []
+    for i in known:
+        asset, sensor_type = keys[i]
+        level = float(trend["level"][i] * sign[i])
+        estimate = None if np.isnan(days[i]) or days[i] > FORECAST_HORIZON_DAYS else round(float(days[i]), 1)
+        early = None if np.isnan(days_early[i]) or days_early[i] > FORECAST_HORIZON_DAYS else round(float(days_early[i]), 1)
+        if estimate is not None and early is None:
+            early = estimate
+        risk_percentage = round(level / threshold[i] * 100, 2) if threshold[i] else 0.0
+        risk_level = _risk_level(estimate, risk_percentage)
+
+        prediction = {
+            "asset_name": asset,
+            "sensor_type": sensor_type,
+            "current_value": round(float(latest_value[i]), 3),
+            "smoothed_value": round(level, 3),
+            "threshold": float(threshold[i]),
+            "direction": thresholds[keys[i]][1],
+            "slope_per_day": round(float(trend["slope"][i] * sign[i]), 6),
+            "residual_std": round(float(trend["sigma"][i]), 4),
+            "samples": int(trend["samples"][i]),
+            "days_to_threshold": estimate,
+            "days_to_threshold_early": early,
+            "risk_percentage": risk_percentage,
+            "risk_level": risk_level,
+            "predicted_failure_date": now + int(estimate * DAY_SECONDS) if estimate is not None else None,
+            "recommended_action": _recommendation(sensor_type, risk_level, estimate),
+            "model": "weighted_linear_trend" if trend["fitted"][i] else "insufficient_data",
+            "window_hours": window_hours,
+            "fitted_at": now,
+            "status": "Aktif",
+            "source": "forecast"
+        }
+        predictions.append(prediction)
+        operations.append(UpdateOne(
+            {"asset_name": asset, "sensor_type": sensor_type, "source": "forecast"},
+            {"$set": prediction, "$setOnInsert": {"created_by": "system", "created_at": now}},
+            upsert=True
+        ))
+
+    predictive_collection = get_predictive_collection()
+    predictive_collection.bulk_write(operations, ordered=False)
+
+    ids = {
+        (doc['asset_name'], doc['sensor_type']): str(doc['_id'])
+        for doc in predictive_collection.find(
+            {"source": "forecast", "asset_name": {"$in": list({p['asset_name'] for p in predictions})}},
+            {"asset_name": 1, "sensor_type": 1}
+        )
+    }
+    for prediction in predictions:
+        prediction["prediction_id"] = ids.get((prediction['asset_name'], prediction['sensor_type']))
+
+    schedules = _schedule_predictions(predictions, now)
+    return {"sensors": len(predictions), "predictions": predictions, "schedules": schedules}
+
+
+def _schedule_predictions(predictions, now):
+    operations = []
+    for prediction in predictions:
+        early = prediction["days_to_threshold_early"]
+        if prediction["risk_level"] == "Rendah" or early is None or prediction["prediction_id"] is None:
+            continue
+        scheduled_date = max(now, now + int((early - SCHEDULE_LEAD_DAYS) * DAY_SECONDS))
+        operations.append(UpdateOne(
+            {"predictive_maintenance_id": prediction["prediction_id"], "status": {"$in": ["Dijadwalkan", "Dalam Pengerjaan"]}},
+            {
+                "$set": {
+                    "description": (
+                        f"Predictive maintenance berdasarkan sensor {prediction['sensor_type']}. "
+                        f"Risk: {prediction['risk_level']} ({prediction['risk_percentage']}%), "
+                        f"estimasi batas tercapai {prediction['days_to_threshold']} hari lagi"
+                    ),
+                    "priority": "Tinggi" if prediction["risk_level"] == "Tinggi" else "Sedang",
+                    "predicted_failure_date": prediction["predicted_failure_date"]
+                },
+                "$min": {"scheduled_date": scheduled_date},
+                "$setOnInsert": {
+                    "asset_name": prediction["asset_name"],
+                    "type": "Predictive",
+                    "duration": 120,
+                    "status": "Dijadwalkan",
+                    "assigned_to": "",
+                    "assignee": UNASSIGNED,
+                    "created_by": "system",
+                    "created_at": now,
+                    "notes": "",
+                    "completed_by": "",
+                    "completed_at": None
+                }
+            },
+            upsert=True
+        ))
+    if operations:
+        get_schedule_collection().bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Forecast kerusakan dari tren data sensor")
+    parser.add_argument("--window-hours", type=int, default=FORECAST_WINDOW_HOURS, help="Panjang jendela data sensor")
+    args = parser.parse_args()
+
+    started = time.time()
+    summary = run_predictive_forecast(args.window_hours)
+    high = sum(1 for p in summary["predictions"] if p["risk_level"] == "Tinggi")
+    print(f"{summary['sensors']} sensor diprediksi ({high} risiko tinggi), "
+          f"{summary['schedules']} jadwal diperbarui dalam {time.time() - started:.1f} detik "
+          f"({datetime.now().strftime('%Y-%m-%d %H:%M')})")
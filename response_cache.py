@@ -0,0 +1,378 @@
+# response_cache.py
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from urllib.parse import urlparse
+
+# Cache hasil perhitungan endpoint (KPI, analisis energi/biaya, OEE) yang
+# dipakai bersama oleh semua worker. Backend dipilih lewat CACHE_BACKEND:
+#   sqlite - file SQLite di CACHE_URL, berbagi antar worker satu host (default)
+#   memory - per proses, hanya untuk development / satu worker: invalidasi
+#            dari endpoint tulis tidak sampai ke worker lain
+#   redis  - server ber-protokol Redis di CACHE_URL (redis://host:port/db)
+# Invalidasi memakai versi tag: setiap entry menyimpan versi tag saat dihitung
+# dan `invalidate(tag)` cukup menaikkan versinya, sehingga entry lama tidak
+# pernah terbaca lagi dan tergusur sendiri oleh TTL / LRU. Perhitungan ulang
+# dijaga single-flight: satu pemanggil menghitung, yang lain menunggu hasilnya.
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')
+CACHE_URL = os.environ.get('CACHE_URL', 'cache.sqlite3')
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 1024))
+DEFAULT_TTL_SECONDS = 60
+LOCK_TTL_SECONDS = 30
+LOCK_WAIT_SECONDS = 10
+LOCK_POLL_SECONDS = 0.05
+KEY_PREFIX = "cms:"
+
+
+class MemoryBackend:
+    """Dict terurut per proses: TTL + LRU berdasarkan jumlah entry."""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._counters = {}  # versi tag, tidak ikut LRU
+        self._lock = threading.Lock()
+
+    def _live(self, key, now):
+        if key in self._counters:
+            return self._counters[key]
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return item[0]
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            return [self._live(key, now) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def add(self, key, value, ttl=None):
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._data[key] = (value, time.time() + ttl if ttl else None)
+            return True
+
+    def delete(self, key, value=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and (value is None or item[0] == value):
+                del self._data[key]
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._counters.get(key) or 0) + 1
+            self._counters[key] = str(value)
+            return value
+
+
+class SQLiteBackend:
+    """Satu file SQLite (mode WAL) yang dipakai bersama semua worker satu host."""
+
+    PRUNE_EVERY = 64
+
+    def __init__(self, path=CACHE_URL, max_entries=CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._writes = 0
+        with self._connection() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, "
+                         "expires_at REAL, accessed_at REAL)")
+            conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed_at)")
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, keys):
+        now = time.time()
+        conn = self._connection()
+        placeholders = ",".join("?" * len(keys))
+        rows = dict(conn.execute(
+            f"SELECT key, value FROM cache WHERE key IN ({placeholders}) AND (expires_at IS NULL OR expires_at > ?)",
+            (*keys, now)
+        ).fetchall())
+        if rows:
+            # accessed_at cukup presisi per detik; hindari tulis di setiap baca
+            conn.execute(f"UPDATE cache SET accessed_at = ? WHERE accessed_at < ? AND key IN ({','.join('?' * len(rows))})",
+                         (now, now - 1, *rows))
+        return [rows.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("INSERT OR REPLACE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                     (key, value, now + ttl if ttl else None, now))
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def add(self, key, value, ttl=None):
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM cache WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            inserted = conn.execute("INSERT OR IGNORE INTO cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                                    (key, value, now + ttl if ttl else None, now)).rowcount
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return inserted == 1
+
+    def delete(self, key, value=None):
+        if value is None:
+            self._connection().execute("DELETE FROM cache WHERE key = ?", (key,))
+        else:
+            self._connection().execute("DELETE FROM cache WHERE key = ? AND value = ?", (key, value))
+
+    def incr(self, key):
+        conn = self._connection()
+        conn.execute("INSERT INTO cache (key, value, expires_at, accessed_at) VALUES (?, '1', NULL, ?) "
+                     "ON CONFLICT(key) DO UPDATE SET value = CAST(CAST(value AS INTEGER) + 1 AS TEXT)", (key, time.time()))
+        return int(conn.execute("SELECT value FROM cache WHERE key = ?", (key,)).fetchone()[0])
+
+    def prune(self):
+        """Buang entry kedaluwarsa lalu entry paling lama tidak diakses di atas batas."""
+        conn = self._connection()
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),))
+        # Versi tag (tanpa TTL) tidak ikut digusur
+        conn.execute("DELETE FROM cache WHERE expires_at IS NOT NULL AND key IN (SELECT key FROM cache "
+                     "WHERE expires_at IS NOT NULL ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+
+class RedisBackend:
+    """Klien protokol Redis (RESP) minimal; satu koneksi per thread.
+
+    Batas ukuran & LRU diatur di server: maxmemory + volatile-lru, sehingga
+    hanya entry ber-TTL yang digusur dan versi tag tetap tersimpan."""
+
+    def __init__(self, url=CACHE_URL, timeout=2.0):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "localhost", parsed.port or 6379)
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.password = parsed.password
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        self._local.sock, self._local.reader = sock, sock.makefile("rb")
+        if self.password:
+            self._call("AUTH", self.password)
+        if self.db:
+            self._call("SELECT", self.db)
+
+    def _call(self, *args):
+        if getattr(self._local, "sock", None) is None:
+            self._connect()
+        payload = [f"*{len(args)}\r\n".encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            payload.append(f"${len(data)}\r\n".encode() + data + b"\r\n")
+        try:
+            self._local.sock.sendall(b"".join(payload))
+            return self._read()
+        except (OSError, ConnectionError):
+            self.close()
+            raise
+
+    def close(self):
+        sock, reader = getattr(self._local, "sock", None), getattr(self._local, "reader", None)
+        self._local.sock = self._local.reader = None
+        for handle in (reader, sock):
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+
+    def _read(self):
+        line = self._local.reader.readline()
+        if not line:
+            raise ConnectionError("Koneksi cache terputus")
+        kind, body = line[:1], line[1:-2]
+        if kind == b"+":
+            return body.decode()
+        if kind == b"-":
+            raise RuntimeError(body.decode())
+        if kind == b":":
+            return int(body)
+        if kind == b"$":
+            length = int(body)
+            return None if length < 0 else self._local.reader.read(length + 2)[:-2]
+        if kind == b"*":
+            length = int(body)
+            return None if length < 0 else [self._read() for _ in range(length)]
+        raise ConnectionError(f"Balasan RESP tidak dikenal: {line!r}")
+
+    def get_many(self, keys):
+        return self._call("MGET", *keys)
+
+    def set(self, key, value, ttl=None):
+        if ttl:
+            self._call("SET", key, value, "PX", int(ttl * 1000))
+        else:
+            self._call("SET", key, value)
+
+    def add(self, key, value, ttl=None):
+        args = ("SET", key, value, "NX") + (("PX", int(ttl * 1000)) if ttl else ())
+        return self._call(*args) == "OK"
+
+    def delete(self, key, value=None):
+        if value is None:
+            self._call("DEL", key)
+        else:
+            # Hapus lock hanya jika masih milik pemanggil
+            self._call("EVAL", "if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end return 0",
+                       1, key, value)
+
+    def incr(self, key):
+        return self._call("INCR", key)
+
+
+def create_backend(name=CACHE_BACKEND, url=CACHE_URL):
+    if name == "memory":
+        return MemoryBackend()
+    if name == "redis":
+        return RedisBackend(url)
+    return SQLiteBackend(url)
+
+
+_backend = create_backend()
+_local_flights = {}
+_local_flights_lock = threading.Lock()
+
+
+def _tag_key(tag):
+    return f"{KEY_PREFIX}tag:{tag}"
+
+
+def _entry_key(key, versions):
+    return f"{KEY_PREFIX}{key}|" + ",".join(f"{tag}={version}" for tag, version in versions)
+
+
+def _tag_versions(tags):
+    tags = sorted(set(tags))
+    values = _backend.get_many([_tag_key(tag) for tag in tags]) if tags else []
+    return [(tag, int(value or 0)) for tag, value in zip(tags, values)]
+
+
+def _json_default(value):
+    # Skalar NumPy -> tipe Python; sisanya (ObjectId, dll.) sebagai string
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+def _decode(raw):
+    return None if raw is None else json.loads(raw)
+
+
+def _encode(value):
+    return json.dumps(value, default=_json_default)
+
+
+def _compute(compute):
+    """compute() dalam bentuk yang sama dengan hasil cache (kunci dict jadi
+    string, tipe non-JSON lewat _json_default), apa pun jalurnya."""
+    return json.loads(_encode(compute()))
+
+
+def get_or_compute(key, compute, ttl=DEFAULT_TTL_SECONDS, tags=()):
+    """Nilai cache `key` (dikunci juga oleh versi `tags`), atau hitung dengan compute().
+
+    Hasil compute harus bisa di-serialisasi JSON. Bila backend bermasalah,
+    compute() dipanggil langsung (fail-open)."""
+    try:
+        entry = _entry_key(key, _tag_versions(tags))
+        cached = _decode(_backend.get_many([entry])[0])
+        if cached is not None:
+            return cached
+    except Exception:
+        return _compute(compute)
+
+    # Single-flight di dalam proses: thread lain menunggu thread pertama
+    with _local_flights_lock:
+        flight = _local_flights.get(entry)
+        leader = flight is None
+        if leader:
+            flight = _local_flights[entry] = threading.Event()
+    if not leader:
+        flight.wait(LOCK_WAIT_SECONDS)
+        try:
+            cached = _decode(_backend.get_many([entry])[0])
+        except Exception:
+            cached = None
+        return cached if cached is not None else _compute(compute)
+
+    try:
+        return _compute_shared(entry, compute, ttl)
+    finally:
+        with _local_flights_lock:
+            _local_flights.pop(entry, None)
+        flight.set()
+
+
+def _compute_shared(entry, compute, ttl):
+    """Single-flight antar worker memakai lock di backend (SET NX + TTL)."""
+    lock_key, token = entry + "|lock", uuid.uuid4().hex
+    try:
+        locked = _backend.add(lock_key, token, LOCK_TTL_SECONDS)
+    except Exception:
+        return _compute(compute)
+
+    if not locked:
+        deadline = time.time() + LOCK_WAIT_SECONDS
+        while time.time() < deadline:
+            time.sleep(LOCK_POLL_SECONDS)
+            try:
+                cached = _decode(_backend.get_many([entry])[0])
+            except Exception:
+                break
+            if cached is not None:
+                return cached
+        return _compute(compute)
+
+    try:
+        encoded = _encode(compute())
+        try:
+            _backend.set(entry, encoded, ttl)
+        except Exception:
+            pass
+        return json.loads(encoded)
+    finally:
+        try:
+            _backend.delete(lock_key, token)
+        except Exception:
+            pass
+
+
+def invalidate(*tags):
+    """Dipanggil endpoint tulis: semua entry bertag ini dianggap basi."""
+    for tag in tags:
+        try:
+            _backend.incr(_tag_key(tag))
+        except Exception:
+            pass
@@ -0,0 +1,175 @@
+# risk_scoring.py
+import time
+
+import response_cache
+from models import get_wo_collection
+
+DAY_SECONDS = 24 * 60 * 60
+RECENT_DAYS = 30
+WINDOW_DAYS = 90
+RISK_CACHE_TTL_SECONDS = 300
+OPEN_STATUSES = ["Baru", "Ditugaskan", "Dalam Pengerjaan", "Selesai"]
+
+# Bobot komponen skor risiko (total 100)
+WEIGHT_RECENT_RATE = 35
+WEIGHT_WINDOW_RATE = 15
+WEIGHT_MTBF_TREND = 15
+WEIGHT_MAINTENANCE_AGE = 20
+WEIGHT_BACKLOG = 15
+HIGH_RISK_SCORE = 60
+MEDIUM_RISK_SCORE = 35
+
+SORT_FIELDS = ("risk_score", "breakdowns_30d", "breakdowns_90d", "mtbf_days",
+               "days_since_maintenance", "open_wo", "asset_name", "efficiency")
+
+
+def build_risk_pipeline(now):
+    """Satu aggregation atas work_orders (+ aset via $unionWith) per aset.
+
+    Jendela 90 hari terakhir dibandingkan dengan 90 hari sebelumnya untuk
+    tren MTBF; WO yang masih terbuka dihitung sebagai backlog berapa pun
+    umurnya. Aset tanpa WO tetap muncul karena dokumen aset ikut digabung."""
+    recent_start = now - RECENT_DAYS * DAY_SECONDS
+    window_start = now - WINDOW_DAYS * DAY_SECONDS
+    previous_start = now - 2 * WINDOW_DAYS * DAY_SECONDS
+    corrective = {"$eq": ["$type", "Korektif"]}
+
+    def count_if(*conditions):
+        return {"$sum": {"$cond": [{"$and": list(conditions)}, 1, 0]}}
+
+    return [
+        {"$match": {"$or": [
+            {"timestamp_created": {"$gte": previous_start}},
+            {"status": {"$in": OPEN_STATUSES}}
+        ]}},
+        {"$project": {"asset_name": 1, "type": 1, "status": 1, "timestamp_created": 1}},
+        {"$unionWith": {
+            "coll": "assets",
+            "pipeline": [{"$project": {
+                "_id": 0, "_asset": {"$literal": True}, "asset_name": "$name", "asset_type": "$type",
+                "last_maintenance": 1, "efficiency": 1, "breakdown_count": 1
+            }}]
+        }},
+        {"$group": {
+            "_id": "$asset_name",
+            "is_asset": {"$max": {"$ifNull": ["$_asset", False]}},
+            "asset_type": {"$max": "$asset_type"},
+            "last_maintenance": {"$max": "$last_maintenance"},
+            "efficiency": {"$max": "$efficiency"},
+            "breakdown_count": {"$max": "$breakdown_count"},
+            "breakdowns_30d": count_if(corrective, {"$gte": ["$timestamp_created", recent_start]}),
+            "breakdowns_90d": count_if(corrective, {"$gte": ["$timestamp_created", window_start]}),
+            "breakdowns_previous_90d": count_if(
+                corrective,
+                {"$gte": ["$timestamp_created", previous_start]},
+                {"$lt": ["$timestamp_created", window_start]}
+            ),
+            "open_wo": count_if({"$in": [{"$ifNull": ["$status", None]}, OPEN_STATUSES]})
+        }},
+        {"$match": {"is_asset": True}}
+    ]
+
+
+def _mtbf_days(breakdowns):
+    return round(WINDOW_DAYS / breakdowns, 1) if breakdowns else None
+
+
+def score_asset(row, now):
+    """Skor risiko 0-100 dan faktor dominannya untuk satu baris hasil aggregation."""
+    recent = row.get("breakdowns_30d", 0)
+    window = row.get("breakdowns_90d", 0)
+    previous = row.get("breakdowns_previous_90d", 0)
+    open_wo = row.get("open_wo", 0)
+    last_maintenance = row.get("last_maintenance")
+    days_since = (now - last_maintenance) / DAY_SECONDS if last_maintenance else None
+
+    # Laju kerusakan naik (MTBF turun) dibanding 90 hari sebelumnya
+    if previous:
+        trend = window / previous
+    else:
+        trend = 2.0 if window else 1.0
+
+    components = {
+        "recent_rate": WEIGHT_RECENT_RATE * min(recent / 3, 1),
+        "window_rate": WEIGHT_WINDOW_RATE * min(window / 6, 1),
+        "mtbf_trend": WEIGHT_MTBF_TREND * min(max(trend - 1, 0), 1),
+        "maintenance_age": WEIGHT_MAINTENANCE_AGE * (min(days_since / WINDOW_DAYS, 1) if days_since is not None else 1),
+        "backlog": WEIGHT_BACKLOG * min(open_wo / 3, 1)
+    }
+    score = round(sum(components.values()), 1)
+    return score, max(components, key=components.get), days_since, trend
+
+
+def _recommendation(risk_level, factor):
+    if risk_level == "Rendah":
+        return "Monitoring rutin"
+    recommendations = {
+        "recent_rate": "Kerusakan berulang 30 hari terakhir, lakukan analisis akar masalah",
+        "window_rate": "Frekuensi kerusakan tinggi, perlu evaluasi mendalam",
+        "mtbf_trend": "MTBF menurun dibanding periode sebelumnya, jadwalkan preventive maintenance",
+        "maintenance_age": "Maintenance terakhir sudah lama, perlu penjadwalan preventive maintenance",
+        "backlog": "Banyak WO terbuka, prioritaskan penyelesaian backlog"
+    }
+    prefix = "Segera: " if risk_level == "Tinggi" else ""
+    return prefix + recommendations[factor]
+
+
+def compute_risk_table(now=None):
+    now = int(now or time.time())
+    table = []
+    for row in get_wo_collection().aggregate(build_risk_pipeline(now)):
+        score, factor, days_since, trend = score_asset(row, now)
+        risk_level = "Tinggi" if score >= HIGH_RISK_SCORE else "Sedang" if score >= MEDIUM_RISK_SCORE else "Rendah"
+        table.append({
+            "asset_name": row["_id"],
+            "asset_type": row.get("asset_type"),
+            "breakdown_count": row.get("breakdown_count") or 0,
+            "breakdowns_30d": row.get("breakdowns_30d", 0),
+            "breakdowns_90d": row.get("breakdowns_90d", 0),
+            "mtbf_days": _mtbf_days(row.get("breakdowns_90d", 0)),
+            "mtbf_days_previous": _mtbf_days(row.get("breakdowns_previous_90d", 0)),
+            "failure_rate_trend": round(trend, 2),
+            "open_wo": row.get("open_wo", 0),
+            "last_maintenance_ts": row.get("last_maintenance"),
+            "days_since_maintenance": round(days_since, 1) if days_since is not None else None,
+            "efficiency": row.get("efficiency", 0),
+            "risk_score": score,
+            "risk_level": risk_level,
+            "main_factor": factor,
+            "recommendation": _recommendation(risk_level, factor)
+        })
+    table.sort(key=lambda item: item["risk_score"], reverse=True)
+    return table
+
+
+def get_risk_table():
+    """Tabel risiko dari response_cache; dihitung ulang saat kedaluwarsa atau saat
+    WO/aset berubah (tag work_orders, assets, risk). Invalidasi sampai ke semua
+    worker dengan backend sqlite (default) / redis, tidak dengan memory."""
+    cached = response_cache.get_or_compute(
+        "risk:table",
+        lambda: {"table": compute_risk_table(), "computed_at": int(time.time())},
+        RISK_CACHE_TTL_SECONDS, tags=("work_orders", "assets", "risk")
+    )
+    return cached["table"], cached["computed_at"]
+
+
+def invalidate_risk_cache():
+    """Dipanggil saat WO dibuat/ditutup atau aset baru didaftarkan."""
+    response_cache.invalidate("risk")
+
+
+def query_risk_table(table, sort="risk_score", order="desc", risk_level=None, page=1, limit=50):
+    """Filter, urutkan dan paginasi tabel risiko. Mengembalikan (items, total)."""
+    if sort not in SORT_FIELDS:
+        sort = "risk_score"
+    rows = [row for row in table if not risk_level or row["risk_level"] == risk_level]
+    # Nilai None selalu di akhir, apa pun arah urutannya
+    present = [row for row in rows if row.get(sort) is not None]
+    missing = [row for row in rows if row.get(sort) is None]
+    present.sort(key=lambda row: row[sort], reverse=(order == "desc"))
+    rows = present + missing
+
+    page = max(page, 1)
+    limit = max(min(limit, 500), 1)
+    return rows[(page - 1) * limit: page * limit], len(rows)
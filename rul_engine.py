@@ -0,0 +1,264 @@
+# rul_engine.py
+import argparse
+import math
+import os
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import get_context
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from models import (get_asset_collection, get_wo_collection, get_sensor_collection,
+                    get_sensor_reading_collection, get_component_rul_collection)
+
+# Estimasi remaining useful life (RUL) per komponen kritis dengan model
+# Weibull. Parameter (beta, eta) di-fit per nama komponen dari seluruh armada
+# (interval antar kerusakan + umur saat ini sebagai data tersensor), lalu
+# setiap aset diskor paralel: umur komponen, survival bersyarat, dan faktor
+# beban dari sensor (model inverse power law).
+DAY_SECONDS = 24 * 60 * 60
+SHARD_SIZE = 50
+MIN_FAILURES_FOR_FIT = 3
+# Prior jika data kerusakan komponen terlalu sedikit
+DEFAULT_BETA = 1.5
+DEFAULT_ETA_DAYS = 365.0
+RELIABILITY_HORIZON_DAYS = 30
+SENSOR_WINDOW_HOURS = 24
+NOMINAL_LOAD = 0.7
+STRESS_EXPONENT = 3.0
+MAX_STRESS_FACTOR = 10.0
+UNFILLED_COMPONENT = "Data belum diisi"
+
+FAILURE_PROJECTION = {"_id": 0, "asset_name": 1, "component_failed": 1, "components": 1, "timestamp_created": 1}
+
+
+def ensure_rul_indexes():
+    rul = get_component_rul_collection()
+    rul.create_index([("asset_name", ASCENDING), ("component", ASCENDING)], unique=True, name="component_key")
+    rul.create_index([("rul_days", ASCENDING)], name="rul_days")
+
+
+def _failure_query(asset_names=None):
+    query = {"type": "Korektif", "timestamp_created": {"$ne": None}}
+    if asset_names is not None:
+        query["asset_name"] = {"$in": asset_names}
+    return query
+
+
+def component_histories(assets, wo_cursor, now):
+    """Waktu kerusakan per (aset, komponen kritis) dari stream WO korektif.
+
+    Komponen diambil dari `component_failed` jika cocok dengan komponen kritis
+    aset, jika tidak dari daftar `components` yang dipilih pelapor."""
+    critical = {asset['name']: set(asset.get('critical_components') or []) for asset in assets}
+    failures = {}
+    for wo in wo_cursor:
+        components = critical.get(wo.get('asset_name'))
+        if not components:
+            continue
+        failed = wo.get('component_failed')
+        if failed and failed != UNFILLED_COMPONENT and failed in components:
+            hit = [failed]
+        else:
+            hit = [c for c in (wo.get('components') or []) if c in components]
+        for component in hit:
+            failures.setdefault((wo['asset_name'], component), []).append(wo['timestamp_created'])
+
+    histories = {}
+    for asset in assets:
+        installed = asset.get('installation_date') or now
+        for component in asset.get('critical_components') or []:
+            times = sorted(t for t in failures.get((asset['name'], component), []) if installed <= t <= now)
+            histories[(asset['name'], component)] = {"installed": installed, "failures": times}
+    return histories
+
+
+def _lifetimes(history, now):
+    """Interval antar kerusakan (teramati) dan umur sejak kerusakan terakhir (tersensor), hari."""
+    marks = [history["installed"]] + history["failures"]
+    observed = [(b - a) / DAY_SECONDS for a, b in zip(marks, marks[1:])]
+    censored = (now - marks[-1]) / DAY_SECONDS
+    return observed, censored
+
+
+def fit_weibull(observed, censored):
+    """MLE Weibull dengan data tersensor kanan; mengembalikan (beta, eta_days).
+
+    beta dicari dengan bisection pada persamaan profil likelihood, lalu
+    eta^beta = sum(t^beta) / jumlah kerusakan."""
+    observed = np.asarray([t for t in observed if t > 0], dtype=np.float64)
+    censored = np.asarray([t for t in censored if t > 0], dtype=np.float64)
+    every = np.concatenate([observed, censored])
+    if every.size == 0:
+        return DEFAULT_BETA, DEFAULT_ETA_DAYS
+    if observed.size < MIN_FAILURES_FOR_FIT:
+        # Prior beta, eta dari total waktu operasi / (kerusakan + 1) agar konservatif
+        beta = DEFAULT_BETA
+        eta = (np.sum(every ** beta) / (observed.size + 1)) ** (1 / beta)
+        return beta, float(min(eta, DEFAULT_ETA_DAYS * 5))
+
+    scale = every.max()
+    every_scaled = every / scale
+    log_every = np.log(every_scaled)
+    mean_log_failed = np.mean(np.log(observed / scale))
+
+    def score(beta):
+        powered = every_scaled ** beta
+        return np.sum(powered * log_every) / np.sum(powered) - 1 / beta - mean_log_failed
+
+    low, high = 0.1, 20.0
+    if score(low) > 0 or score(high) < 0:
+        beta = DEFAULT_BETA
+    else:
+        for _ in range(60):
+            mid = (low + high) / 2
+            if score(mid) > 0:
+                high = mid
+            else:
+                low = mid
+        beta = (low + high) / 2
+    eta = scale * (np.sum(every_scaled ** beta) / observed.size) ** (1 / beta)
+    return float(beta), float(eta)
+
+
+def fit_fleet_parameters(now=None):
+    """Parameter Weibull per nama komponen dari histori seluruh aset."""
+    now = int(now or time.time())
+    assets = list(get_asset_collection().find({}, {"name": 1, "critical_components": 1, "installation_date": 1}))
+    cursor = get_wo_collection().find(_failure_query(), FAILURE_PROJECTION, batch_size=10000)
+    histories = component_histories(assets, cursor, now)
+
+    samples = {}
+    for (_, component), history in histories.items():
+        observed, censored = _lifetimes(history, now)
+        bucket = samples.setdefault(component, ([], []))
+        bucket[0].extend(observed)
+        bucket[1].append(censored)
+
+    parameters = {}
+    for component, (observed, censored) in samples.items():
+        beta, eta = fit_weibull(observed, censored)
+        parameters[component] = {"beta": beta, "eta_days": eta, "failures": len(observed)}
+    return parameters
+
+
+def residual_life(age, beta, eta, quantile=0.5):
+    """Sisa umur r sehingga P(gagal dalam r | bertahan hingga age) = quantile."""
+    return eta * ((age / eta) ** beta - math.log(1 - quantile)) ** (1 / beta) - age
+
+
+def conditional_reliability(age, horizon, beta, eta):
+    return math.exp((age / eta) ** beta - ((age + horizon) / eta) ** beta)
+
+
+def _stress_factors(asset_names, now):
+    """Faktor percepatan keausan per aset dari rata-rata beban sensor terhadap threshold."""
+    thresholds = {
+        (doc['asset_name'], doc['sensor_type']): (doc['threshold'], doc.get('direction', 'above'))
+        for doc in get_sensor_collection().find({"asset_name": {"$in": asset_names}})
+        if doc.get('threshold')
+    }
+    if not thresholds:
+        return {}
+
+    factors = {}
+    for row in get_sensor_reading_collection().aggregate([
+        {"$match": {"asset_name": {"$in": asset_names}, "timestamp": {"$gte": now - SENSOR_WINDOW_HOURS * 60 * 60}}},
+        {"$group": {"_id": {"asset_name": "$asset_name", "sensor_type": "$sensor_type"}, "mean": {"$avg": "$value"}}}
+    ]):
+        key = (row["_id"]["asset_name"], row["_id"]["sensor_type"])
+        if key not in thresholds or not row["mean"]:
+            continue
+        threshold, direction = thresholds[key]
+        load = row["mean"] / threshold if direction == "above" else threshold / row["mean"]
+        factor = min(max(load / NOMINAL_LOAD, 1.0) ** STRESS_EXPONENT, MAX_STRESS_FACTOR)
+        factors[key[0]] = max(factors.get(key[0], 1.0), factor)
+    return factors
+
+
+def score_shard(asset_names, parameters, now, run_id):
+    """Dijalankan di worker: stream data satu shard aset, hitung RUL, bulk write."""
+    started = time.time()
+    assets = list(get_asset_collection().find(
+        {"name": {"$in": asset_names}}, {"name": 1, "critical_components": 1, "installation_date": 1}
+    ))
+    cursor = get_wo_collection().find(_failure_query(asset_names), FAILURE_PROJECTION, batch_size=5000)
+    histories = component_histories(assets, cursor, now)
+    stress = _stress_factors(asset_names, now)
+
+    operations = []
+    for (asset_name, component), history in histories.items():
+        fleet = parameters.get(component, {"beta": DEFAULT_BETA, "eta_days": DEFAULT_ETA_DAYS, "failures": 0})
+        factor = stress.get(asset_name, 1.0)
+        beta, eta = fleet["beta"], fleet["eta_days"] / factor
+        _, age = _lifetimes(history, now)
+
+        rul = residual_life(age, beta, eta)
+        operations.append(UpdateOne(
+            {"asset_name": asset_name, "component": component},
+            {"$set": {
+                "age_days": round(age, 1),
+                "failures": len(history["failures"]),
+                "last_failure": history["failures"][-1] if history["failures"] else None,
+                "beta": round(beta, 3),
+                "eta_days": round(eta, 1),
+                "stress_factor": round(factor, 2),
+                "rul_days": round(rul, 1),
+                "rul_p10_days": round(residual_life(age, beta, eta, 0.1), 1),
+                "reliability_30d": round(conditional_reliability(age, RELIABILITY_HORIZON_DAYS, beta, eta), 4),
+                "expected_failure_date": now + int(rul * DAY_SECONDS),
+                "fleet_failures": fleet["failures"],
+                "run_id": run_id,
+                "scored_at": now
+            }},
+            upsert=True
+        ))
+    if operations:
+        get_component_rul_collection().bulk_write(operations, ordered=False)
+    return {"assets": len(assets), "components": len(operations), "seconds": time.time() - started}
+
+
+def run_rul_scoring(workers=None, shard_size=SHARD_SIZE, now=None, report=print):
+    """Batch malam: fit parameter armada lalu skor semua aset paralel per shard."""
+    now = int(now or time.time())
+    started = time.time()
+    run_id = uuid.uuid4().hex
+    parameters = fit_fleet_parameters(now)
+
+    names = [asset['name'] for asset in get_asset_collection().find({}, {"name": 1}).sort("name", 1)]
+    shards = [names[i:i + shard_size] for i in range(0, len(names), shard_size)]
+    totals = {"assets": 0, "components": 0}
+    if not shards:
+        return dict(totals, run_id=run_id, shards=0, seconds=0.0)
+
+    # spawn: setiap worker membuka koneksi MongoDB sendiri (MongoClient tidak fork-safe)
+    workers = workers or min(os.cpu_count() or 1, len(shards))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        futures = [pool.submit(score_shard, shard, parameters, now, run_id) for shard in shards]
+        for done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            totals["assets"] += result["assets"]
+            totals["components"] += result["components"]
+            elapsed = time.time() - started
+            if report:
+                report(f"[{done}/{len(shards)}] {totals['assets']} aset, {totals['components']} komponen "
+                       f"({totals['components'] / elapsed:.0f} komponen/detik)")
+
+    # Komponen yang sudah tidak ada di critical_components aset dibuang
+    stale = get_component_rul_collection().delete_many({"run_id": {"$ne": run_id}})
+    return dict(totals, run_id=run_id, shards=len(shards), workers=workers,
+                stale_removed=stale.deleted_count, seconds=round(time.time() - started, 1))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Hitung remaining useful life komponen kritis semua aset")
+    parser.add_argument("--workers", type=int, default=None, help="Jumlah proses worker (default: jumlah CPU)")
+    parser.add_argument("--shard-size", type=int, default=SHARD_SIZE, help="Jumlah aset per shard")
+    args = parser.parse_args()
+
+    ensure_rul_indexes()
+    summary = run_rul_scoring(args.workers, args.shard_size)
+    print(f"Selesai: {summary['components']} komponen dari {summary['assets']} aset "
+          f"dalam {summary['seconds']} detik")
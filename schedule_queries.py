@@ -0,0 +1,120 @@
+# schedule_queries.py
+import argparse
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo import ASCENDING, UpdateOne
+
+from models import get_schedule_collection, get_pm_plan_collection
+
+# `assignee` adalah bentuk ter-normalisasi dari `assigned_to`: username
+# teknisi, atau UNASSIGNED untuk jadwal yang boleh dikerjakan siapa saja
+# (assigned_to kosong / tidak ada). Filter teknisi menjadi satu $in pada
+# field ber-index, menggantikan $or tiga cabang yang tidak bisa memakai index.
+UNASSIGNED = "*"
+CALENDAR_MAX_DAYS = 92
+CALENDAR_DEFAULT_LIMIT = 200
+CALENDAR_MAX_LIMIT = 1000
+
+
+def assignee_of(assigned_to):
+    return assigned_to or UNASSIGNED
+
+
+def technician_filter(username):
+    """Jadwal milik teknisi ini ATAU tanpa penugasan spesifik."""
+    return {"assignee": {"$in": [username, UNASSIGNED]}}
+
+
+def ensure_schedule_indexes():
+    schedule = get_schedule_collection()
+    schedule.create_index(
+        [("assignee", ASCENDING), ("status", ASCENDING), ("scheduled_date", ASCENDING)],
+        name="assignee_status_date"
+    )
+    schedule.create_index([("assignee", ASCENDING), ("scheduled_date", ASCENDING), ("_id", ASCENDING)],
+                          name="assignee_date_id")
+    schedule.create_index([("status", ASCENDING), ("scheduled_date", ASCENDING)], name="status_date")
+    schedule.create_index([("scheduled_date", ASCENDING), ("_id", ASCENDING)], name="date_id")
+    get_pm_plan_collection().create_index([("active", ASCENDING), ("assignee", ASCENDING)], name="active_assignee")
+
+
+def backfill_assignee(batch_size=1000):
+    """Migrasi: isi `assignee` untuk jadwal dan rencana PM lama yang belum punya."""
+    updated = {}
+    for name, collection in (("maintenance_schedule", get_schedule_collection()), ("pm_plans", get_pm_plan_collection())):
+        operations, count = [], 0
+        for doc in collection.find({"assignee": {"$exists": False}}, {"assigned_to": 1}):
+            operations.append(UpdateOne({"_id": doc['_id']}, {"$set": {"assignee": assignee_of(doc.get('assigned_to'))}}))
+            if len(operations) >= batch_size:
+                count += collection.bulk_write(operations, ordered=False).modified_count
+                operations = []
+        if operations:
+            count += collection.bulk_write(operations, ordered=False).modified_count
+        updated[name] = count
+    return updated
+
+
+def _sort_key(item):
+    return item['scheduled_date'], str(item['_id'])
+
+
+def encode_cursor(item):
+    scheduled_date, item_id = _sort_key(item)
+    return f"{scheduled_date}_{item_id}"
+
+
+def decode_cursor(cursor):
+    scheduled_date, separator, item_id = cursor.partition("_")
+    if not separator or not item_id:
+        raise ValueError("cursor tidak valid")
+    return int(scheduled_date), item_id
+
+
+def calendar_page(date_from, date_to, base_query=None, cursor=None, limit=CALENDAR_DEFAULT_LIMIT, virtual=None):
+    """Satu halaman jadwal dalam [date_from, date_to) terurut (scheduled_date, _id).
+
+    `virtual` berisi occurrence PM yang belum di-materialize dalam jendela
+    yang sama; keduanya digabung dengan urutan yang sama sehingga cursor tetap
+    konsisten. ID virtual ("plan:...") selalu diurutkan setelah ObjectId pada
+    tanggal yang sama."""
+    query = dict(base_query or {})
+    query["scheduled_date"] = {"$gte": date_from, "$lt": date_to}
+    after = None
+    if cursor:
+        after = decode_cursor(cursor)
+        scheduled_date, item_id = after
+        if ObjectId.is_valid(item_id):
+            query["$or"] = [
+                {"scheduled_date": {"$gt": scheduled_date}},
+                {"scheduled_date": scheduled_date, "_id": {"$gt": ObjectId(item_id)}}
+            ]
+        else:
+            query["scheduled_date"]["$gt"] = scheduled_date
+
+    items = list(get_schedule_collection().find(query).sort([("scheduled_date", 1), ("_id", 1)]).limit(limit + 1))
+    if virtual:
+        items += [item for item in virtual if after is None or _sort_key(item) > after]
+        items.sort(key=_sort_key)
+
+    page = items[:limit]
+    next_cursor = encode_cursor(page[-1]) if len(items) > limit else None
+    return page, next_cursor
+
+
+def bucket_by_day(items):
+    days = {}
+    for item in items:
+        day = datetime.fromtimestamp(item['scheduled_date']).strftime('%Y-%m-%d')
+        days.setdefault(day, []).append(item)
+    return days
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Migrasi field assignee dan index maintenance_schedule")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    ensure_schedule_indexes()
+    summary = backfill_assignee(args.batch_size)
+    print(", ".join(f"{name}: {count} dokumen diperbarui" for name, count in summary.items()))
@@ -0,0 +1,177 @@
+# technician_capacity.py
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta
+
+from models import get_schedule_collection, get_wo_collection
+from schedule_queries import UNASSIGNED
+
+# Index interval per teknisi di memori: jadwal yang ditugaskan
+# (scheduled_date + duration) dan WO aktif (timestamp_started +
+# estimated_duration). Per teknisi disimpan blok gabungan (union interval)
+# terurut sehingga cek bentrok dan pencarian slot kosong cukup bisect
+# O(log n). Index ditulis langsung saat endpoint mengubah data dan dibangun
+# ulang berkala dari database agar perubahan dari worker lain ikut terbawa.
+REFRESH_SECONDS = 60
+DEFAULT_WO_MINUTES = 120
+DEFAULT_SCHEDULE_MINUTES = 60
+WORK_START_HOUR = 8
+WORK_END_HOUR = 17
+FREE_SLOT_SEARCH_DAYS = 14
+ACTIVE_SCHEDULE_STATUSES = ["Dijadwalkan", "Dalam Pengerjaan"]
+ACTIVE_WO_STATUSES = ["Ditugaskan", "Dalam Pengerjaan"]
+
+
+def schedule_interval(schedule):
+    start = schedule['scheduled_date']
+    return start, start + int(schedule.get('duration') or DEFAULT_SCHEDULE_MINUTES) * 60
+
+
+def wo_interval(wo, now=None):
+    # planned_start diisi dispatcher otomatis (WO berurutan per teknisi)
+    start = wo.get('planned_start') or wo.get('timestamp_started') or wo.get('timestamp_assigned') or int(now or time.time())
+    return start, start + int(wo.get('estimated_duration') or DEFAULT_WO_MINUTES) * 60
+
+
+class TechnicianIntervalIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._intervals = {}   # teknisi -> {ref: (start, end, info)}
+        self._owner = {}       # ref -> teknisi
+        self._blocks = {}      # teknisi -> (starts, ends, members)
+        self._loaded_at = 0
+
+    def _ensure_fresh(self):
+        if time.time() - self._loaded_at >= REFRESH_SECONDS:
+            self.rebuild()
+
+    def rebuild(self, now=None):
+        now = int(now or time.time())
+        intervals = {}
+        for schedule in get_schedule_collection().find(
+            {"assignee": {"$ne": UNASSIGNED}, "status": {"$in": ACTIVE_SCHEDULE_STATUSES}, "scheduled_date": {"$gte": now - 24 * 60 * 60}},
+            {"assignee": 1, "scheduled_date": 1, "duration": 1, "asset_name": 1, "description": 1}
+        ):
+            start, end = schedule_interval(schedule)
+            intervals.setdefault(schedule['assignee'], {})[f"schedule:{schedule['_id']}"] = (
+                start, end, {"kind": "schedule", "asset_name": schedule.get('asset_name'), "description": schedule.get('description')}
+            )
+        for wo in get_wo_collection().find(
+            {"status": {"$in": ACTIVE_WO_STATUSES}, "assigned_to": {"$nin": ["", None]}},
+            {"assigned_to": 1, "timestamp_started": 1, "timestamp_assigned": 1, "planned_start": 1, "estimated_duration": 1,
+             "asset_name": 1, "description": 1}
+        ):
+            start, end = wo_interval(wo, now)
+            intervals.setdefault(wo['assigned_to'], {})[f"wo:{wo['_id']}"] = (
+                start, end, {"kind": "wo", "asset_name": wo.get('asset_name'), "description": wo.get('description')}
+            )
+
+        blocks = {technician: self._merge(items) for technician, items in intervals.items()}
+        owner = {ref: technician for technician, items in intervals.items() for ref in items}
+        with self._lock:
+            self._intervals, self._blocks, self._owner = intervals, blocks, owner
+            self._loaded_at = time.time()
+
+    @staticmethod
+    def _merge(items):
+        starts, ends, members = [], [], []
+        for ref, (start, end, _) in sorted(items.items(), key=lambda item: item[1][0]):
+            if starts and start < ends[-1]:
+                ends[-1] = max(ends[-1], end)
+                members[-1].append(ref)
+            else:
+                starts.append(start)
+                ends.append(end)
+                members.append([ref])
+        return starts, ends, members
+
+    def upsert(self, technician, ref, start, end, info=None):
+        """Menambah / memindahkan satu interval (write-through dari endpoint)."""
+        with self._lock:
+            previous = self._owner.get(ref)
+            if previous is not None:
+                self._intervals[previous].pop(ref, None)
+                self._blocks[previous] = self._merge(self._intervals[previous])
+            items = self._intervals.setdefault(technician, {})
+            items[ref] = (start, end, info or {})
+            self._owner[ref] = technician
+            self._blocks[technician] = self._merge(items)
+
+    def remove(self, ref):
+        with self._lock:
+            technician = self._owner.pop(ref, None)
+            if technician is not None:
+                self._intervals[technician].pop(ref, None)
+                self._blocks[technician] = self._merge(self._intervals[technician])
+
+    def conflicts(self, technician, start, end, exclude=None):
+        """Interval teknisi yang beririsan dengan [start, end)."""
+        self._ensure_fresh()
+        with self._lock:
+            starts, ends, members = self._blocks.get(technician, ([], [], []))
+            items = self._intervals.get(technician, {})
+            # Blok terurut & saling lepas: hanya blok sebelum `end` yang mungkin beririsan
+            i = bisect_left(starts, end)
+            result = []
+            while i > 0 and ends[i - 1] > start:
+                i -= 1
+                for ref in members[i]:
+                    item_start, item_end, info = items[ref]
+                    if ref != exclude and item_start < end and item_end > start:
+                        result.append(dict(info, ref=ref, start=item_start, end=item_end))
+            return sorted(result, key=lambda item: item['start'])
+
+    def busy_seconds(self, technician, start, end):
+        self._ensure_fresh()
+        with self._lock:
+            starts, ends, _ = self._blocks.get(technician, ([], [], []))
+            i = bisect_right(ends, start)
+            total = 0
+            while i < len(starts) and starts[i] < end:
+                total += min(ends[i], end) - max(starts[i], start)
+                i += 1
+            return total
+
+    def next_free_slot(self, technician, duration_seconds, after, within_work_hours=True):
+        """Awal slot kosong pertama >= after sepanjang duration (None jika tidak ada dalam 14 hari)."""
+        self._ensure_fresh()
+        limit = after + FREE_SLOT_SEARCH_DAYS * 24 * 60 * 60
+        candidate = after
+        with self._lock:
+            starts, ends, _ = self._blocks.get(technician, ([], [], []))
+            while candidate < limit:
+                if within_work_hours:
+                    candidate = _clamp_to_work_hours(candidate, duration_seconds)
+                i = bisect_right(ends, candidate)
+                if i < len(starts) and starts[i] < candidate + duration_seconds:
+                    candidate = ends[i]
+                    continue
+                return candidate
+        return None
+
+    def technicians(self):
+        self._ensure_fresh()
+        with self._lock:
+            return list(self._intervals)
+
+
+def _clamp_to_work_hours(ts, duration_seconds):
+    moment = datetime.fromtimestamp(ts)
+    day_start = moment.replace(hour=WORK_START_HOUR, minute=0, second=0, microsecond=0)
+    day_end = moment.replace(hour=WORK_END_HOUR, minute=0, second=0, microsecond=0)
+    if moment < day_start:
+        return int(day_start.timestamp())
+    if moment + timedelta(seconds=duration_seconds) > day_end:
+        return int((day_start + timedelta(days=1)).timestamp())
+    return ts
+
+
+index = TechnicianIntervalIndex()
+
+
+def check_assignment(technician, start, end, exclude=None):
+    """Bentrok + saran slot kosong untuk penugasan [start, end)."""
+    conflicts = index.conflicts(technician, start, end, exclude)
+    suggestion = index.next_free_slot(technician, end - start, start) if conflicts else start
+    return conflicts, suggestion
@@ -0,0 +1,106 @@
+# technician_leaderboard.py
+import time
+
+from models import get_wo_collection
+from technician_capacity import WORK_START_HOUR, WORK_END_HOUR
+
+# Beban kerja & leaderboard semua teknisi dalam satu aggregation atas
+# work_orders: WO yang masih terbuka (berapa pun umurnya) dan WO yang
+# diselesaikan dalam jendela waktu dikelompokkan per `assigned_to`. Dokumen
+# users (role Teknisi) digabung lewat $unionWith sehingga teknisi tanpa WO
+# tetap muncul, seperti pola aset di risk_scoring.
+DAY_SECONDS = 24 * 60 * 60
+DEFAULT_WINDOW_DAYS = 30
+ACTIVE_STATUSES = ["Ditugaskan", "Dalam Pengerjaan", "Selesai"]
+DONE_STATUSES = ["Selesai", "Ditutup"]
+
+
+def build_leaderboard_pipeline(since):
+    """Satu $group per teknisi: jumlah per status, WO selesai & waktu perbaikan dalam jendela."""
+    completed_in_window = {"$and": [
+        {"$in": [{"$ifNull": ["$status", None]}, DONE_STATUSES]},
+        {"$gte": [{"$ifNull": ["$timestamp_completed", 0]}, since]}
+    ]}
+    # timestamp_started tercatat saat mulai dikerjakan; WO lama tanpa itu memakai waktu dibuat
+    repair_seconds = {"$max": [0, {"$subtract": [
+        "$timestamp_completed", {"$ifNull": ["$timestamp_started", "$timestamp_created"]}
+    ]}]}
+
+    def count_status(status):
+        return {"$sum": {"$cond": [{"$eq": ["$status", status]}, 1, 0]}}
+
+    return [
+        {"$match": {
+            "assigned_to": {"$nin": ["", None]},
+            "$or": [
+                {"status": {"$in": ACTIVE_STATUSES}},
+                {"timestamp_completed": {"$gte": since}}
+            ]
+        }},
+        {"$project": {"_id": 0, "assigned_to": 1, "status": 1, "type": 1,
+                      "timestamp_created": 1, "timestamp_started": 1, "timestamp_completed": 1}},
+        {"$unionWith": {
+            "coll": "users",
+            "pipeline": [
+                {"$match": {"role": "Teknisi"}},
+                {"$project": {"_id": 0, "assigned_to": "$username", "_name": "$name", "_technician": {"$literal": True}}}
+            ]
+        }},
+        {"$group": {
+            "_id": "$assigned_to",
+            "is_technician": {"$max": {"$ifNull": ["$_technician", False]}},
+            "name": {"$max": "$_name"},
+            "assigned": count_status("Ditugaskan"),
+            "in_progress": count_status("Dalam Pengerjaan"),
+            "awaiting_verification": count_status("Selesai"),
+            "completed": {"$sum": {"$cond": [completed_in_window, 1, 0]}},
+            "closed": {"$sum": {"$cond": [{"$and": [completed_in_window, {"$eq": ["$status", "Ditutup"]}]}, 1, 0]}},
+            "corrective": {"$sum": {"$cond": [{"$and": [completed_in_window, {"$eq": ["$type", "Korektif"]}]}, 1, 0]}},
+            "repair_seconds": {"$sum": {"$cond": [completed_in_window, repair_seconds, 0]}}
+        }},
+        {"$match": {"is_technician": True}}
+    ]
+
+
+def technician_leaderboard(days=DEFAULT_WINDOW_DAYS, now=None, collection=None):
+    """Leaderboard teknisi: paling banyak WO selesai dulu, lalu rata-rata perbaikan tercepat."""
+    if collection is None:
+        collection = get_wo_collection()
+    now = int(now or time.time())
+    since = now - days * DAY_SECONDS
+    work_seconds = days * (WORK_END_HOUR - WORK_START_HOUR) * 3600
+
+    technicians = []
+    for row in collection.aggregate(build_leaderboard_pipeline(since)):
+        completed = row["completed"]
+        avg_repair = row["repair_seconds"] / completed / 3600 if completed else None
+        technicians.append({
+            "username": row["_id"],
+            "name": row.get("name") or row["_id"],
+            "assigned": row["assigned"],
+            "in_progress": row["in_progress"],
+            "awaiting_verification": row["awaiting_verification"],
+            "open": row["assigned"] + row["in_progress"],
+            "completed": completed,
+            "closed": row["closed"],
+            "corrective_completed": row["corrective"],
+            "avg_repair_hours": round(avg_repair, 2) if avg_repair is not None else None,
+            "repair_hours": round(row["repair_seconds"] / 3600, 1),
+            # Jam perbaikan (selesai dalam jendela) dibanding jam kerja jendela yang sama
+            "utilization": round(min(row["repair_seconds"] / work_seconds * 100, 100), 1) if work_seconds else 0
+        })
+
+    technicians.sort(key=lambda item: (-item["completed"],
+                                       item["avg_repair_hours"] if item["avg_repair_hours"] is not None else float("inf"),
+                                       item["username"]))
+    for rank, item in enumerate(technicians, start=1):
+        item["rank"] = rank
+
+    return {
+        "days": days,
+        "since": since,
+        "generated_at": now,
+        "total_open": sum(item["open"] for item in technicians),
+        "total_completed": sum(item["completed"] for item in technicians),
+        "technicians": technicians
+    }
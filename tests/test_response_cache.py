@@ -0,0 +1,111 @@
+# tests/test_response_cache.py
+import os
+import socket
+import unittest
+import uuid
+from urllib.parse import urlparse
+
+import response_cache
+from response_cache import MemoryBackend, RedisBackend, SQLiteBackend
+
+# Server Redis lokal opsional; test RedisBackend dilewati bila tidak ada.
+# Memakai db 15 agar tidak menyentuh data cache aplikasi.
+TEST_REDIS_URL = os.environ.get("TEST_REDIS_URL", "redis://localhost:6379/15")
+
+
+def _redis_available(url):
+    parsed = urlparse(url)
+    try:
+        socket.create_connection((parsed.hostname or "localhost", parsed.port or 6379), timeout=0.5).close()
+        return True
+    except OSError:
+        return False
+
+
+class BackendSwapMixin:
+    """Menjalankan get_or_compute/invalidate di atas backend test dengan prefix unik."""
+
+    def use_backend(self, backend):
+        previous = response_cache._backend, response_cache.KEY_PREFIX
+        response_cache._backend = backend
+        response_cache.KEY_PREFIX = f"test:{uuid.uuid4().hex}:"
+        self.addCleanup(self._restore, previous)
+
+    def _restore(self, previous):
+        response_cache._backend, response_cache.KEY_PREFIX = previous
+
+
+class RoundTripTest(BackendSwapMixin, unittest.TestCase):
+    def test_leader_gets_same_shape_as_cache_hits(self):
+        for backend in (MemoryBackend(), SQLiteBackend(":memory:")):
+            self.use_backend(backend)
+            computed = lambda: {1: "a", "id": uuid.UUID(int=0)}
+            first = response_cache.get_or_compute("shape", computed, 60)
+            second = response_cache.get_or_compute("shape", computed, 60)
+            self.assertEqual(first, {"1": "a", "id": str(uuid.UUID(int=0))})
+            self.assertEqual(first, second)
+
+
+@unittest.skipUnless(_redis_available(TEST_REDIS_URL), f"Server Redis tidak tersedia di {TEST_REDIS_URL}")
+class RedisBackendTest(BackendSwapMixin, unittest.TestCase):
+    def setUp(self):
+        self.backend = RedisBackend(TEST_REDIS_URL)
+        self.prefix = f"test:{uuid.uuid4().hex}:"
+        self.addCleanup(self.backend.close)
+        self.addCleanup(self._delete_keys)
+
+    def _delete_keys(self):
+        keys = self.backend._call("KEYS", "test:*")
+        if keys:
+            self.backend._call("DEL", *keys)
+
+    def test_get_many_and_set(self):
+        self.backend.set(self.prefix + "a", "1")
+        self.backend.set(self.prefix + "b", "2", ttl=60)
+        self.assertEqual(self.backend.get_many([self.prefix + "a", self.prefix + "missing", self.prefix + "b"]),
+                         [b"1", None, b"2"])
+
+    def test_add_is_set_if_not_exists(self):
+        self.assertTrue(self.backend.add(self.prefix + "lock", "token-a", ttl=30))
+        self.assertFalse(self.backend.add(self.prefix + "lock", "token-b", ttl=30))
+        self.assertEqual(self.backend.get_many([self.prefix + "lock"]), [b"token-a"])
+
+    def test_delete_with_token_only_removes_own_lock(self):
+        self.backend.add(self.prefix + "lock", "token-a", ttl=30)
+        self.backend.delete(self.prefix + "lock", "token-b")
+        self.assertEqual(self.backend.get_many([self.prefix + "lock"]), [b"token-a"])
+        self.backend.delete(self.prefix + "lock", "token-a")
+        self.assertEqual(self.backend.get_many([self.prefix + "lock"]), [None])
+
+    def test_incr(self):
+        self.assertEqual(self.backend.incr(self.prefix + "counter"), 1)
+        self.assertEqual(self.backend.incr(self.prefix + "counter"), 2)
+
+    def test_tag_invalidation(self):
+        self.use_backend(self.backend)
+        calls = []
+
+        def compute():
+            calls.append(1)
+            return {"count": len(calls)}
+
+        self.assertEqual(response_cache.get_or_compute("kpi", compute, 60, tags=("work_orders",)), {"count": 1})
+        self.assertEqual(response_cache.get_or_compute("kpi", compute, 60, tags=("work_orders",)), {"count": 1})
+        response_cache.invalidate("work_orders")
+        self.assertEqual(response_cache.get_or_compute("kpi", compute, 60, tags=("work_orders",)), {"count": 2})
+        response_cache.invalidate("assets")
+        self.assertEqual(response_cache.get_or_compute("kpi", compute, 60, tags=("work_orders",)), {"count": 2})
+
+    def test_reconnects_after_connection_loss(self):
+        self.backend.set(self.prefix + "a", "1")
+        old_sock = self.backend._local.sock
+        old_sock.shutdown(socket.SHUT_RDWR)
+        with self.assertRaises(OSError):
+            self.backend.get_many([self.prefix + "a"])
+        self.assertIsNone(self.backend._local.sock)
+        self.assertEqual(old_sock.fileno(), -1)
+        self.assertEqual(self.backend.get_many([self.prefix + "a"]), [b"1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,321 @@
+# wo_events.py
+import argparse
+import time
+from datetime import datetime
+
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+
+from models import (get_wo_collection, get_wo_event_collection, get_counter_collection,
+                    get_projection_checkpoint_collection, get_technician_workload_collection,
+                    get_wo_kpi_daily_collection)
+
+# Event log transisi WO (append-only) di `wo_events`. Setiap event punya
+# `seq` global yang naik terus (counter `wo_events` di `counters`), sehingga
+# proyeksi bisa membaca log secara inkremental dari checkpoint-nya.
+#
+# Nomor seq dialokasikan sebelum insert, jadi event bisa ter-commit tidak
+# berurutan: proyeksi berhenti di celah seq dan baru melompatinya bila event
+# sesudahnya sudah lebih tua dari GAP_GRACE_SECONDS (insert yang gagal).
+#
+# Update read model dijaga per dokumen dengan `seq` terakhir yang diterapkan
+# (filter seq < event), sehingga memproses ulang satu batch setelah crash
+# tidak menghitung dua kali.
+EVENT_CREATED = "created"
+EVENT_ASSIGNED = "assigned"
+EVENT_STARTED = "started"
+EVENT_COMPLETED = "completed"
+EVENT_VERIFIED = "verified"
+EVENT_TYPES = (EVENT_CREATED, EVENT_ASSIGNED, EVENT_STARTED, EVENT_COMPLETED, EVENT_VERIFIED)
+
+SEQUENCE_KEY = "wo_events"
+GAP_GRACE_SECONDS = 30
+DEFAULT_BATCH_SIZE = 500
+
+
+def ensure_event_indexes():
+    get_wo_event_collection().create_index([("seq", ASCENDING)], unique=True, name="seq")
+    get_wo_event_collection().create_index([("wo_id", ASCENDING), ("seq", ASCENDING)], name="wo_seq")
+
+
+def _allocate_seq(count):
+    """Alokasikan `count` nomor seq berurutan; mengembalikan nomor pertama."""
+    doc = get_counter_collection().find_one_and_update(
+        {"_id": SEQUENCE_KEY}, {"$inc": {"seq": count}},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["seq"] - count + 1
+
+
+def make_event(wo, event_type, actor, at=None, **data):
+    """Dokumen event untuk satu transisi; `wo` minimal berisi _id (+ asset_name, type)."""
+    return {
+        "wo_id": str(wo["_id"]),
+        "type": event_type,
+        "at": int(at or time.time()),
+        "actor": actor,
+        "asset_name": wo.get("asset_name"),
+        "wo_type": wo.get("type"),
+        "data": data
+    }
+
+
+def append_events(events):
+    """Tulis event ke log (append-only) dan kembalikan seq terakhir."""
+    if not events:
+        return None
+    first = _allocate_seq(len(events))
+    for offset, event in enumerate(events):
+        event["seq"] = first + offset
+    get_wo_event_collection().insert_many(events, ordered=True)
+    return first + len(events) - 1
+
+
+def record_event(wo, event_type, actor, at=None, **data):
+    return append_events([make_event(wo, event_type, actor, at, **data)])
+
+
+def wo_history(wo_id):
+    return list(get_wo_event_collection().find({"wo_id": wo_id}, {"_id": 0}).sort("seq", ASCENDING))
+
+
+# --- Proyeksi ---
+
+class Projection:
+    """Read model yang dibangun dari event log.
+
+    Subclass mengisi `name`, `collection` dan `changes(event)`, yang
+    mengembalikan {_id dokumen read model: {field: delta}} untuk satu event."""
+    name = None
+    collection = None
+
+    def changes(self, event):
+        raise NotImplementedError
+
+    def reset(self):
+        self.collection().delete_many({})
+
+
+def _local_day(timestamp):
+    return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d')
+
+
+class TechnicianWorkloadProjection(Projection):
+    """Jumlah WO per status & total waktu perbaikan per teknisi."""
+    name = "technician_workload"
+    collection = staticmethod(get_technician_workload_collection)
+    STATUS_FIELDS = {"Ditugaskan": "assigned", "Dalam Pengerjaan": "in_progress"}
+
+    def changes(self, event):
+        data = event["data"]
+        technician = data.get("technician")
+        result = {}
+
+        def add(key, field, delta):
+            if key:
+                result.setdefault(key, {}).setdefault(field, 0)
+                result[key][field] += delta
+
+        if event["type"] == EVENT_ASSIGNED:
+            previous = self.STATUS_FIELDS.get(data.get("previous_status"))
+            if previous:
+                add(data.get("previous_technician"), previous, -1)
+            add(technician, "assigned", 1)
+        elif event["type"] == EVENT_STARTED:
+            add(technician, "assigned", -1)
+            add(technician, "in_progress", 1)
+        elif event["type"] == EVENT_COMPLETED:
+            # WO bisa diselesaikan langsung dari Ditugaskan; event lama tanpa
+            # previous_status selalu dari Dalam Pengerjaan
+            add(technician, self.STATUS_FIELDS.get(data.get("previous_status"), "in_progress"), -1)
+            add(technician, "completed", 1)
+            started = data.get("started_at") or data.get("created_at")
+            if started:
+                add(technician, "repairs", 1)
+                add(technician, "repair_seconds", max(event["at"] - started, 0))
+        elif event["type"] == EVENT_VERIFIED:
+            add(technician, "completed", -1)
+            add(technician, "closed", 1)
+        return result
+
+
+class DailyKpiProjection(Projection):
+    """KPI harian (waktu lokal): WO dibuat/ditugaskan/dimulai/selesai/ditutup,
+    waktu respon (dibuat -> ditugaskan pertama) dan waktu perbaikan."""
+    name = "wo_kpi_daily"
+    collection = staticmethod(get_wo_kpi_daily_collection)
+    COUNTERS = {EVENT_CREATED: "created", EVENT_ASSIGNED: "assigned", EVENT_STARTED: "started",
+                EVENT_COMPLETED: "completed", EVENT_VERIFIED: "closed"}
+
+    def changes(self, event):
+        data = event["data"]
+        deltas = {self.COUNTERS[event["type"]]: 1}
+        if event["type"] == EVENT_ASSIGNED and not data.get("previous_technician") and data.get("created_at"):
+            deltas["responses"] = 1
+            deltas["response_seconds"] = max(event["at"] - data["created_at"], 0)
+        elif event["type"] == EVENT_COMPLETED and (data.get("started_at") or data.get("created_at")):
+            deltas["repairs"] = 1
+            deltas["repair_seconds"] = max(event["at"] - (data.get("started_at") or data["created_at"]), 0)
+        return {_local_day(event["at"]): deltas}
+
+
+PROJECTIONS = {projection.name: projection for projection in (TechnicianWorkloadProjection(), DailyKpiProjection())}
+
+
+def get_checkpoint(name):
+    doc = get_projection_checkpoint_collection().find_one({"_id": name})
+    return doc.get("seq", 0) if doc else 0
+
+
+def _read_batch(after_seq, batch_size, now):
+    """Event kontigu setelah `after_seq`; berhenti di celah seq yang masih baru."""
+    batch, expected = [], after_seq + 1
+    for event in get_wo_event_collection().find({"seq": {"$gt": after_seq}}).sort("seq", ASCENDING).limit(batch_size):
+        if event["seq"] != expected and now - event["at"] < GAP_GRACE_SECONDS:
+            break
+        batch.append(event)
+        expected = event["seq"] + 1
+    return batch
+
+
+def _apply(projection, events):
+    operations = {}
+    for event in events:
+        for key, deltas in projection.changes(event).items():
+            operations.setdefault(key, []).append(UpdateOne(
+                {"_id": key, "seq": {"$lt": event["seq"]}},
+                {"$inc": deltas, "$set": {"seq": event["seq"], "updated_at": event["at"]}}
+            ))
+    if not operations:
+        return
+    collection = projection.collection()
+    # Dokumen dibuat dulu (idempoten) agar update berjaga seq tidak perlu upsert
+    collection.bulk_write([UpdateOne({"_id": key}, {"$setOnInsert": {"seq": 0}}, upsert=True) for key in operations],
+                          ordered=False)
+    collection.bulk_write([operation for ops in operations.values() for operation in ops], ordered=True)
+
+
+def run_projection(name, batch_size=DEFAULT_BATCH_SIZE, now=None):
+    """Proses event baru sejak checkpoint; mengembalikan jumlah event yang diterapkan."""
+    projection = PROJECTIONS[name]
+    applied = 0
+    while True:
+        checkpoint = get_checkpoint(name)
+        batch = _read_batch(checkpoint, batch_size, time.time() if now is None else now)
+        if not batch:
+            return applied
+        _apply(projection, batch)
+        get_projection_checkpoint_collection().update_one(
+            {"_id": name}, {"$max": {"seq": batch[-1]["seq"]}, "$set": {"updated_at": int(time.time())}}, upsert=True
+        )
+        applied += len(batch)
+        if len(batch) < batch_size:
+            return applied
+
+
+def replay_projection(name, batch_size=DEFAULT_BATCH_SIZE):
+    """Bangun ulang read model dari awal log."""
+    PROJECTIONS[name].reset()
+    get_projection_checkpoint_collection().update_one({"_id": name}, {"$set": {"seq": 0}}, upsert=True)
+    # Celah seq tidak ditunggu: semua event yang ada dianggap final
+    return run_projection(name, batch_size, now=float("inf"))
+
+
+def projection_status():
+    last = get_wo_event_collection().find_one({}, {"seq": 1}, sort=[("seq", -1)])
+    last_seq = last["seq"] if last else 0
+    return [{"name": name, "checkpoint": get_checkpoint(name), "last_seq": last_seq,
+             "lag": last_seq - get_checkpoint(name)} for name in PROJECTIONS]
+
+
+# --- Read model ---
+
+def _hours_avg(total_seconds, count):
+    return round(total_seconds / count / 3600, 2) if count else None
+
+
+def daily_kpis(day_from, day_to, catch_up=True):
+    """KPI harian (wo_kpi_daily) untuk hari lokal [day_from, day_to] ('YYYY-MM-DD').
+
+    catch_up: terapkan dulu event yang belum diproyeksikan, sehingga hasil
+    tetap terkini walau job berkala belum berjalan (aman paralel karena
+    update read model dijaga seq)."""
+    if catch_up:
+        run_projection(DailyKpiProjection.name)
+    days = []
+    for doc in get_wo_kpi_daily_collection().find({"_id": {"$gte": day_from, "$lte": day_to}}).sort("_id", ASCENDING):
+        days.append({
+            "day": doc["_id"],
+            "created": doc.get("created", 0),
+            "assigned": doc.get("assigned", 0),
+            "started": doc.get("started", 0),
+            "completed": doc.get("completed", 0),
+            "closed": doc.get("closed", 0),
+            "avg_response_hours": _hours_avg(doc.get("response_seconds", 0), doc.get("responses", 0)),
+            "avg_repair_hours": _hours_avg(doc.get("repair_seconds", 0), doc.get("repairs", 0))
+        })
+    return days
+
+
+def technician_workloads(catch_up=True):
+    """Beban kerja per teknisi dari proyeksi technician_workload."""
+    if catch_up:
+        run_projection(TechnicianWorkloadProjection.name)
+    return [{
+        "username": doc["_id"],
+        "assigned": doc.get("assigned", 0),
+        "in_progress": doc.get("in_progress", 0),
+        "awaiting_verification": doc.get("completed", 0),
+        "closed": doc.get("closed", 0),
+        "avg_repair_hours": _hours_avg(doc.get("repair_seconds", 0), doc.get("repairs", 0)),
+        "updated_at": doc.get("updated_at")
+    } for doc in get_technician_workload_collection().find({}).sort("_id", ASCENDING)]
+
+
+def backfill_events():
+    """Migrasi: buat event dari timestamp WO lama yang belum punya event sama sekali."""
+    known = set(get_wo_event_collection().distinct("wo_id"))
+    events = []
+    for wo in get_wo_collection().find({}, {"asset_name": 1, "type": 1, "requested_by": 1, "assigned_to": 1,
+                                            "verified_by": 1, "status": 1, "timestamp_created": 1, "timestamp_assigned": 1,
+                                            "timestamp_started": 1, "timestamp_completed": 1, "timestamp_verified": 1}):
+        if str(wo["_id"]) in known or not wo.get("timestamp_created"):
+            continue
+        created = wo["timestamp_created"]
+        technician = wo.get("assigned_to") or None
+        events.append(make_event(wo, EVENT_CREATED, wo.get("requested_by"), created, backfilled=True))
+        # Data lama: timestamp_started diisi saat penugasan, bukan saat mulai dikerjakan
+        assigned = wo.get("timestamp_assigned") or wo.get("timestamp_started")
+        if technician and assigned:
+            events.append(make_event(wo, EVENT_ASSIGNED, None, assigned, technician=technician,
+                                     created_at=created, backfilled=True))
+        if technician and (wo.get("timestamp_completed") or wo.get("status") == "Dalam Pengerjaan"):
+            events.append(make_event(wo, EVENT_STARTED, technician, assigned or created, technician=technician,
+                                     backfilled=True))
+        if technician and wo.get("timestamp_completed"):
+            events.append(make_event(wo, EVENT_COMPLETED, technician, wo["timestamp_completed"], technician=technician,
+                                     previous_status="Dalam Pengerjaan", created_at=created, started_at=assigned,
+                                     backfilled=True))
+        if technician and wo.get("timestamp_verified"):
+            events.append(make_event(wo, EVENT_VERIFIED, wo.get("verified_by"), wo["timestamp_verified"],
+                                     technician=technician, backfilled=True))
+    events.sort(key=lambda event: event["at"])
+    append_events(events)
+    return len(events)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Proyeksi event log work order")
+    parser.add_argument("--replay", choices=sorted(PROJECTIONS), action="append", default=[],
+                        help="Bangun ulang proyeksi dari awal log (boleh diulang)")
+    parser.add_argument("--backfill", action="store_true", help="Buat event dari WO lama sebelum menjalankan proyeksi")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    ensure_event_indexes()
+    if args.backfill:
+        print(f"{backfill_events()} event dibuat dari WO lama")
+    for name in PROJECTIONS:
+        if name in args.replay:
+            print(f"{name}: replay {replay_projection(name, args.batch_size)} event")
+        else:
+            print(f"{name}: {run_projection(name, args.batch_size)} event baru")
@@ -0,0 +1,241 @@
+# wo_search.py
+import argparse
+import re
+
+from pymongo import ASCENDING, TEXT, UpdateOne
+
+from models import get_wo_collection
+
+# Pencarian teks WO. Text index MongoDB tidak punya stemmer bahasa Indonesia,
+# jadi setiap WO menyimpan subdokumen `search` berisi kata dasar hasil
+# stemmer di bawah (per field, supaya bobot relevansi bisa dibedakan) dan
+# index teks dibuat dengan default_language "none". Query di-stem dengan
+# aturan yang sama, sehingga "pembersihan", "dibersihkan" dan "bersih"
+# cocok satu sama lain.
+SEARCH_FIELDS = ("asset_name", "component_failed", "root_cause", "description", "completion_notes")
+SEARCH_WEIGHTS = {"asset_name": 8, "component_failed": 6, "root_cause": 4, "description": 3, "completion_notes": 1}
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+MIN_STEM_LENGTH = 3
+
+STOPWORDS = {
+    "yang", "dan", "di", "ke", "dari", "untuk", "pada", "dengan", "ini", "itu", "ada", "tidak", "sudah",
+    "belum", "akan", "atau", "karena", "saat", "juga", "sehingga", "agar", "oleh", "dalam", "masih", "bisa",
+    "dapat", "harus", "perlu", "sangat", "lebih", "kurang", "sering", "terjadi", "setelah", "sebelum",
+    "ketika", "jika", "maka", "namun", "tetapi", "serta", "para", "pun", "lah", "nya", "the", "and", "of",
+    "data", "diisi", "terlalu"
+}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+PARTICLES = ("lah", "kah", "tah", "pun")
+POSSESSIVES = ("nya", "ku", "mu")
+# -i hanya dibuang pada konfiks per-i (diperbaiki, memperbaiki): tanpa kamus
+# terlalu banyak kata dasar berakhiran i (ganti, kunci, isi)
+DERIVATIONAL_SUFFIXES = ("kan", "an")
+# (awalan, pengganti fonem luluh, huruf berikutnya: True = vokal, False = konsonan, None = bebas)
+PREFIX_RULES = (
+    ("menge", "", None), ("penge", "", None),
+    ("meny", "s", True), ("peny", "s", True),
+    ("mem", "p", True), ("pem", "p", True),
+    ("meng", "k", True), ("peng", "k", True),
+    ("meng", "", None), ("peng", "", None),
+    ("men", "t", True), ("pen", "t", True),
+    ("mem", "", None), ("pem", "", None), ("men", "", None), ("pen", "", None),
+    ("ber", "", None), ("ter", "", None), ("per", "", False),
+    ("me", "", None), ("pe", "", None), ("di", "", None),
+)
+# Awalan kedua yang boleh menyusul bila ada akhiran (memperbaiki, dipertahankan);
+# tanpa akhiran (diperiksa) sisanya dianggap kata dasar
+SECOND_PREFIXES = ("per", "ber", "ter")
+# meng-/peng- + vokal: tanpa kamus k yang luluh selalu dikembalikan
+# (pengeringan -> kering); kata dasar berawalan vokal yang umum di WO
+# dikecualikan agar tidak menjadi "kukur", "kisi"
+VOWEL_ROOTS = {
+    "alir", "ambil", "amat", "amati", "angkat", "angkut", "atur", "awas", "ikat", "instal", "isi",
+    "olah", "oles", "operasi", "ukur", "ulang", "uji", "ubah", "urai"
+}
+# Kata dasar yang bentuknya mirip berimbuhan: berawalan di- (dingin, diesel)
+# atau berakhiran -kan/-an/-i (tekan, gerak + -an, lumas + -i). Dicek lebih
+# dulu, langsung atau setelah satu awalan / akhiran dibuang.
+KNOWN_ROOTS = VOWEL_ROOTS | {
+    "diameter", "diagram", "didih", "diesel", "digital", "dimensi", "dinamo", "dinding", "dingin", "distribusi",
+    "balik", "gerak", "ikan", "letak", "lumas", "makan", "masak", "tarik", "tekan"
+}
+# Pasangan (kata dasar, bentuk berimbuhan) yang harus jatuh ke stem yang sama;
+# diperiksa dengan `python wo_search.py --check-stemmer` setiap aturan diubah
+STEM_EXAMPLES = (
+    ("periksa", "diperiksa"), ("periksa", "memeriksa"), ("periksa", "pemeriksaan"),
+    ("kering", "pengeringan"), ("kering", "mengeringkan"), ("kering", "dikeringkan"),
+    ("kencang", "pengencangan"), ("kencang", "mengencangkan"), ("kencang", "dikencangkan"),
+    ("kunci", "mengunci"), ("kunci", "penguncian"), ("kirim", "pengiriman"), ("keluar", "mengeluarkan"),
+    ("rusak", "kerusakan"), ("rusak", "merusak"), ("bocor", "kebocoran"), ("bocor", "bocornya"),
+    ("baik", "perbaikan"), ("baik", "memperbaiki"), ("baik", "diperbaiki"), ("baik", "perbaiki"),
+    ("ganti", "penggantian"), ("ganti", "mengganti"), ("ganti", "digantikan"),
+    ("bersih", "pembersihan"), ("bersih", "membersihkan"), ("bersih", "dibersihkan"),
+    ("pasang", "pemasangan"), ("pasang", "memasang"), ("sambung", "penyambungan"), ("sambung", "menyambung"),
+    ("tukar", "penukaran"), ("putar", "perputaran"), ("putar", "berputar"), ("getar", "bergetar"),
+    ("tahan", "dipertahankan"), ("rawat", "perawatan"), ("rawat", "merawat"), ("panas", "pemanasan"),
+    ("cek", "pengecekan"), ("cek", "mengecek"), ("las", "pengelasan"), ("kalibrasi", "mengkalibrasi"),
+    ("isi", "pengisian"), ("isi", "mengisi"), ("isi", "diisi"), ("ukur", "pengukuran"), ("ukur", "mengukur"),
+    ("atur", "pengaturan"), ("uji", "pengujian"), ("olah", "pengolahan"), ("pompa", "memompa"),
+    ("periode", "periode"), ("perlu", "diperlukan"),
+    ("tekan", "ditekan"), ("tekan", "menekan"), ("tekan", "tekanan"), ("gerak", "gerakan"), ("tarik", "tarikan"),
+    ("dingin", "pendingin"), ("dingin", "didinginkan"), ("dingin", "mendinginkan"), ("didih", "mendidih"),
+    ("diesel", "dieselnya"), ("dinamo", "dinamonya"), ("digital", "digital"),
+    ("lumas", "melumasi"), ("lumas", "dilumasi"), ("lumas", "pelumasan"), ("lumas", "pelumas"),
+)
+
+
+def _strip_prefix(word, confix_an, allowed=None):
+    """Buang satu awalan derivasional (dengan peluluhan me-/pe-) bila sisanya cukup panjang.
+
+    Mengembalikan (kata, fonem_luluh_dikembalikan)."""
+    if allowed is None and confix_an and word.startswith("ke") and len(word) - 2 > MIN_STEM_LENGTH:
+        return word[2:], False  # konfiks ke-an: kerusakan, kebocoran
+    for prefix, replacement, before_vowel in PREFIX_RULES:
+        if not word.startswith(prefix) or (allowed is not None and prefix not in allowed):
+            continue
+        rest = word[len(prefix):]
+        if before_vowel is not None and (rest[:1] in tuple("aiueo")) != before_vowel:
+            continue
+        if replacement == "k" and rest in VOWEL_ROOTS:
+            return rest, False
+        candidate = replacement + rest
+        if prefix in ("menge", "penge"):
+            # hanya untuk kata dasar satu suku (cek, bor, las)
+            if len(candidate) == MIN_STEM_LENGTH:
+                return candidate, False
+        elif len(candidate) >= (MIN_STEM_LENGTH if prefix == "di" else MIN_STEM_LENGTH + 1):
+            return candidate, bool(replacement)
+    return word, False
+
+
+def _known_root(word):
+    """Kata dasar di KNOWN_ROOTS: kata itu sendiri atau setelah satu awalan dibuang."""
+    if word in KNOWN_ROOTS:
+        return word
+    stripped = _strip_prefix(word, False)[0]
+    return stripped if stripped in KNOWN_ROOTS else None
+
+
+def stem(word):
+    """Stemmer Indonesia ringan (urutan aturan Nazief-Adriani, kamus kecil KNOWN_ROOTS).
+
+    Tidak selalu menghasilkan kata dasar baku, tetapi konsisten: bentuk
+    berimbuhan umum (di-/me-/pe-/ber-/ter-, -kan/-an, ke-an) jatuh ke stem
+    yang sama dengan kata dasarnya, dan query memakai stemmer yang sama."""
+    if len(word) <= MIN_STEM_LENGTH + 1 or not word.isalpha():
+        return word
+    for particle in PARTICLES:
+        if word.endswith(particle) and len(word) - len(particle) > MIN_STEM_LENGTH:
+            word = word[:-len(particle)]
+            break
+    for possessive in POSSESSIVES:
+        if word.endswith(possessive) and len(word) - len(possessive) > MIN_STEM_LENGTH:
+            word = word[:-len(possessive)]
+            break
+    for candidate in (word,) + tuple(word[:-len(suffix)] for suffix in DERIVATIONAL_SUFFIXES + ("i",)
+                                     if word.endswith(suffix)):
+        known = _known_root(candidate)
+        if known:
+            return known
+    # Kata benda ke-/pe-/per- ... -an: buang -an saja (kerusakan -> rusak, perbaikan -> baik)
+    if word.startswith(("ke", "pe")) and word.endswith("an") and (not word.startswith("per") or word[-4:-3] in "aiueo"):
+        # per-an: -kan didahului vokal berarti kata dasarnya berakhiran k (perbaikan -> baik)
+        suffixes = ("an",)
+    elif word.startswith(("diper", "memper", "per")):
+        suffixes = DERIVATIONAL_SUFFIXES + ("i",)
+    else:
+        suffixes = DERIVATIONAL_SUFFIXES
+    confix_an = suffixed = False
+    for suffix in suffixes:
+        if word.endswith(suffix) and len(word) - len(suffix) > MIN_STEM_LENGTH:
+            word = word[:-len(suffix)]
+            confix_an, suffixed = suffix == "an", True
+            break
+    # per- tanpa akhiran hampir selalu bagian kata dasar (periksa, periode, perlu)
+    if not suffixed and word.startswith("per"):
+        return word
+    stripped, recoded = _strip_prefix(word, confix_an)
+    # Kata dasar hasil peluluhan (pemeriksaan -> periksa) tidak dipotong lagi
+    if stripped != word and suffixed and not recoded:
+        stripped = _strip_prefix(stripped, False, allowed=SECOND_PREFIXES)[0]
+    return stripped
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN_PATTERN.findall(str(text or "").lower())
+            if token not in STOPWORDS and len(token) > 1]
+
+
+def search_document(wo):
+    """Subdokumen `search` (kata dasar per field) untuk disimpan di WO."""
+    return {field: " ".join(dict.fromkeys(tokenize(wo.get(field)))) for field in SEARCH_FIELDS}
+
+
+def ensure_search_index():
+    collection = get_wo_collection()
+    collection.create_index(
+        [(f"search.{field}", TEXT) for field in SEARCH_FIELDS],
+        weights={f"search.{field}": weight for field, weight in SEARCH_WEIGHTS.items()},
+        default_language="none", language_override="search_language", name="wo_search"
+    )
+    collection.create_index([("status", ASCENDING), ("timestamp_created", ASCENDING)], name="status_created")
+
+
+def backfill_search(batch_size=1000, rebuild=False):
+    """Migrasi: isi `search` untuk WO lama (atau semua WO bila rebuild=True)."""
+    collection = get_wo_collection()
+    query = {} if rebuild else {"search": {"$exists": False}}
+    projection = {field: 1 for field in SEARCH_FIELDS}
+    operations, updated = [], 0
+    for wo in collection.find(query, projection):
+        operations.append(UpdateOne({"_id": wo['_id']}, {"$set": {"search": search_document(wo)}}))
+        if len(operations) >= batch_size:
+            updated += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        updated += collection.bulk_write(operations, ordered=False).modified_count
+    return updated
+
+
+def search_work_orders(text, filters=None, page=1, limit=DEFAULT_PAGE_SIZE):
+    """Cari WO berdasarkan relevansi (textScore berbobot), lalu terbaru dulu.
+
+    Mengembalikan (hasil, has_more); tanpa count total agar tetap cepat."""
+    terms = list(dict.fromkeys(tokenize(text)))
+    if not terms:
+        return [], False
+    query = dict(filters or {})
+    query["$text"] = {"$search": " ".join(terms)}
+    projection = {"search": 0, "score": {"$meta": "textScore"}}
+    cursor = (get_wo_collection().find(query, projection)
+              .sort([("score", {"$meta": "textScore"}), ("timestamp_created", -1)])
+              .skip((page - 1) * limit)
+              .limit(limit + 1))
+    results = list(cursor)
+    return results[:limit], len(results) > limit
+
+
+def check_stemmer(examples=STEM_EXAMPLES):
+    """Contoh yang kata dasar atau bentuk berimbuhannya tidak di-stem ke kata
+    dasar itu: [(kata dasar, bentuk, stem dasar, stem bentuk)]."""
+    return [(root, form, stem(root), stem(form)) for root, form in examples if not stem(root) == stem(form) == root]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Index pencarian teks work order")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--rebuild", action="store_true", help="Hitung ulang `search` untuk semua WO (mis. setelah stemmer berubah)")
+    parser.add_argument("--check-stemmer", action="store_true", help="Hanya periksa tabel STEM_EXAMPLES, tanpa database")
+    args = parser.parse_args()
+
+    if args.check_stemmer:
+        mismatches = check_stemmer()
+        for root, form, root_stem, form_stem in mismatches:
+            print(f"{root} -> {root_stem}, {form} -> {form_stem}, diharapkan {root}")
+        print(f"{len(STEM_EXAMPLES) - len(mismatches)}/{len(STEM_EXAMPLES)} contoh cocok")
+        raise SystemExit(1 if mismatches else 0)
+
+    ensure_search_index()
+    print(f"{backfill_search(args.batch_size, args.rebuild)} WO diperbarui")